@@ -0,0 +1,9 @@
+"""
+Benchmarks for clean-data.py
+============================
+
+generate_dump.py writes synthetic dump_events.json files shaped like the
+events logged by src/utils/eventTracker.js, so benchmarks never need real
+student data. run_benchmarks.py times each stage of GameDataCleaner on
+those dumps and writes the results as JSON for comparison across commits.
+"""
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Synthetic Event Dump Generator
+==============================
+
+Writes a dump_events.json in the format produced by dump.js: a JSON array
+(indented by 2) of Firestore event documents with _path/_id plus the fields
+eventTracker.logEvent adds to every event (session and student IDs, times,
+semester time, game context, condition flags, gameConfig) and the
+event-specific data of task_attempt, task_complete, page_switch,
+ai_task_help, ai_help_response and a few other event types.
+
+Sessions are simulated one task at a time: switch to a task page, maybe ask
+the AI for help, attempt the task and complete it. Documents are shuffled
+within blocks of sessions, like Firestore's random document IDs, while the
+whole dump is written incrementally so multi-million-event files do not
+need to fit in memory.
+
+Usage:
+    python benchmarks/generate_dump.py --sessions 500 --events-per-session 200 -o data/dump_events.json
+"""
+
+import argparse
+import json
+import random
+import string
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List
+
+# Sections and their share of sessions; 01A has no AI, 02A has AI
+SECTIONS = (
+    ('01A-Checkpoint', 23), ('01A-No Checkpoint', 23),
+    ('02A-Checkpoint', 23), ('02A-No Checkpoint', 23),
+    ('ADMIN', 4), ('ADMIN-TEST', 4)
+)
+
+# Task ID prefixes (g1 counting, g2 slider, g3 typing) and task numbers
+TASK_GAMES = ('g1', 'g2', 'g3')
+MAX_TASK_NUMBER = 40
+
+# Filler events between tasks, with relative weights
+OTHER_EVENT_TYPES = (('user_action', 5), ('task_switch', 3), ('jar_refill', 2), ('tab_switch', 1))
+
+# Share of sessions whose student never logs in (no studentId on any event)
+ANONYMOUS_SESSION_RATE = 0.05
+
+# Share of a session's tasks played in practice mode (empty currentSemester)
+PRACTICE_SHARE = 0.1
+
+FIRESTORE_ID_CHARS = string.ascii_letters + string.digits
+SESSION_ID_CHARS = string.ascii_lowercase + string.digits
+
+# First session start (2025-08-27T00:00:00Z) and spread of start times
+START_EPOCH_MS = 1756252800000
+START_SPREAD_MS = 14 * 24 * 3600 * 1000
+
+
+def weighted_choice(rng: random.Random, options):
+    """Pick a value from (value, weight) pairs."""
+    values, weights = zip(*options)
+    return rng.choices(values, weights)[0]
+
+
+class SessionSimulator:
+    """Generates the events of one simulated game session in time order."""
+
+    def __init__(self, rng: random.Random, number: int, events_per_session: int):
+        self.rng = rng
+        self.events_per_session = events_per_session
+        self.start_ms = START_EPOCH_MS + rng.randrange(START_SPREAD_MS)
+        self.session_id = f"session_{self.start_ms}_{''.join(rng.choices(SESSION_ID_CHARS, k=9))}"
+        self.section = weighted_choice(rng, SECTIONS)
+        self.has_ai = self.section.startswith('02A') or self.section.startswith('ADMIN')
+        self.has_checkpoint = self.section.endswith('-Checkpoint')
+        if self.section.startswith('ADMIN'):
+            student_id = f"ADMIN-TEST{number % 10 + 1}"
+        else:
+            student_id = f"30{number:08d}"
+        self.student_id = None if rng.random() < ANONYMOUS_SESSION_RATE else student_id
+
+        self.elapsed = 0.0
+        self.semester_start = 0.0
+        self.semester = ''
+        self.current_task = ''
+        self.completed_tasks = 0
+        self.switches = 0
+        self.ai_usage = 0
+        self.student_learning = 0.0
+        self.events: List[Dict] = []
+
+    def run(self) -> List[Dict]:
+        practice_events = int(self.events_per_session * PRACTICE_SHARE)
+        while len(self.events) < self.events_per_session:
+            if len(self.events) >= practice_events and self.semester == '':
+                self.start_semester(1)
+            elif self.semester == 1 and len(self.events) >= (practice_events + self.events_per_session) // 2:
+                self.start_semester(2)
+            self.play_task()
+            if self.rng.random() < 0.3:
+                self.log(weighted_choice(self.rng, OTHER_EVENT_TYPES), {'action': 'click'})
+        return self.events[:self.events_per_session]
+
+    def start_semester(self, semester: int):
+        self.semester = semester
+        self.semester_start = self.elapsed
+        self.log('semester_start', {'semester': semester})
+
+    def play_task(self):
+        rng = self.rng
+        game = rng.choice(TASK_GAMES)
+        task_id = f"{game}t{rng.randint(1, MAX_TASK_NUMBER)}"
+        self.log('page_switch', {'from': self.current_task or 'menu', 'to': task_id, 'isAutoAdvance': rng.random() < 0.5})
+        self.current_task = task_id
+        self.switches += 1
+
+        correct_answer = rng.randrange(1, 100)
+        suggestion = None
+        if self.has_ai and rng.random() < 0.4:
+            suggestion = correct_answer + rng.choice((0, 0, 0, 1, -1))
+            self.ai_usage += 1
+            help_data = {'taskId': task_id, 'taskType': game, 'suggestion': suggestion,
+                         'wasCorrect': suggestion == correct_answer, 'attemptNumber': self.ai_usage}
+            if game == 'g1':
+                # Counting suggestions end up spread into one key per digit
+                help_data.update({str(i): digit for i, digit in enumerate(str(suggestion))})
+            else:
+                help_data['response'] = f"Try {suggestion}"
+            self.log('ai_task_help', help_data)
+            if rng.random() < 0.8:
+                self.log('ai_help_response', {
+                    'taskId': task_id, 'helpType': game, 'suggestion': suggestion,
+                    'playerAction': rng.choice(('accepted', 'modified', 'ignored')),
+                    'playerValue': suggestion, 'timeBetween': rng.randrange(500, 20000),
+                    'response': f"Try {suggestion}"
+                })
+
+        attempts = rng.choice((1, 1, 1, 2, 3))
+        user_answer = correct_answer
+        for attempt in range(1, attempts + 1):
+            user_answer = correct_answer + rng.choice((0, 0, 1, -1, 3))
+            self.log('task_attempt', {
+                'taskId': task_id, 'attempts': attempt, 'passed': True,
+                'timeTaken': rng.randrange(2000, 60000), 'playerSubmission': user_answer,
+                'goal': correct_answer, 'aiSubmission': suggestion
+            })
+
+        difference = abs(user_answer - correct_answer)
+        points = 2 if difference == 0 else 1 if difference <= 1 else 0
+        self.completed_tasks += 1
+        self.student_learning += points * 5
+        self.log('task_complete', {
+            'taskId': task_id, 'attempts': attempts, 'totalTime': rng.randrange(2000, 90000),
+            'accuracy': 100 if points == 2 else 70 if points == 1 else 0,
+            'goal': correct_answer, 'playerSubmission': user_answer, 'aiSubmission': suggestion,
+            'userAnswer': user_answer, 'correctAnswer': correct_answer, 'pointsEarned': points,
+            'categoryPoints': {'materials': self.completed_tasks, 'research': 0, 'engagement': 0, 'bonus': 0},
+            'studentLearningScore': self.student_learning, 'totalScore': int(self.student_learning),
+            'completionContext': {'totalTasksCompleted': self.completed_tasks, 'switchesBeforeCompletion': self.switches}
+        })
+
+    def log(self, event_type: str, data: Dict):
+        """Build an event the way eventTracker.logEvent does."""
+        self.elapsed += self.rng.randrange(5, 300) / 10
+        client_timestamp = self.start_ms + int(self.elapsed * 1000)
+        minutes, seconds = divmod(int(self.elapsed), 60)
+        semester_elapsed = self.elapsed - self.semester_start
+        semester_minutes, semester_seconds = divmod(int(semester_elapsed), 60)
+        doc_id = ''.join(self.rng.choices(FIRESTORE_ID_CHARS, k=20))
+
+        event = {
+            '_path': f"events/{doc_id}",
+            '_id': doc_id,
+            'sessionId': self.session_id,
+            'studentId': self.student_id,
+            'username': self.student_id,
+            'studentIdentifier': self.student_id,
+            'type': event_type,
+            'timestamp': datetime.fromtimestamp(client_timestamp / 1000, timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'clientTimestamp': client_timestamp,
+            'timeElapsedSeconds': round(self.elapsed, 1),
+            'readableTime': f"{minutes}:{seconds:02d}",
+            'semesterTime': {
+                'elapsedSeconds': round(semester_elapsed, 1),
+                'readable': f"{semester_minutes}:{semester_seconds:02d}",
+                'minutes': semester_minutes,
+                'seconds': semester_seconds
+            },
+            'currentTask': self.current_task,
+            'gameMode': 'knapsack',
+            'currentSemester': self.semester,
+            'totalSemesters': 2,
+            'practiceCompleted': self.semester != '',
+            'completedTasks': self.completed_tasks,
+            'completedLevels': self.completed_tasks,
+            'totalSwitches': self.switches,
+            'aiUsageCount': self.ai_usage,
+            'studentLearning': self.student_learning,
+            'totalBonus': 0,
+            'finalScore': round(self.student_learning),
+            'semester': self.semester,
+            'isAdminMode': self.section == 'ADMIN',
+            'hasCheckpoint': self.has_checkpoint,
+            'hasAI': self.has_ai,
+            'section': self.section,
+            'gameConfig': {
+                'semesterDuration': 720000,
+                'totalTasks': 10,
+                'totalSemesters': 2,
+                'midtermEnabled': self.has_checkpoint,
+                'aiCost': 0,
+                'wrongAnswerPenalty': 0,
+                'switchCost': 0,
+                'jarRefillFreezeTime': 0,
+                'unfinishedJarPenalty': 0,
+                'unfinishedTaskPenalty': 0,
+                'aiDelay': 0,
+                'taskOrderStrategy': 'sequential_task',
+                'difficultyMode': 'fixed',
+                'gameMode': 'knapsack',
+                'scoring': None
+            }
+        }
+
+        # Event-specific data goes last; millisecond times become seconds
+        for field, value in data.items():
+            if field in ('timeTaken', 'totalTime', 'timeBetween') and value is not None:
+                event[f"{field}Seconds"] = f"{value / 1000:.1f}"
+            else:
+                event[field] = value
+        self.events.append(event)
+
+
+def generate_events(sessions: int, events_per_session: int, seed: int = 0,
+                    block_sessions: int = 100) -> Iterator[Dict]:
+    """Yield the events of a synthetic dump in Firestore (shuffled) order.
+
+    Args:
+        sessions: Number of game sessions
+        events_per_session: Events logged by each session
+        seed: Random seed; the same arguments always give the same dump
+        block_sessions: Sessions whose events are shuffled together
+    """
+    rng = random.Random(seed)
+    for block_start in range(0, sessions, block_sessions):
+        block = []
+        for number in range(block_start, min(block_start + block_sessions, sessions)):
+            block.extend(SessionSimulator(rng, number, events_per_session).run())
+        rng.shuffle(block)
+        yield from block
+
+
+def write_dump(output_file: str, sessions: int, events_per_session: int, seed: int = 0) -> int:
+    """Write a synthetic dump formatted like dump.js output. Returns the event count."""
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for event in generate_events(sessions, events_per_session, seed):
+            f.write(',\n  ' if count else '\n  ')
+            f.write(json.dumps(event, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dump_events.json")
+    parser.add_argument('--sessions', type=int, default=100, help="number of sessions (default 100)")
+    parser.add_argument('--events-per-session', type=int, default=200, help="events per session (default 200)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default 0)")
+    parser.add_argument('-o', '--output', default='dump_events.json', help="output file (default dump_events.json)")
+    args = parser.parse_args()
+
+    count = write_dump(args.output, args.sessions, args.events_per_session, args.seed)
+    print(f"Wrote {count} events from {args.sessions} sessions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark Harness for clean-data.py
+===================================
+
+Generates (or reuses) synthetic dumps of the requested sizes and times each
+GameDataCleaner stage on them:
+
+- load_data, with the cleaner's own nested stages (JSON parsing, session
+  mapping, AI help index, ...)
+- process_events, with the session event index build nested
+- save_cleaned_data
+- create_summary_statistics, and the distribution, dimension and episode
+  outputs when the cleaner writes them
+
+Stages are measured with clean-data.py's PipelineMetrics, the same code as
+--metrics-out. Cleaners from before --metrics-out are timed with this repo's
+PipelineMetrics, with their session mapping, AI help index and session
+event index builds wrapped as nested stages. Every (size, mode) pair runs in a fresh interpreter so peak RSS is not
+inherited from earlier runs. Per-stage wall time, CPU time and the peak RSS
+reached by the end of the stage are written to a JSON file together with the
+git commit, so results can be compared across commits. With --trace-memory,
+tracemalloc also reports each stage's own peak of Python allocations (this
+slows the run down considerably).
+
+Usage:
+    python benchmarks/run_benchmarks.py --events 10k,100k,1M --modes default,stream
+    python benchmarks/run_benchmarks.py --events 1M --modes cache-cold,cache-warm --output cache.json
+    python benchmarks/run_benchmarks.py --cleaner /tmp/old-clean-data.py --output old.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.generate_dump import write_dump  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLEANER_PATH = os.path.join(REPO_DIR, 'clean-data.py')
+DATA_DIR = os.path.join(REPO_DIR, 'benchmarks', 'data')
+
+# How each mode calls load_data
+MODES = {
+    'default': {},
+    'stream': {'streaming': True},
+    'cache-cold': {'use_cache': True},
+    'cache-warm': {'use_cache': True},
+}
+
+# Cleaner methods timed as nested stages when load_data/process_events call them
+NESTED_STAGES = ('build_session_student_mapping', 'build_ai_help_index', 'build_session_event_index')
+
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000 ** 2}
+
+MB = 1024 * 1024
+
+
+def parse_size(text: str) -> int:
+    """Parse an event count like 10000, 10k or 1M."""
+    text = text.strip().lower()
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def peak_rss_mb(who=None) -> Optional[float]:
+    """Peak resident set size of this process (or its children) so far."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss * scale / MB, 1)
+
+
+def load_cleaner(path: str = CLEANER_PATH, name: str = 'clean_data'):
+    """Import clean-data.py (not importable by name because of the hyphen)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so process pool workers can unpickle clean_data.clean_shard
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_method(metrics, obj, method: str):
+    """Time every call of obj.method as a stage named after the method."""
+    func = getattr(obj, method)
+
+    def timed(*args, **kwargs):
+        with metrics.stage(method):
+            return func(*args, **kwargs)
+    setattr(obj, method, timed)
+
+
+def run_one(cleaner_path: str, dump_file: str, mode: str, workers: int, trace_memory: bool) -> Dict:
+    """Run every stage once on a dump, in this process."""
+    cleaner_module = load_cleaner(cleaner_path)
+    # Cleaners from before --metrics-out are timed with this repo's PipelineMetrics
+    if not hasattr(cleaner_module, 'PipelineMetrics'):
+        metrics_module = load_cleaner(CLEANER_PATH, 'clean_data_metrics')
+    else:
+        metrics_module = cleaner_module
+    metrics = metrics_module.PipelineMetrics(True, trace_memory=trace_memory)
+
+    cleaner = cleaner_module.GameDataCleaner(dump_file)
+    if hasattr(cleaner, 'metrics'):
+        # The cleaner reports its own nested stages
+        cleaner.metrics = metrics
+    else:
+        for method in NESTED_STAGES:
+            if hasattr(cleaner, method):
+                time_method(metrics, cleaner, method)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        with metrics.stage('load_data'):
+            loaded = cleaner.load_data(**MODES[mode])
+        if not loaded:
+            raise RuntimeError(f"load_data failed for {dump_file}")
+        task_events = len(cleaner.events)
+        with metrics.stage('process_events'):
+            if workers > 1:
+                cleaner.process_events(workers=workers)
+            else:
+                cleaner.process_events()
+        with metrics.stage('save_cleaned_data'):
+            sorted_data = cleaner.save_cleaned_data(os.path.join(output_dir, 'cleaned_game_data.csv'))
+        with metrics.stage('create_summary_statistics'):
+            cleaner.create_summary_statistics(sorted_data or [], os.path.join(output_dir, 'game_data_summary.csv'))
+        if hasattr(cleaner, 'create_distribution_statistics'):
+            with metrics.stage('create_distribution_statistics'):
+                cleaner.create_distribution_statistics(sorted_data or [],
+                                                       os.path.join(output_dir, 'game_data_distributions.csv'))
+        if hasattr(cleaner, 'save_dimensions'):
+            with metrics.stage('save_dimensions'):
+                cleaner.save_dimensions(os.path.join(output_dir, 'game_data_sessions.csv'),
+                                        os.path.join(output_dir, 'game_data_tasks.csv'))
+        if hasattr(cleaner, 'save_task_episodes'):
+            with metrics.stage('save_task_episodes'):
+                cleaner.save_task_episodes(os.path.join(output_dir, 'game_data_episodes.csv'))
+
+    return {
+        'total_wall_seconds': round(time.perf_counter() - start, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_children_mb': peak_rss_mb(resource.RUSAGE_CHILDREN) if resource and workers > 1 else None,
+        'task_events': task_events,
+        'cleaned_records': len(cleaner.cleaned_data),
+        'sessions_mapped': len(cleaner.session_to_student_map),
+        'ai_help_keys': len(cleaner.ai_help_index),
+        'stages': metrics.stages,
+    }
+
+
+def run_in_subprocess(cleaner_path: str, dump_file: str, mode: str, workers: int, trace_memory: bool) -> Dict:
+    """Run one benchmark in a fresh interpreter and return its result."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_file = f.name
+    try:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', dump_file, '--result', result_file,
+                   '--cleaner', cleaner_path, '--modes', mode, '--workers', str(workers)]
+        if trace_memory:
+            command.append('--trace-memory')
+        subprocess.run(command, check=True)
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def git_commit(path: str) -> Optional[str]:
+    """Commit the benchmarked script belongs to, with '-dirty' if it has local changes."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--', os.path.abspath(path)], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if status else '')
+
+
+def ensure_dump(data_dir: str, sessions: int, events_per_session: int, seed: int) -> str:
+    """Path of the synthetic dump for these parameters, generating it if needed."""
+    dump_file = os.path.join(data_dir, f"dump_{sessions}x{events_per_session}_seed{seed}.json")
+    if not os.path.exists(dump_file):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {dump_file}...")
+        temp_file = dump_file + '.tmp'
+        write_dump(temp_file, sessions, events_per_session, seed)
+        os.replace(temp_file, dump_file)
+    return dump_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean-data.py stages on synthetic dumps")
+    parser.add_argument('--events', default='10k,100k',
+                        help="comma-separated dump sizes in events, e.g. 10k,100k,1M,10M (default 10k,100k)")
+    parser.add_argument('--events-per-session', type=int, default=200, help="events per session (default 200)")
+    parser.add_argument('--seed', type=int, default=0, help="generator seed (default 0)")
+    parser.add_argument('--modes', default='default',
+                        help=f"comma-separated load modes: {', '.join(MODES)} (default default)")
+    parser.add_argument('--workers', type=int, default=1, help="process_events workers (default 1)")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per size and mode (default 1)")
+    parser.add_argument('--trace-memory', action='store_true', help="also report tracemalloc peaks per stage")
+    parser.add_argument('--cleaner', default=CLEANER_PATH, help="clean-data.py to benchmark (default this repo's)")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where synthetic dumps are kept (default benchmarks/data)")
+    parser.add_argument('--output', default='benchmark_results.json', help="results file (default benchmark_results.json)")
+    parser.add_argument('--run-one', metavar='DUMP', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    if args.run_one:
+        result = run_one(args.cleaner, args.run_one, modes[0], args.workers, args.trace_memory)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    cleaner_path = os.path.abspath(args.cleaner)
+    report = {
+        'cleaner': cleaner_path,
+        'commit': git_commit(cleaner_path),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'events_per_session': args.events_per_session, 'seed': args.seed,
+                   'workers': args.workers, 'trace_memory': args.trace_memory},
+        'runs': [],
+    }
+
+    for size in args.events.split(','):
+        sessions = max(1, parse_size(size) // args.events_per_session)
+        dump_file = ensure_dump(args.data_dir, sessions, args.events_per_session, args.seed)
+        cache_file = dump_file + '.cache'
+
+        for mode in modes:
+            for repeat in range(args.repeat):
+                if mode == 'cache-cold' and os.path.exists(cache_file):
+                    os.remove(cache_file)
+                elif mode == 'cache-warm' and not os.path.exists(cache_file):
+                    run_in_subprocess(cleaner_path, dump_file, 'cache-cold', 1, False)
+
+                print(f"Running {sessions * args.events_per_session} events, mode {mode}, run {repeat + 1}...")
+                result = run_in_subprocess(cleaner_path, dump_file, mode, args.workers, args.trace_memory)
+                report['runs'].append(dict({
+                    'events': sessions * args.events_per_session,
+                    'sessions': sessions,
+                    'mode': mode,
+                    'repeat': repeat,
+                    'dump_bytes': os.path.getsize(dump_file),
+                }, **result))
+
+                for stage in result['stages']:
+                    indent = '    ' if stage['parent'] else '  '
+                    print(f"{indent}{stage['name']:<32} {stage['wall_seconds']:>9.3f}s"
+                          f"  peak RSS {stage['peak_rss_mb']} MB")
+                print(f"  {'total':<32} {result['total_wall_seconds']:>9.3f}s")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved benchmark results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
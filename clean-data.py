@@ -23,19 +23,2128 @@ Key Features Extracted:
 
 import json
 import csv
+import glob
+import gzip
+import hashlib
+import math
+import mmap
+import os
+import pickle
 import re
-from datetime import datetime
+import stat
+import sys
+import heapq
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import islice
 from typing import Dict, List, Optional, Tuple
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from urllib.parse import parse_qs, unquote, urlsplit
+from operator import attrgetter, itemgetter
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+# Event types that end the time window of a task attempt
+TIME_BOUNDARY_EVENT_TYPES = ('task_attempt', 'task_complete', 'page_switch')
+
+# Event types kept in the AI help index
+AI_HELP_EVENT_TYPES = ('ai_task_help', 'ai_help_response')
+
+# Event types that interrupt a task episode: task queue, tab and jar refill switches
+SWITCH_EVENT_TYPES = ('task_switch', 'tab_switch', 'manual_tab_switch', 'jar_refill')
+
+# Event types checked for copies written twice by eventTracker's retry paths
+DEDUP_EVENT_TYPES = TIME_BOUNDARY_EVENT_TYPES + AI_HELP_EVENT_TYPES
+
+# Fields the cleaning pipeline reads; streaming mode drops everything else
+# (gameConfig, semesterTime, game context, ...) as soon as an event is parsed
+PIPELINE_FIELDS = (
+    'sessionId', 'studentId', 'type', 'taskId', 'currentTask', 'currentSemester',
+    'timeElapsedSeconds', 'timestamp', 'readableTime', 'section', 'hasAI',
+    'hasCheckpoint', 'userAnswer', 'correctAnswer', 'pointsEarned', 'points',
+    'studentLearning', 'attempts', 'accuracy'
+)
+
+# Task event fields with few distinct values, interned so events share them
+INTERNED_FIELDS = ('sessionId', 'studentId', 'type', 'taskId', 'currentTask', 'section')
+PIPELINE_FIELD_SET = frozenset(PIPELINE_FIELDS)
+
+# Columns of the cleaned data CSV, in output order
+CLEANED_FIELDNAMES = (
+    'student_id', 'session_id', 'semester', 'task_number', 'task_type', 'task_level',
+    'task_id', 'student_response', 'correct_response', 'ai_help_used', 'ai_response',
+    'time_spent_seconds', 'time_spent_minutes', 'condition', 'points_received',
+    'current_student_learning_goal', 'is_practice_mode', 'event_type', 'timestamp',
+    'time_elapsed_readable', 'attempts', 'accuracy'
+)
+# For key checks on every field read of a record; a tuple scan is several times slower
+CLEANED_FIELD_SET = frozenset(CLEANED_FIELDNAMES)
+
+# Task IDs: game g1 (counting), g2 (slider) or g3 (typing), then the task number
+TASK_ID_PATTERN = re.compile(r'g([123])t(\d+)')
+
+# Columns of the session and task dimension CSVs, joinable with the cleaned
+# data on session_id and task_id
+SESSION_DIMENSION_FIELDNAMES = (
+    'session_id', 'student_id', 'condition', 'section', 'is_admin',
+    'practice_start_seconds', 'practice_end_seconds'
+)
+TASK_DIMENSION_FIELDNAMES = ('task_id', 'task_type', 'task_level', 'task_number')
+
+# Columns of the task episode CSV: one row per run of a session's task
+# attempts on the same task, up to and including its completion
+EPISODE_FIELDNAMES = (
+    'student_id', 'session_id', 'episode', 'task_id', 'task_type', 'task_level',
+    'condition', 'semester', 'is_practice_mode', 'attempt_events', 'completed',
+    'attempts', 'points_received', 'accuracy', 'correct', 'ai_help_used',
+    'interruptions', 'dwell_seconds', 'start_seconds', 'end_seconds',
+    'first_timestamp', 'last_timestamp'
+)
+
+# Conditions of admin sessions
+ADMIN_CONDITIONS = ('Admin', 'Admin_Test')
+
+# Fields the AI help index reads from an AI help event
+AI_HELP_FIELDS = ('type', 'timeElapsedSeconds', 'response') + tuple(str(i) for i in range(10))
+
+# Fields kept when input parts are decoded in worker processes: everything the
+# pipeline, the AI help index, incremental mode and deduplication read
+INPUT_FIELDS = tuple(dict.fromkeys(PIPELINE_FIELDS + AI_HELP_FIELDS + ('clientTimestamp', '_id', '_path')))
+
+# Input part file types; .jsonl parts hold one event per line
+INPUT_EXTENSIONS = ('.json', '.jsonl', '.json.gz', '.jsonl.gz')
+
+# Firestore pulls (--firestore): documents per runQuery page, page requests
+# in flight, time slices per request in flight, retries of a failed page
+# request, the delay before the first retry (doubling after each) and HTTP
+# statuses worth retrying
+FIRESTORE_PAGE_SIZE = 1000
+FIRESTORE_REQUESTS = 4
+FIRESTORE_SLICES_PER_REQUEST = 4
+FIRESTORE_RETRIES = 5
+FIRESTORE_RETRY_DELAY_SECONDS = 0.5
+FIRESTORE_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Default maximum distance (seconds) between a task attempt and an AI help event
+AI_HELP_WINDOW_SECONDS = 60
+
+# Format version of the incremental state file
+STATE_VERSION = 4
+
+# Incremental mode treats a session as finished once none of its events
+# arrived for this long (ms): its records become final and its mapping,
+# clock and AI help are dropped from the state
+SESSION_TIMEOUT_MS = 60 * 60 * 1000
+
+# Columns of the per-student summary CSV
+SUMMARY_FIELDNAMES = [
+    'student_id', 'condition', 'max_semester_reached',
+    'total_tasks_attempted', 'total_points_earned', 'total_time_minutes',
+    'ai_help_count', 'task_types_attempted', 'ai_help_rate', 'avg_time_per_task'
+]
+
+# Distribution statistics: record fields sketched per group, the grouping
+# record fields and the quantiles written to the distributions CSV
+DISTRIBUTION_METRICS = ('time_spent_seconds', 'points_received', 'attempts')
+DISTRIBUTION_KEY_FIELDS = ('condition', 'task_type', 'task_level', 'semester')
+DISTRIBUTION_QUANTILES = (0.5, 0.9, 0.99)
+DISTRIBUTION_FIELDNAMES = list(DISTRIBUTION_KEY_FIELDS) + [
+    'metric', 'count', 'mean', 'min', 'p50', 'p90', 'p99', 'max'
+]
+
+# Quantile sketch: relative error of a quantile, and buckets per sign before
+# the lowest ones are collapsed
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MAX_BUCKETS = 2048
+
+# Distinct values a quantile sketch counts exactly before switching to buckets
+SKETCH_EXACT_VALUES = 64
+
+# Record fields the query service (--serve) keeps inverted indexes on, and
+# the most records one /records response returns
+QUERY_INDEX_FIELDS = ('student_id', 'session_id', 'condition', 'semester', 'task_id')
+QUERY_MAX_LIMIT = 10000
+
+JSON_WHITESPACE = ' \t\n\r'
+
+# Event cache columns: interned codes, numbers, and everything else in a string heap
+CACHE_CODE_FIELDS = (
+    'sessionId', 'studentId', 'type', 'taskId', 'currentTask', 'section',
+    'currentSemester', 'hasAI', 'hasCheckpoint'
+)
+CACHE_NUMBER_FIELDS = ('timeElapsedSeconds', 'clientTimestamp')
+CACHE_HEAP_FIELDS = tuple(
+    field for field in dict.fromkeys(PIPELINE_FIELDS + AI_HELP_FIELDS)
+    if field not in CACHE_CODE_FIELDS and field not in CACHE_NUMBER_FIELDS
+)
+CACHE_MAGIC = b'GDCACHE1'
+CACHE_VERSION = 2
+
+# Code columns with postings (rows of each value), and the number column with
+# a sorted index, for pushing --section/--student/--since/--until down to the cache
+CACHE_POSTING_FIELDS = ('sessionId', 'section', 'studentId')
+CACHE_TIME_FIELD = 'clientTimestamp'
+
+# Number column tags; anything else is kept in the header as an exception
+NUMBER_MISSING, NUMBER_FLOAT, NUMBER_INT, NUMBER_NULL, NUMBER_OTHER = -1, 0, 1, 2, 3
+
+# Heap column tags
+HEAP_MISSING, HEAP_STRING, HEAP_JSON, HEAP_INT, HEAP_FLOAT = -1, 0, 1, 2, 3
+
+# Marks a key that is absent from an event
+MISSING = object()
+
+# Typed columnar output (--columnar): file magic, the cleaned data columns
+# stored dictionary-encoded and the zlib level of the column chunks
+TABLE_MAGIC = b'GDTABLE1'
+TABLE_DICTIONARY_FIELDS = ('condition', 'task_type', 'task_level', 'event_type')
+TABLE_COMPRESSION_LEVEL = 1
+
+# Format version of the --metrics-out report
+METRICS_VERSION = 1
+
+# Functions listed per cProfile'd stage in the metrics report
+PROFILE_TOP_FUNCTIONS = 25
+
+MB = 1024 * 1024
+
+# Records pickled together in an external sort run, and runs merged at once
+SORT_BATCH_SIZE = 4096
+SORT_MERGE_FAN_IN = 64
+
+
+def iter_json_array(f, chunk_size: int = 1 << 20):
+    """Yield the elements of a top-level JSON array one at a time.
+    
+    Reads the file in chunks and decodes each element with raw_decode, so
+    memory is bounded by the largest element rather than the file size.
+    Raises json.JSONDecodeError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+    expect_value = True
+    first = True
+    
+    while True:
+        # Skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in JSON_WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = f.read(chunk_size)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+        
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unexpected end of data", buf, pos)
+        
+        char = buf[pos]
+        if not started:
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buf, pos)
+            started = True
+            pos += 1
+            continue
+        
+        if char == ']' and (first or not expect_value):
+            return
+        
+        if not expect_value:
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            expect_value = True
+            pos += 1
+            continue
+        
+        # Decode the next element, reading more data if it is cut off
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                continue
+            # A number cut off by the chunk boundary ('2.' of '2.5') still
+            # decodes, so make sure a delimiter follows before accepting it
+            after = end
+            while after < len(buf) and buf[after] in JSON_WHITESPACE:
+                after += 1
+            truncated = after == len(buf) or (
+                buf[after] not in ',]' and isinstance(value, (int, float)))
+            if truncated and not eof:
+                chunk = f.read(chunk_size)
+                buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                continue
+            break
+        
+        yield value
+        pos = end
+        first = False
+        expect_value = False
+        
+        # Drop consumed input
+        if pos > chunk_size:
+            buf, pos = buf[pos:], 0
+
+
+def new_summary_stats() -> Dict:
+    """Empty per-(student, condition) accumulator for the summary statistics."""
+    return {
+        'student_id': '',
+        'condition': '',
+        'max_semester_reached': 0,
+        'total_tasks_attempted': 0,
+        'total_points_earned': 0,
+        'total_time_minutes': 0,
+        'ai_help_count': 0,
+        'task_types': set()
+    }
+
+
+def new_distribution_stats() -> Dict:
+    """Empty per-group accumulator for the distribution statistics: a sketch per metric."""
+    return {metric: QuantileSketch() for metric in DISTRIBUTION_METRICS}
+
+
+def distribution_value(value) -> Optional[float]:
+    """A record field as a finite number, or None if it is empty or not numeric."""
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (ValueError, TypeError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def record_sort_key(record: Dict):
+    """Output order of cleaned records: student_id, semester, then timestamp."""
+    return (
+        record['student_id'], 
+        int(record['semester']) if str(record['semester']).isdigit() else 0, 
+        record['timestamp']
+    )
+
+
+def csv_row(record: Dict) -> Tuple[str, ...]:
+    """Record values as the csv module writes them, for matching rows read back."""
+    return tuple('' if value is None else str(value) for value in record.values())
+
+
+def event_sort_key(event: Dict):
+    """Sort key used to put events in processing (time) order."""
+    return event.get('timeElapsedSeconds', 0)
+
+
+def session_shard(session_id: str, shards: int) -> int:
+    """Stable shard number for a session (unlike hash(), not salted per process)."""
+    return zlib.crc32(session_id.encode('utf-8')) % shards
+
+
+def project_event(event: Dict, fields: Tuple[str, ...] = PIPELINE_FIELDS) -> Dict:
+    """Keep only the given fields of an event, preserving which keys are present."""
+    return {field: event[field] for field in fields if field in event}
+
+
+def event_fingerprint(event) -> Optional[int]:
+    """64-bit hash of session, type, clientTimestamp, task and answer of an event.
+    
+    Copies of a logged event share all of these. Events without a
+    clientTimestamp cannot be told apart from their neighbours and get None.
+    Uses hash(), so fingerprints are only comparable within one process.
+    """
+    client_timestamp = event.get('clientTimestamp')
+    if client_timestamp is None:
+        return None
+    answer = event.get('userAnswer')
+    if isinstance(answer, (dict, list)):
+        answer = json.dumps(answer, sort_keys=True)
+    # The answer's type keeps 1, 1.0 and True apart
+    return hash((event.get('sessionId'), event.get('type'), client_timestamp,
+                 event.get('taskId', '') or event.get('currentTask', ''), answer, type(answer)))
+
+
+def parse_epoch_ms(text: str) -> int:
+    """Epoch milliseconds from a number of milliseconds or an ISO date/time (UTC unless given)."""
+    if text.isdigit():
+        return int(text)
+    moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def resolve_input_parts(path: str) -> List[str]:
+    """Input files for a path: the file itself, or a directory's or glob's INPUT_EXTENSIONS files, sorted."""
+    if os.path.isdir(path):
+        parts = [os.path.join(path, name) for name in os.listdir(path) if name.endswith(INPUT_EXTENSIONS)]
+    elif any(char in path for char in '*?['):
+        parts = [part for part in glob.glob(path) if part.endswith(INPUT_EXTENSIONS) and os.path.isfile(part)]
+    else:
+        return [path]
+    if not parts:
+        raise FileNotFoundError(path)
+    return sorted(parts)
+
+
+def iter_input_part(path: str):
+    """Events of one input part: a JSON array or JSON lines, optionally gzip-compressed."""
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rt', encoding='utf-8')
+    else:
+        f = open(path, 'r', encoding='utf-8')
+    with f:
+        if path.endswith(('.jsonl', '.jsonl.gz')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+def read_input_part(path: str) -> List[Dict]:
+    """Process pool worker: decode a whole input part, keeping INPUT_FIELDS."""
+    return [project_event(event, INPUT_FIELDS) for event in iter_input_part(path)]
+
+
+def firestore_value(value: Dict):
+    """Decode a Firestore REST API value the way dump.js's asPlain() exports it."""
+    if 'mapValue' in value:
+        return {key: firestore_value(item) for key, item in value['mapValue'].get('fields', {}).items()}
+    if 'arrayValue' in value:
+        return [firestore_value(item) for item in value['arrayValue'].get('values', [])]
+    if 'integerValue' in value:
+        return int(value['integerValue'])
+    if 'doubleValue' in value:
+        return float(value['doubleValue'])
+    if 'timestampValue' in value:
+        # Date.toISOString(): milliseconds and a Z
+        seconds, _, fraction = value['timestampValue'].rstrip('Z').partition('.')
+        return f"{seconds}.{(fraction + '000')[:3]}Z"
+    if 'geoPointValue' in value:
+        return dict(value['geoPointValue'])
+    for kind in ('stringValue', 'booleanValue', 'referenceValue', 'bytesValue'):
+        if kind in value:
+            return value[kind]
+    return None
+
+
+class FirestoreSource:
+    """Pulls a Firestore collection through the REST API, in clientTimestamp order.
+    
+    The collection is split into clientTimestamp slices that are paged
+    concurrently with cursors on (clientTimestamp, document name): an asyncio
+    loop in a background thread keeps up to `requests` page requests in
+    flight, in the slices just ahead of the one being read, and each slice
+    buffers at most two pages ahead of the reader. A failed page request is
+    retried from its cursor. Documents are yielded like dump.js rows (_path, _id, then the
+    fields), slice by slice, so events arrive in clientTimestamp order.
+    
+    Documents without a numeric clientTimestamp are not pulled: Firestore
+    leaves them out of queries ordered by it. FIRESTORE_EMULATOR_HOST points
+    the pull at the emulator (or any server speaking its API); otherwise
+    FIRESTORE_ACCESS_TOKEN must hold an OAuth token, e.g. from
+    `gcloud auth print-access-token`.
+    """
+    
+    def __init__(self, project: str, collection: str = 'events', since: Optional[int] = None,
+                 until: Optional[int] = None, page_size: int = FIRESTORE_PAGE_SIZE,
+                 requests: int = FIRESTORE_REQUESTS, collection_group: bool = False):
+        self.project = project
+        self.collection = collection
+        self.collection_group = collection_group  # Every collection named collection, like dump.js's COLLECTION_GROUP
+        self.since = since  # clientTimestamp bounds, since inclusive and until exclusive
+        self.until = until
+        self.page_size = page_size
+        self.requests = requests
+        emulator_host = os.environ.get('FIRESTORE_EMULATOR_HOST')
+        if emulator_host:
+            root = f"http://{emulator_host}"
+            self.token = 'owner'
+        else:
+            root = 'https://firestore.googleapis.com'
+            self.token = os.environ.get('FIRESTORE_ACCESS_TOKEN')
+        self.documents_path = f"projects/{project}/databases/(default)/documents"
+        self.url = f"{root}/v1/{self.documents_path}:runQuery"
+        self.pages = 0
+        self.documents = 0
+        self.retries = 0
+    
+    def describe(self) -> str:
+        return f"firestore:{self.project}/{self.collection}"
+    
+    def run_query(self, query: Dict) -> List[Dict]:
+        """POST a structured query, retrying transient failures; returns the raw documents."""
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+        
+        if self.token is None:
+            raise OSError("Set FIRESTORE_ACCESS_TOKEN (or FIRESTORE_EMULATOR_HOST) to pull from Firestore")
+        body = json.dumps({'structuredQuery': query}).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Authorization': f"Bearer {self.token}"}
+        for attempt in range(FIRESTORE_RETRIES + 1):
+            try:
+                with urlopen(Request(self.url, data=body, headers=headers), timeout=60) as response:
+                    return [result['document'] for result in json.load(response) if 'document' in result]
+            except HTTPError as e:
+                if e.code not in FIRESTORE_RETRY_STATUSES or attempt == FIRESTORE_RETRIES:
+                    raise OSError(f"Firestore query failed: HTTP {e.code} {e.read()[:500]!r}") from e
+            except (URLError, TimeoutError, ConnectionError) as e:
+                if attempt == FIRESTORE_RETRIES:
+                    raise OSError(f"Firestore query failed: {e}") from e
+            self.retries += 1
+            time.sleep(min(FIRESTORE_RETRY_DELAY_SECONDS * 2 ** attempt, 30))
+    
+    def query(self, lower: Optional[Tuple[str, int]], upper: Optional[Tuple[str, int]],
+              limit: int, cursor: Optional[List[Dict]] = None, descending: bool = False) -> Dict:
+        """Structured query for a clientTimestamp range, ordered by (clientTimestamp, name)."""
+        filters = [{'fieldFilter': {'field': {'fieldPath': CACHE_TIME_FIELD}, 'op': op,
+                                    'value': {'integerValue': str(bound)}}}
+                   for op, bound in (lower, upper) if op is not None]
+        direction = 'DESCENDING' if descending else 'ASCENDING'
+        query = {
+            'from': [{'collectionId': self.collection, 'allDescendants': self.collection_group}],
+            'orderBy': [{'field': {'fieldPath': CACHE_TIME_FIELD}, 'direction': direction},
+                        {'field': {'fieldPath': '__name__'}, 'direction': direction}],
+            'limit': limit
+        }
+        if filters:
+            # A range filter keeps documents whose clientTimestamp is not a number out of the pull
+            query['where'] = filters[0] if len(filters) == 1 else {
+                'compositeFilter': {'op': 'AND', 'filters': filters}}
+        if cursor is not None:
+            query['startAt'] = {'values': cursor, 'before': False}
+        return query
+    
+    def decode(self, document: Dict) -> Dict:
+        path = document['name'].split('/documents/', 1)[-1]
+        event = {'_path': path, '_id': path.rsplit('/', 1)[-1]}
+        for field, value in document.get('fields', {}).items():
+            event[field] = firestore_value(value)
+        return event
+    
+    def slices(self, after: Optional[float] = None) -> List[Tuple[int, int]]:
+        """Split the pull's clientTimestamp range into [lower, upper) slices of equal width."""
+        lower = ('GREATER_THAN_OR_EQUAL', self.since) if self.since is not None else (None, None)
+        if after is not None and (self.since is None or after >= self.since):
+            lower = ('GREATER_THAN', math.floor(after))
+        upper = ('LESS_THAN', self.until) if self.until is not None else (None, None)
+        if lower[0] is None and upper[0] is None:
+            # Order the whole collection by number: clientTimestamps are epoch milliseconds
+            lower = ('GREATER_THAN_OR_EQUAL', -2 ** 63)
+        
+        first = self.run_query(self.query(lower, upper, 1))
+        last = self.run_query(self.query(lower, upper, 1, descending=True))
+        if not first or not last:
+            return []
+        start = math.floor(firestore_value(first[0]['fields'][CACHE_TIME_FIELD]))
+        end = math.floor(firestore_value(last[0]['fields'][CACHE_TIME_FIELD])) + 1
+        count = max(1, min(self.requests * FIRESTORE_SLICES_PER_REQUEST, end - start))
+        bounds = [start + (end - start) * i // count for i in range(count)] + [end]
+        return list(zip(bounds, bounds[1:]))
+    
+    async def pull_slice(self, lower: int, upper: int, pages: 'asyncio.Queue', semaphore: 'asyncio.Semaphore'):
+        """Page through one slice into pages, ending with None (or the error that stopped it)."""
+        import asyncio
+        try:
+            cursor = None
+            while True:
+                query = self.query(('GREATER_THAN_OR_EQUAL', lower), ('LESS_THAN', upper), self.page_size, cursor)
+                async with semaphore:
+                    documents = await asyncio.to_thread(self.run_query, query)
+                    events = await asyncio.to_thread(lambda: [self.decode(document) for document in documents])
+                self.pages += 1
+                await pages.put(events)
+                if len(documents) < self.page_size:
+                    break
+                last = documents[-1]
+                cursor = [last['fields'][CACHE_TIME_FIELD], {'referenceValue': last['name']}]
+            await pages.put(None)
+        except Exception as e:
+            await pages.put(e)
+    
+    @staticmethod
+    async def cancel_pulls():
+        """Cancel the slice pulls still running when the reader stops early."""
+        import asyncio
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def iter_events(self, after: Optional[float] = None):
+        """Yield the collection's documents in clientTimestamp order, after the watermark if given."""
+        import asyncio  # Only pulls need it; importing it costs every other run ~60 ms
+        slices = self.slices(after)
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        semaphore = asyncio.Semaphore(self.requests)
+        started = deque()  # (pages queue, future) of the slices pulled ahead of the reader
+        
+        def start_slice(lower, upper):
+            async def create_queue():
+                return asyncio.Queue(maxsize=2)
+            pages = asyncio.run_coroutine_threadsafe(create_queue(), loop).result()
+            future = asyncio.run_coroutine_threadsafe(self.pull_slice(lower, upper, pages, semaphore), loop)
+            started.append((pages, future))
+        
+        try:
+            remaining = iter(slices)
+            for lower, upper in islice(remaining, self.requests):
+                start_slice(lower, upper)
+            while started:
+                pages, future = started.popleft()
+                while True:
+                    events = asyncio.run_coroutine_threadsafe(pages.get(), loop).result()
+                    if events is None:
+                        break
+                    if isinstance(events, Exception):
+                        raise events
+                    self.documents += len(events)
+                    yield from events
+                for lower, upper in islice(remaining, 1):
+                    start_slice(lower, upper)
+        finally:
+            if started:
+                asyncio.run_coroutine_threadsafe(self.cancel_pulls(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        print(f"Pulled {self.documents} documents in {self.pages} pages from {self.describe()}"
+              + (f" ({self.retries} retried requests)" if self.retries else ""))
+
+
+class EventCache:
+    """Memory-mapped columnar copy of the event fields the pipeline reads.
+    
+    File layout: magic, header length, JSON header (source fingerprint, row
+    count, column directory and code dictionaries), then 8-byte aligned column
+    blocks. Code columns are int32 indexes into a dictionary of interned values,
+    number columns are float64 values with an int8 type tag, and all other
+    fields are (offset, length, tag) references into a UTF-8 string heap.
+    A code or tag of -1 marks a key that is absent from the event. The
+    CACHE_POSTING_FIELDS also have postings (the rows of every code) and
+    clientTimestamp a sorted (value, row) index, so filters only touch the
+    rows they select.
+    """
+    
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.rows = 0
+        self.header = None
+        self.mm = None
+        self.readers = {}  # field -> function(row) returning the value or MISSING
+        self.code_columns = {}  # field -> (int32 codes, dictionary of values)
+        self.posting_columns = {}  # field -> (rows grouped by code, int64 start of each code)
+        self.time_index = None  # (sorted clientTimestamps, their rows)
+    
+    @staticmethod
+    def source_fingerprint(json_file: str, blocks: int = 64, block_size: int = 1 << 16) -> Dict:
+        """Size, mtime and a hash of evenly spaced blocks of the source file."""
+        stat = os.stat(json_file)
+        digest = hashlib.blake2b(digest_size=16)
+        with open(json_file, 'rb') as f:
+            if stat.st_size <= blocks * block_size:
+                digest.update(f.read())
+            else:
+                for i in range(blocks):
+                    f.seek((stat.st_size - block_size) * i // (blocks - 1))
+                    digest.update(f.read(block_size))
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+    
+    @classmethod
+    def sources_fingerprint(cls, sources: List[str]):
+        """Fingerprint of the input parts; a single file keeps the plain fingerprint."""
+        if len(sources) == 1:
+            return cls.source_fingerprint(sources[0])
+        return [dict(cls.source_fingerprint(source), file=os.path.basename(source)) for source in sources]
+    
+    def build(self, sources: List[str], events):
+        """Write the cache for the input parts from an iterable of their events."""
+        fingerprint = self.sources_fingerprint(sources)
+        
+        codes = {field: array('i') for field in CACHE_CODE_FIELDS}
+        interned = {field: {} for field in CACHE_CODE_FIELDS}  # JSON text -> code
+        dictionaries = {field: [] for field in CACHE_CODE_FIELDS}
+        numbers = {field: (array('d'), array('b')) for field in CACHE_NUMBER_FIELDS}
+        exceptions = {field: {} for field in CACHE_NUMBER_FIELDS}
+        heap = bytearray()
+        refs = {field: (array('q'), array('i'), array('b')) for field in CACHE_HEAP_FIELDS}
+        
+        rows = 0
+        for event in events:
+            for field in CACHE_CODE_FIELDS:
+                value = event.get(field, MISSING)
+                if value is MISSING:
+                    codes[field].append(-1)
+                    continue
+                # Key on JSON text so that True, 1 and 1.0 stay distinct
+                key = json.dumps(value, sort_keys=True)
+                code = interned[field].get(key)
+                if code is None:
+                    code = interned[field][key] = len(dictionaries[field])
+                    dictionaries[field].append(value)
+                codes[field].append(code)
+            
+            for field in CACHE_NUMBER_FIELDS:
+                values, tags = numbers[field]
+                value = event.get(field, MISSING)
+                if value is MISSING:
+                    values.append(0.0)
+                    tags.append(NUMBER_MISSING)
+                elif value is None:
+                    values.append(0.0)
+                    tags.append(NUMBER_NULL)
+                elif type(value) is float:
+                    values.append(value)
+                    tags.append(NUMBER_FLOAT)
+                elif type(value) is int and abs(value) <= 1 << 53:
+                    values.append(value)
+                    tags.append(NUMBER_INT)
+                else:
+                    values.append(0.0)
+                    tags.append(NUMBER_OTHER)
+                    exceptions[field][rows] = value
+            
+            for field in CACHE_HEAP_FIELDS:
+                offsets, lengths, tags = refs[field]
+                value = event.get(field, MISSING)
+                if value is MISSING:
+                    offsets.append(0)
+                    lengths.append(0)
+                    tags.append(HEAP_MISSING)
+                    continue
+                if isinstance(value, str):
+                    data = value.encode('utf-8')
+                    tags.append(HEAP_STRING)
+                elif type(value) is int:
+                    data = str(value).encode('ascii')
+                    tags.append(HEAP_INT)
+                elif type(value) is float:
+                    data = repr(value).encode('ascii')
+                    tags.append(HEAP_FLOAT)
+                else:
+                    data = json.dumps(value).encode('utf-8')
+                    tags.append(HEAP_JSON)
+                offsets.append(len(heap))
+                lengths.append(len(data))
+                heap += data
+            
+            rows += 1
+        
+        # Lay out the column blocks after the header
+        blocks = []
+        directory = {}
+        for field in CACHE_CODE_FIELDS:
+            directory[field] = {'kind': 'code', 'codes': len(blocks), 'values': dictionaries[field]}
+            blocks.append(codes[field])
+            if field in CACHE_POSTING_FIELDS:
+                directory[field]['postings'] = [len(blocks), len(blocks) + 1]
+                blocks.extend(self.build_postings(codes[field], len(dictionaries[field])))
+        for field in CACHE_NUMBER_FIELDS:
+            values, tags = numbers[field]
+            directory[field] = {'kind': 'number', 'values': len(blocks), 'tags': len(blocks) + 1,
+                                'exceptions': {str(row): value for row, value in exceptions[field].items()}}
+            blocks.extend((values, tags))
+        for field in CACHE_HEAP_FIELDS:
+            directory[field] = {'kind': 'heap', 'offsets': len(blocks), 'lengths': len(blocks) + 1,
+                                'tags': len(blocks) + 2}
+            blocks.extend(refs[field])
+        values, tags = numbers[CACHE_TIME_FIELD]
+        time_rows = array('i', sorted((row for row in range(rows) if tags[row] in (NUMBER_FLOAT, NUMBER_INT)),
+                                      key=values.__getitem__))
+        time_index = [len(blocks), len(blocks) + 1]
+        blocks.extend((array('d', (values[row] for row in time_rows)), time_rows))
+        blocks.append(heap)
+        
+        block_offsets = []
+        position = 0
+        for block in blocks:
+            block_offsets.append(position)
+            position += -(-len(memoryview(block).cast('B')) // 8) * 8
+        
+        header = json.dumps({
+            'version': CACHE_VERSION,
+            'byteorder': sys.byteorder,
+            'source': fingerprint,
+            'rows': rows,
+            'columns': directory,
+            'blocks': [[offset, len(memoryview(block).cast('B'))] for offset, block in zip(block_offsets, blocks)],
+            'time_index': time_index,
+            'heap': len(blocks) - 1
+        }).encode('utf-8')
+        
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(CACHE_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            f.write(b'\0' * (-f.tell() % 8))
+            for block in blocks:
+                data = memoryview(block).cast('B')
+                f.write(data)
+                f.write(b'\0' * (-len(data) % 8))
+        os.replace(temp_file, self.cache_file)
+        print(f"Cached {rows} events to {self.cache_file}")
+    
+    @staticmethod
+    def build_postings(codes: array, size: int) -> Tuple[array, array]:
+        """Rows grouped by code (ascending within a code) and each code's start, by counting sort."""
+        starts = array('q', [0] * (size + 1))
+        for code in codes:
+            if code >= 0:
+                starts[code + 1] += 1
+        for code in range(size):
+            starts[code + 1] += starts[code]
+        rows = array('i', [0] * starts[size])
+        fill = array('q', starts[:size])
+        for row, code in enumerate(codes):
+            if code >= 0:
+                rows[fill[code]] = row
+                fill[code] += 1
+        return rows, starts
+    
+    def postings(self, field: str, code: int):
+        """Rows whose field has the given code, ascending."""
+        rows, starts = self.posting_columns[field]
+        return rows[starts[code]:starts[code + 1]]
+    
+    def time_rows(self, since: Optional[float] = None, until: Optional[float] = None):
+        """Rows with since <= clientTimestamp < until, in timestamp order."""
+        values, rows = self.time_index
+        start = 0 if since is None else bisect_left(values, since)
+        end = len(values) if until is None else bisect_left(values, until)
+        return rows[start:end]
+    
+    def open(self, sources: List[str]) -> bool:
+        """Memory-map the cache if it is current for the input parts."""
+        try:
+            with open(self.cache_file, 'rb') as f:
+                if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    return False
+                header = json.loads(f.read(int.from_bytes(f.read(8), 'little')))
+                data_start = -(-f.tell() // 8) * 8
+                if (header['version'] != CACHE_VERSION or header['byteorder'] != sys.byteorder
+                        or header['source'] != self.sources_fingerprint(sources)):
+                    return False
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        
+        view = memoryview(self.mm)
+        blocks = [view[data_start + offset:data_start + offset + length]
+                  for offset, length in header['blocks']]
+        heap = blocks[header['heap']]
+        
+        self.header = header
+        self.rows = header['rows']
+        self.readers = {}
+        self.code_columns = {}
+        self.posting_columns = {}
+        self.time_index = (blocks[header['time_index'][0]].cast('d'), blocks[header['time_index'][1]].cast('i'))
+        for field, column in header['columns'].items():
+            if column['kind'] == 'code':
+                self.code_columns[field] = (blocks[column['codes']].cast('i'), column['values'])
+                self.readers[field] = self.code_reader(*self.code_columns[field])
+                if 'postings' in column:
+                    rows, starts = column['postings']
+                    self.posting_columns[field] = (blocks[rows].cast('i'), blocks[starts].cast('q'))
+            elif column['kind'] == 'number':
+                self.readers[field] = self.number_reader(
+                    blocks[column['values']].cast('d'), blocks[column['tags']].cast('b'),
+                    {int(row): value for row, value in column['exceptions'].items()})
+            else:
+                self.readers[field] = self.heap_reader(
+                    heap, blocks[column['offsets']].cast('q'), blocks[column['lengths']].cast('i'),
+                    blocks[column['tags']].cast('b'))
+        return True
+    
+    @staticmethod
+    def code_reader(codes, values):
+        def read(row):
+            code = codes[row]
+            return values[code] if code >= 0 else MISSING
+        return read
+    
+    @staticmethod
+    def number_reader(values, tags, exceptions):
+        def read(row):
+            tag = tags[row]
+            if tag == NUMBER_FLOAT:
+                return values[row]
+            if tag == NUMBER_INT:
+                return int(values[row])
+            if tag == NUMBER_NULL:
+                return None
+            if tag == NUMBER_OTHER:
+                return exceptions[row]
+            return MISSING
+        return read
+    
+    @staticmethod
+    def heap_reader(heap, offsets, lengths, tags):
+        def read(row):
+            tag = tags[row]
+            if tag == HEAP_MISSING:
+                return MISSING
+            start = offsets[row]
+            text = str(heap[start:start + lengths[row]], 'utf-8')
+            if tag == HEAP_STRING:
+                return text
+            if tag == HEAP_INT:
+                return int(text)
+            if tag == HEAP_FLOAT:
+                return float(text)
+            return json.loads(text)
+        return read
+
+
+class CachedEvent:
+    """Read-only dict-like view of one row of an EventCache."""
+    __slots__ = ('cache', 'row')
+    
+    def __init__(self, cache: EventCache, row: int):
+        self.cache = cache
+        self.row = row
+    
+    def get(self, key, default=None):
+        reader = self.cache.readers.get(key)
+        if reader is None:
+            return default
+        value = reader(self.row)
+        return default if value is MISSING else value
+    
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+
+class TaskEvent:
+    """Compact task boundary event holding only the PIPELINE_FIELDS of a raw event.
+    
+    Reads like the raw dict (get, [], in); keys the raw event lacks stay absent.
+    """
+    __slots__ = PIPELINE_FIELDS
+    
+    def __init__(self, event: Dict):
+        for field in PIPELINE_FIELDS:
+            value = event.get(field, MISSING)
+            if value is MISSING:
+                continue
+            if field in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, field, value)
+    
+    def get(self, key, default=None):
+        if key not in PIPELINE_FIELD_SET:
+            return default
+        return getattr(self, key, default)
+    
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+
+class CleanedRecord(Mapping):
+    """One row of the cleaned data: a read-only mapping over CLEANED_FIELDNAMES."""
+    __slots__ = CLEANED_FIELDNAMES
+    
+    values_getter = attrgetter(*CLEANED_FIELDNAMES)
+    
+    def __init__(self, **values):
+        for field in CLEANED_FIELDNAMES:
+            setattr(self, field, values[field])
+    
+    @classmethod
+    def from_values(cls, values):
+        """Rebuild a record from values() in CLEANED_FIELDNAMES order."""
+        record = cls.__new__(cls)
+        for field, value in zip(CLEANED_FIELDNAMES, values):
+            setattr(record, field, value)
+        return record
+    
+    def __getitem__(self, key):
+        if key not in CLEANED_FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        if key not in CLEANED_FIELD_SET:
+            return default
+        return getattr(self, key)
+    
+    def __iter__(self):
+        return iter(CLEANED_FIELDNAMES)
+    
+    def __len__(self):
+        return len(CLEANED_FIELDNAMES)
+    
+    def values(self):
+        return self.values_getter(self)
+    
+    def __repr__(self):
+        return f"CleanedRecord({dict(self)!r})"
+
+
+class SessionState:
+    """Per-session operator state of the fused pipeline."""
+    __slots__ = ('clock', 'recent', 'pending', 'waiting', 'early_tasks')
+    
+    def __init__(self):
+        self.clock = None  # Latest timeElapsedSeconds seen for the session
+        self.recent = set()  # Fingerprints of events logged at the current clock
+        self.pending = deque()  # [event, time spent] boundary events not yet emitted, in arrival order
+        self.waiting = None  # Pending entry whose time spent needs the next timed boundary event
+        self.early_tasks = None  # Tasks of emitted events within the AI help window of time 0
+
+
+class SessionDimension:
+    """Per-session values of the cleaned records, derived once per session."""
+    __slots__ = ('student_id', 'section', 'condition', 'practice_start', 'practice_end', 'episode', 'episodes')
+    
+    def __init__(self, student_id: str, section: Optional[str], condition: str):
+        self.student_id = student_id  # Mapped student ID, or the session_ fallback
+        self.section = section  # Section of the session's first cleaned task event
+        self.condition = condition  # Condition of that event
+        self.practice_start = None  # First and last timeElapsedSeconds of practice mode task events
+        self.practice_end = None
+        self.episode = None  # Latest TaskEpisode of the session
+        self.episodes = 0  # Number of task episodes so far
+    
+    def add_practice_time(self, elapsed):
+        if elapsed is None:
+            return
+        if self.practice_start is None or elapsed < self.practice_start:
+            self.practice_start = elapsed
+        if self.practice_end is None or elapsed > self.practice_end:
+            self.practice_end = elapsed
+    
+    def row(self, session_id: str) -> Dict:
+        return {
+            'session_id': session_id,
+            'student_id': self.student_id,
+            'condition': self.condition,
+            'section': self.section or '',
+            'is_admin': self.condition in ADMIN_CONDITIONS,
+            'practice_start_seconds': self.practice_start,
+            'practice_end_seconds': self.practice_end
+        }
+
+
+class TaskEpisode:
+    """A session's consecutive cleaned records on one task, up to its completion."""
+    __slots__ = ('session_id', 'student_id', 'number', 'task_id', 'task_type', 'task_level', 'condition',
+                 'semester', 'is_practice_mode', 'attempt_events', 'completed', 'attempts', 'points_received',
+                 'accuracy', 'ai_help_used', 'dwell_seconds', 'start_seconds', 'end_seconds',
+                 'first_timestamp', 'last_timestamp')
+    
+    def __init__(self, record: CleanedRecord, number: int):
+        self.session_id = record.session_id
+        self.student_id = record.student_id
+        self.number = number  # Position among the session's episodes, from 1
+        self.task_id = record.task_id
+        self.task_type = record.task_type
+        self.task_level = record.task_level
+        self.condition = record.condition
+        self.semester = record.semester
+        self.is_practice_mode = record.is_practice_mode
+        self.attempt_events = 0
+        self.completed = False
+        self.attempts = ''  # attempts, points and accuracy of the task_complete event
+        self.points_received = ''
+        self.accuracy = ''
+        self.ai_help_used = False
+        self.dwell_seconds = None  # Sum of the records' time spent
+        self.start_seconds = None  # timeElapsedSeconds of the first and last timed events
+        self.end_seconds = None
+        self.first_timestamp = record.timestamp
+        self.last_timestamp = record.timestamp
+    
+    def add(self, record: CleanedRecord, elapsed):
+        if record.event_type == 'task_complete':
+            self.completed = True
+            self.attempts = record.attempts
+            self.points_received = record.points_received
+            self.accuracy = record.accuracy
+        else:
+            self.attempt_events += 1
+        if record.ai_help_used:
+            self.ai_help_used = True
+        if record.time_spent_seconds is not None:
+            self.dwell_seconds = (self.dwell_seconds or 0) + record.time_spent_seconds
+        if elapsed is not None:
+            if self.start_seconds is None:
+                self.start_seconds = elapsed
+            self.end_seconds = elapsed
+        self.last_timestamp = record.timestamp
+    
+    def row(self, interruptions: int) -> Tuple:
+        """Values in EPISODE_FIELDNAMES order."""
+        points = distribution_value(self.points_received)
+        return (
+            self.student_id, self.session_id, self.number, self.task_id, self.task_type, self.task_level,
+            self.condition, self.semester, self.is_practice_mode, self.attempt_events, self.completed,
+            self.attempts, self.points_received, self.accuracy, points > 0 if points is not None else '',
+            self.ai_help_used, interruptions, self.dwell_seconds, self.start_seconds, self.end_seconds,
+            self.first_timestamp, self.last_timestamp
+        )
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a fixed relative error (a log-bucket histogram).
+    
+    Values are counted exactly while there are at most SKETCH_EXACT_VALUES
+    distinct ones, so small-integer metrics like points and attempts get
+    exact quantiles. Beyond that, a positive value v is counted in bucket
+    ceil(log(v) / log(gamma)), with gamma = (1 + a) / (1 - a) for relative
+    accuracy a, so every value in a bucket is within a of the bucket's
+    midpoint; negative values use mirrored buckets and zeros their own
+    counter. Merging adds counts, so a merged sketch is exactly the sketch of
+    all values, whichever shard or run they came from. Memory is bounded by
+    SKETCH_MAX_BUCKETS per sign; beyond that the lowest buckets are
+    collapsed, losing accuracy only at the low end.
+    """
+    __slots__ = ('exact', 'positive', 'negative', 'zeros', 'count', 'total', 'min', 'max')
+    
+    gamma = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+    log_gamma = math.log(gamma)
+    
+    def __init__(self):
+        self.exact = {}  # value -> count, until there are too many distinct values
+        self.positive = {}  # bucket -> count
+        self.negative = {}  # bucket of -value -> count
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+    
+    def add(self, value: float):
+        if self.exact is not None:
+            self.exact[value] = self.exact.get(value, 0) + 1
+            if len(self.exact) > SKETCH_EXACT_VALUES:
+                self.bucket_exact()
+        else:
+            self.add_value(value, 1)
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    def add_value(self, value: float, count: int):
+        if value > 0:
+            self.add_bucket(self.positive, math.ceil(math.log(value) / self.log_gamma), count)
+        elif value < 0:
+            self.add_bucket(self.negative, math.ceil(math.log(-value) / self.log_gamma), count)
+        else:
+            self.zeros += count
+    
+    @staticmethod
+    def add_bucket(buckets: Dict[int, int], bucket: int, count: int):
+        buckets[bucket] = buckets.get(bucket, 0) + count
+        if len(buckets) > SKETCH_MAX_BUCKETS:
+            lowest, second = sorted(buckets)[:2]
+            buckets[second] += buckets.pop(lowest)
+    
+    def bucket_exact(self):
+        """Switch from exact counts to buckets."""
+        exact, self.exact = self.exact, None
+        for value, count in exact.items():
+            self.add_value(value, count)
+    
+    def merge(self, other: 'QuantileSketch'):
+        """Add another sketch's values to this one."""
+        if other.exact is not None:
+            for value, count in other.exact.items():
+                if self.exact is not None:
+                    self.exact[value] = self.exact.get(value, 0) + count
+                else:
+                    self.add_value(value, count)
+            if self.exact is not None and len(self.exact) > SKETCH_EXACT_VALUES:
+                self.bucket_exact()
+        else:
+            if self.exact is not None:
+                self.bucket_exact()
+            for bucket, count in other.positive.items():
+                self.add_bucket(self.positive, bucket, count)
+            for bucket, count in other.negative.items():
+                self.add_bucket(self.negative, bucket, count)
+            self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+    
+    def bucket_value(self, bucket: int) -> float:
+        """Midpoint of a bucket, within the relative accuracy of all its values."""
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+    
+    def counts(self):
+        """(value, count) pairs in ascending value order, bucket midpoints once bucketed."""
+        if self.exact is not None:
+            return sorted(self.exact.items())
+        return ([(-self.bucket_value(bucket), self.negative[bucket]) for bucket in sorted(self.negative, reverse=True)]
+                + [(0.0, self.zeros)]
+                + [(self.bucket_value(bucket), self.positive[bucket]) for bucket in sorted(self.positive)])
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q (0..1), or None for an empty sketch."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.counts():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+    
+    def to_state(self) -> Dict:
+        return {'exact': None if self.exact is None else sorted(self.exact.items()),
+                'positive': sorted(self.positive.items()), 'negative': sorted(self.negative.items()),
+                'zeros': self.zeros, 'count': self.count, 'total': self.total,
+                'min': self.min, 'max': self.max}
+    
+    @classmethod
+    def from_state(cls, state: Dict) -> 'QuantileSketch':
+        sketch = cls()
+        sketch.exact = None if state['exact'] is None else {value: count for value, count in state['exact']}
+        sketch.positive = {bucket: count for bucket, count in state['positive']}
+        sketch.negative = {bucket: count for bucket, count in state['negative']}
+        sketch.zeros = state['zeros']
+        sketch.count = state['count']
+        sketch.total = state['total']
+        sketch.min = state['min']
+        sketch.max = state['max']
+        return sketch
+
+
+class SessionSampler:
+    """Seeded sample of whole sessions, stratified and chosen in one streaming pass.
+    
+    Every session gets a priority from a hash of its ID keyed with the seed,
+    and is assigned to a stratum (its condition) at its first event. Each
+    stratum keeps the size lowest-priority sessions seen so far; a session
+    that does not make it can never qualify later, so its events are never
+    buffered. At the end, size sessions are split over the strata in
+    proportion to their session counts. The sample depends only on the seed
+    and the sessions in the dump, not on their order. Each sample() or
+    sample_rows() call starts a new pass, so the same sampler can read the
+    dump again.
+    """
+    
+    def __init__(self, size: int, seed: int = 0, stratum=None):
+        self.size = size
+        self.seed = seed
+        self.stratum = stratum or (lambda event: event.get('section') or '')
+        self.reset()
+    
+    def reset(self):
+        """Forget the sessions offered so far."""
+        self.strata = defaultdict(list)  # stratum -> heap of (-priority, session_id)
+        self.session_counts = Counter()  # stratum -> sessions seen
+        self.sampled = set()  # Sessions currently kept by their stratum
+    
+    def priority(self, session_id: str) -> int:
+        digest = hashlib.blake2b(str(session_id).encode('utf-8'), digest_size=8, key=str(self.seed).encode('utf-8'))
+        return int.from_bytes(digest.digest(), 'big')
+    
+    def offer(self, session_id: str, event) -> Optional[str]:
+        """Consider a session at its first event. Returns the session it displaced, if any."""
+        stratum = self.stratum(event)
+        self.session_counts[stratum] += 1
+        heap = self.strata[stratum]
+        entry = (-self.priority(session_id), session_id)
+        if len(heap) < self.size:
+            heapq.heappush(heap, entry)
+            self.sampled.add(session_id)
+        elif entry > heap[0]:
+            evicted = heapq.heapreplace(heap, entry)[1]
+            self.sampled.discard(evicted)
+            self.sampled.add(session_id)
+            return evicted
+        return None
+    
+    def allocation(self) -> Dict:
+        """Sessions to take from each stratum, proportional to its size (largest remainder)."""
+        total = sum(self.session_counts.values())
+        if total <= self.size:
+            return dict(self.session_counts)
+        shares = {stratum: self.size * count / total for stratum, count in self.session_counts.items()}
+        quotas = {stratum: int(share) for stratum, share in shares.items()}
+        remaining = self.size - sum(quotas.values())
+        for stratum in sorted(shares, key=lambda stratum: (quotas[stratum] - shares[stratum], str(stratum)))[:remaining]:
+            quotas[stratum] += 1
+        return quotas
+    
+    def chosen(self) -> set:
+        """The sampled sessions, once every event has been offered."""
+        chosen = set()
+        for stratum, quota in self.allocation().items():
+            chosen.update(session_id for _, session_id in sorted(self.strata[stratum], reverse=True)[:quota])
+        return chosen
+    
+    def sample(self, events) -> List[Dict]:
+        """Events of the sampled sessions, in input order, keeping INPUT_FIELDS."""
+        self.reset()
+        buffers = {}  # session_id -> [(position, event)] of sessions still sampled
+        seen = set()
+        for position, event in enumerate(events):
+            session_id = event.get('sessionId')
+            if not session_id:
+                continue
+            if session_id not in seen:
+                seen.add(session_id)
+                evicted = self.offer(session_id, event)
+                if evicted is not None:
+                    del buffers[evicted]
+                if session_id in self.sampled:
+                    buffers[session_id] = []
+            buffer = buffers.get(session_id)
+            if buffer is not None:
+                buffer.append((position, project_event(event, INPUT_FIELDS)))
+        
+        chosen = self.chosen()
+        self.print_sample()
+        entries = [entry for session_id in chosen for entry in buffers[session_id]]
+        entries.sort(key=itemgetter(0))
+        return [event for _, event in entries]
+    
+    def sample_rows(self, cache: 'EventCache', rows) -> List[int]:
+        """Cache rows of the sampled sessions, in row order."""
+        self.reset()
+        session_codes, session_values = cache.code_columns['sessionId']
+        seen = set()
+        for row in rows:
+            session_code = session_codes[row]
+            if session_code < 0 or session_code in seen:
+                continue
+            seen.add(session_code)
+            if session_values[session_code]:
+                self.offer(session_values[session_code], CachedEvent(cache, row))
+        
+        chosen = self.chosen()
+        self.print_sample()
+        chosen_codes = {code for code, value in enumerate(session_values) if value in chosen}
+        return [row for row in rows if session_codes[row] in chosen_codes]
+    
+    def print_sample(self):
+        allocation = self.allocation()
+        print(f"Sampled {sum(allocation.values())} of {sum(self.session_counts.values())} "
+              f"sessions (seed {self.seed}):")
+        for stratum, count in sorted(self.session_counts.items(), key=lambda item: str(item[0])):
+            print(f"  {stratum or '(none)'}: {allocation.get(stratum, 0)} of {count}")
+
+
+class EventFilter:
+    """--since/--until/--section/--student predicates, applied while events are read.
+    
+    Time bounds apply to each event's clientTimestamp, since inclusive and
+    until exclusive as in dump.js; events without one are dropped when a
+    bound is set. Section and student select whole sessions, so time spent
+    and AI help matching see all of a session's events: a session's section
+    and student are the first non-empty values among its events in input
+    order (the rule of the session-to-student mapping).
+    """
+    
+    def __init__(self, since: Optional[int] = None, until: Optional[int] = None,
+                 section: Optional[str] = None, student: Optional[str] = None):
+        self.since = since
+        self.until = until
+        self.session_targets = {field: value for field, value in (('section', section), ('studentId', student))
+                                if value is not None}
+    
+    def in_range(self, event) -> bool:
+        if self.since is None and self.until is None:
+            return True
+        client_timestamp = event.get('clientTimestamp')
+        if not isinstance(client_timestamp, (int, float)) or isinstance(client_timestamp, bool):
+            return False
+        return ((self.since is None or client_timestamp >= self.since)
+                and (self.until is None or client_timestamp < self.until))
+    
+    def select(self, events):
+        """Filter an event stream: a generator for time bounds only, else a list in input order.
+        
+        Events of sessions whose section or student is not known yet are
+        buffered (keeping INPUT_FIELDS) until it is, or dropped at the end.
+        """
+        if not self.session_targets:
+            return (event for event in events if self.in_range(event))
+        
+        selected = []  # (position, event) of matching sessions
+        decided = {}  # session_id -> whether it matches
+        pending = {}  # session_id -> (first values found so far, buffered (position, event))
+        for position, event in enumerate(events):
+            session_id = event.get('sessionId')
+            if not session_id:
+                continue
+            matches = decided.get(session_id)
+            if matches is None:
+                values, buffer = pending.get(session_id) or pending.setdefault(session_id, ({}, []))
+                for field, target in self.session_targets.items():
+                    value = event.get(field)
+                    if field not in values and value:
+                        values[field] = str(value)
+                if any(values[field] != target for field, target in self.session_targets.items() if field in values):
+                    matches = False
+                elif len(values) == len(self.session_targets):
+                    matches = True
+                if matches is not None:
+                    decided[session_id] = matches
+                    del pending[session_id]
+                    if matches:
+                        selected.extend(buffer)
+                else:
+                    if self.in_range(event):
+                        buffer.append((position, project_event(event, INPUT_FIELDS)))
+                    continue
+            if matches and self.in_range(event):
+                selected.append((position, project_event(event, INPUT_FIELDS)))
+        
+        selected.sort(key=itemgetter(0))
+        return [event for _, event in selected]
+    
+    def select_rows(self, cache: 'EventCache') -> List[int]:
+        """Cache rows passing the filter, ascending, via postings and the timestamp index."""
+        if not self.session_targets:
+            return sorted(cache.time_rows(self.since, self.until))
+        
+        session_codes, session_values = cache.code_columns['sessionId']
+        sessions = None
+        for field, target in self.session_targets.items():
+            codes, values = cache.code_columns[field]
+            target_codes = {code for code, value in enumerate(values) if value and str(value) == target}
+            candidates = {session_codes[row] for code in target_codes for row in cache.postings(field, code)}
+            matching = set()
+            for session_code in candidates:
+                if session_code < 0 or not session_values[session_code]:
+                    continue
+                # The session's first non-empty value decides
+                for row in cache.postings('sessionId', session_code):
+                    code = codes[row]
+                    if code >= 0 and values[code]:
+                        if code in target_codes:
+                            matching.add(session_code)
+                        break
+            sessions = matching if sessions is None else sessions & matching
+        
+        rows = sorted(row for session_code in sessions for row in cache.postings('sessionId', session_code))
+        if self.since is not None or self.until is not None:
+            read_timestamp = cache.readers[CACHE_TIME_FIELD]
+            rows = [row for row in rows if self.in_range({'clientTimestamp': read_timestamp(row)})]
+        return rows
+    
+    def describe(self) -> str:
+        conditions = []
+        if self.since is not None:
+            conditions.append(f"clientTimestamp >= {self.since}")
+        if self.until is not None:
+            conditions.append(f"clientTimestamp < {self.until}")
+        for field, target in self.session_targets.items():
+            conditions.append(f"session {field} = {target}")
+        return ', '.join(conditions)
+
+
+class ExternalRecordSort:
+    """Sorts cleaned records by record_sort_key in bounded memory.
+    
+    Records are buffered up to run_size, then sorted and spilled to a
+    temporary file as a run; reading merges the runs and the buffer. Equal
+    keys keep their insertion order, as with sorted(). Runs are leveled: once
+    a level holds SORT_MERGE_FAN_IN runs they are merged into one run of the
+    next level, so open files stay bounded and each record is rewritten once
+    per level rather than at every merge.
+    """
+    
+    def __init__(self, run_size: int, temp_dir: Optional[str] = None):
+        self.run_size = run_size
+        self.temp_dir = temp_dir
+        self.buffer = []
+        self.levels = [[]]  # Runs by level, oldest first; a level's runs are all older than the level below
+        self.spilled_runs = 0
+        self.count = 0
+    
+    def add(self, record: 'CleanedRecord'):
+        self.buffer.append(record)
+        self.count += 1
+        if len(self.buffer) >= self.run_size:
+            self.spill()
+    
+    def spill(self):
+        """Write the sorted buffer as a new run."""
+        self.buffer.sort(key=record_sort_key)
+        self.levels[0].append(self.write_run(self.buffer))
+        self.spilled_runs += 1
+        self.buffer = []
+        
+        for level, runs in enumerate(self.levels):
+            if len(runs) < SORT_MERGE_FAN_IN:
+                break
+            merged = self.write_run(heapq.merge(*map(self.read_run, runs), key=record_sort_key))
+            for run in runs:
+                run.close()
+            runs.clear()
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            self.levels[level + 1].append(merged)
+    
+    @property
+    def runs(self) -> List:
+        """Spilled runs in insertion order."""
+        return [run for runs in reversed(self.levels) for run in runs]
+    
+    def write_run(self, records):
+        run = tempfile.TemporaryFile(dir=self.temp_dir)
+        batch = []
+        for record in records:
+            batch.append(record.values())
+            if len(batch) >= SORT_BATCH_SIZE:
+                pickle.dump(batch, run, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, run, pickle.HIGHEST_PROTOCOL)
+        return run
+    
+    @staticmethod
+    def read_run(run):
+        run.seek(0)
+        while True:
+            try:
+                batch = pickle.load(run)
+            except EOFError:
+                return
+            for values in batch:
+                yield CleanedRecord.from_values(values)
+    
+    def __iter__(self):
+        """Records in output order; the sorter is spent afterwards."""
+        self.buffer.sort(key=record_sort_key)
+        try:
+            yield from heapq.merge(*map(self.read_run, self.runs), self.buffer, key=record_sort_key)
+        finally:
+            for run in self.runs:
+                run.close()
+            self.levels = [[]]
+            self.buffer = []
+
+
+def table_column_type(values) -> str:
+    """Narrowest column type of non-null values: bool, int, float, else string."""
+    kinds = {type(value) for value in values if value is not None and value != ''}
+    if not kinds:
+        return 'string'
+    if kinds == {bool}:
+        return 'bool'
+    if kinds == {int} and all(-(1 << 63) <= value < 1 << 63 for value in values if type(value) is int):
+        return 'int'
+    if kinds <= {int, float}:
+        return 'float'
+    return 'string'
+
+
+def encode_table_column(kind: str, values: List, dictionary: Optional[Dict] = None) -> List:
+    """Buffers of one column chunk; None and '' are null.
+    
+    bool: int8 (-1 null); int/float: int64/float64 values and an int8
+    validity; dictionary: int32 codes (-1 null); string: int64 byte offsets
+    (rows + 1), an int8 validity and the UTF-8 heap.
+    """
+    if kind == 'dictionary':
+        return [array('i', [-1 if value is None or value == '' else dictionary.setdefault(value, len(dictionary))
+                            for value in values])]
+    valid = array('b', (0 if value is None or value == '' else 1 for value in values))
+    if kind == 'bool':
+        return [array('b', (int(value) if ok else -1 for value, ok in zip(values, valid)))]
+    if kind == 'int':
+        return [array('q', (value if ok else 0 for value, ok in zip(values, valid))), valid]
+    if kind == 'float':
+        return [array('d', (float(value) if ok else 0.0 for value, ok in zip(values, valid))), valid]
+    heap = bytearray()
+    offsets = array('q', [0])
+    for value, ok in zip(values, valid):
+        if ok:
+            heap += (value if isinstance(value, str) else str(value)).encode('utf-8')
+        offsets.append(len(heap))
+    return [offsets, valid, heap]
+
+
+def write_columnar_table(output_file: str, records: List, fieldnames, group_field: Optional[str] = None,
+                         dictionary_fields: Tuple[str, ...] = ()) -> int:
+    """Write records as a typed, compressed columnar table; see ColumnarTable.
+    
+    Rows are split into row groups by group_field (CSV text of the value,
+    groups in order of first appearance), keeping their order within a group.
+    Each column is typed from all its values (table_column_type), and
+    dictionary_fields are stored as codes into one dictionary per column.
+    
+    Returns:
+        The number of rows written
+    """
+    # Rows as value tuples, then each group's columns
+    fieldnames = list(fieldnames)
+    if records and isinstance(records[0], CleanedRecord):
+        getter = attrgetter(*fieldnames)
+    else:
+        getter = itemgetter(*fieldnames)
+    group_position = fieldnames.index(group_field) if group_field is not None else None
+    groups = {}
+    for row in map(getter, records):
+        key = '' if group_position is None or row[group_position] is None else str(row[group_position])
+        groups.setdefault(key, []).append(row)
+    groups = {key: list(zip(*rows)) for key, rows in groups.items()}
+    
+    columns = []
+    for position, field in enumerate(fieldnames):
+        if field in dictionary_fields:
+            kind = 'dictionary'
+        else:
+            kind = table_column_type([value for group in groups.values() for value in group[position]])
+        columns.append({'name': field, 'type': kind})
+    dictionaries = {column['name']: {} for column in columns if column['type'] == 'dictionary'}
+    
+    chunks = []  # Compressed buffers in file order
+    row_groups = []
+    offset = 0
+    for key, group in groups.items():
+        chunk_refs = {}
+        for column, values in zip(columns, group):
+            name = column['name']
+            refs = chunk_refs[name] = []
+            for buffer in encode_table_column(column['type'], values, dictionaries.get(name)):
+                raw = memoryview(buffer).cast('B')
+                data = zlib.compress(raw, TABLE_COMPRESSION_LEVEL)
+                refs.append([offset, len(data), len(raw)])
+                chunks.append(data)
+                offset += len(data)
+        row_groups.append({'key': key, 'rows': len(group[0]), 'columns': chunk_refs})
+    for column in columns:
+        if column['type'] == 'dictionary':
+            column['values'] = list(dictionaries[column['name']])
+    
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'rows': sum(group['rows'] for group in row_groups),
+        'group_field': group_field,
+        'columns': columns,
+        'row_groups': row_groups
+    }).encode('utf-8')
+    temp_file = output_file + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(TABLE_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for data in chunks:
+            f.write(data)
+    os.replace(temp_file, output_file)
+    return sum(group['rows'] for group in row_groups)
+
+
+class ColumnarTable:
+    """Reads selected columns and row groups of a write_columnar_table file.
+    
+    File layout: magic, header length, JSON header (columns with their types
+    and dictionaries, row groups with the [offset, stored length, raw length]
+    of each column's buffers), then the zlib-compressed buffers. The file is
+    memory-mapped and only the chunks of the requested columns and row
+    groups are decompressed. Nulls read as None.
+    
+    Example (clean-data.py loads like any module file):
+        spec = importlib.util.spec_from_file_location('clean_data', 'clean-data.py')
+        ...
+        with module.ColumnarTable('data/cleaned_game_data.cols') as table:
+            minutes = table.column('time_spent_minutes', groups=['1'])
+    """
+    
+    def __init__(self, table_file: str):
+        with open(table_file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+            self.mm.close()
+            raise ValueError(f"{table_file} is not a columnar table")
+        start = len(TABLE_MAGIC) + 8
+        header_length = int.from_bytes(self.mm[len(TABLE_MAGIC):start], 'little')
+        self.header = json.loads(self.mm[start:start + header_length])
+        self.data_start = start + header_length
+        self.columns = {column['name']: column for column in self.header['columns']}
+        self.rows = self.header['rows']
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        self.mm.close()
+    
+    @property
+    def groups(self) -> List[str]:
+        """Row group keys (the group_field values), in file order."""
+        return [group['key'] for group in self.header['row_groups']]
+    
+    def buffer(self, ref: List[int], typecode: Optional[str] = None):
+        offset, length, _ = ref
+        data = zlib.decompress(self.mm[self.data_start + offset:self.data_start + offset + length])
+        if typecode is None:
+            return data
+        values = array(typecode)
+        values.frombytes(data)
+        if self.header['byteorder'] != sys.byteorder:
+            values.byteswap()
+        return values
+    
+    def column(self, name: str, groups: Optional[List[str]] = None) -> List:
+        """A column's values over the given row groups (default: all), in file order."""
+        column = self.columns[name]
+        kind = column['type']
+        values = []
+        for group in self.header['row_groups']:
+            if groups is not None and group['key'] not in groups:
+                continue
+            refs = group['columns'][name]
+            if kind == 'dictionary':
+                lookup = column['values'] + [None]  # Code -1 picks the last entry
+                values.extend(lookup[code] for code in self.buffer(refs[0], 'i'))
+            elif kind == 'bool':
+                values.extend(None if code < 0 else code == 1 for code in self.buffer(refs[0], 'b'))
+            elif kind in ('int', 'float'):
+                data = self.buffer(refs[0], 'q' if kind == 'int' else 'd')
+                valid = self.buffer(refs[1])
+                values.extend(value if ok else None for value, ok in zip(data, valid))
+            else:
+                offsets = self.buffer(refs[0], 'q')
+                valid = self.buffer(refs[1])
+                heap = self.buffer(refs[2])
+                values.extend(heap[offsets[i]:offsets[i + 1]].decode('utf-8') if ok else None
+                              for i, ok in enumerate(valid))
+        return values
+    
+    def read(self, names: Optional[List[str]] = None, groups: Optional[List[str]] = None) -> Dict[str, List]:
+        """Columns (default: all) over the given row groups, by name."""
+        return {name: self.column(name, groups) for name in (names or self.columns)}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MB."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / MB, 1)
+
+
+class PipelineMetrics:
+    """Per-stage wall time, CPU time and memory of a cleaning run.
+    
+    Stages nest: a stage entered while another runs is recorded with it as
+    parent. Stages named in profile_stages run under cProfile (unless a
+    profiler is already active); with trace_memory, tracemalloc reports each
+    stage's peak of Python allocations.
+    """
+    
+    def __init__(self, enabled: bool = False, profile_stages: Tuple[str, ...] = (),
+                 trace_memory: bool = False):
+        self.enabled = enabled
+        self.profile_stages = profile_stages
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.profiles = {}  # stage name -> cProfile.Profile
+        self.stack = []
+        self.profiling = False
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        # cProfile and tracemalloc are imported only when asked for, not on every run
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Measure the enclosed block; callers may set the yielded dict's 'items'."""
+        if not self.enabled:
+            yield {}
+            return
+        
+        stage = {'name': name, 'parent': self.stack[-1]['name'] if self.stack else None}
+        frame = {'name': name, 'child_peak': 0}
+        if self.trace_memory:
+            import tracemalloc
+            frame['outer_peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        profile = None
+        if not self.profiling and ('all' in self.profile_stages or name in self.profile_stages):
+            import cProfile
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            self.profiling = True
+            profile.enable()
+        
+        self.stages.append(stage)
+        self.stack.append(frame)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield stage
+        finally:
+            wall = time.perf_counter() - start_wall
+            stage['wall_seconds'] = round(wall, 4)
+            stage['cpu_seconds'] = round(time.process_time() - start_cpu, 4)
+            if profile is not None:
+                profile.disable()
+                self.profiling = False
+            stage['peak_rss_mb'] = peak_rss_mb()
+            if stage.get('items') is not None and wall > 0:
+                stage['items_per_second'] = round(stage['items'] / wall, 1)
+            
+            self.stack.pop()
+            if self.trace_memory:
+                # reset_peak() in nested stages hides their peak from this one
+                import tracemalloc
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame['child_peak'])
+                stage['traced_current_mb'] = round(current / MB, 1)
+                stage['traced_peak_mb'] = round(peak / MB, 1)
+                if self.stack:
+                    parent = self.stack[-1]
+                    parent['child_peak'] = max(parent['child_peak'], frame['outer_peak'], peak)
+    
+    def profile_summary(self, profile: 'cProfile.Profile') -> List[Dict]:
+        """Top functions of a stage profile by cumulative time."""
+        import pstats
+        stats = pstats.Stats(profile)
+        stats.sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+            _, calls, total, cumulative, _ = stats.stats[func]
+            filename, line, name = func
+            functions.append({'function': f"{os.path.basename(filename)}:{line}({name})", 'calls': calls,
+                              'total_seconds': round(total, 4), 'cumulative_seconds': round(cumulative, 4)})
+        return functions
+    
+    def save_report(self, output_file: str, details: Dict):
+        """Write the stages and run details as JSON, plus one .prof file per profiled stage."""
+        report = {
+            'version': METRICS_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'command': sys.argv,
+            'total_wall_seconds': round(time.perf_counter() - self.start_wall, 4),
+            'total_cpu_seconds': round(time.process_time() - self.start_cpu, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            **details,
+            'stages': self.stages,
+        }
+        
+        if self.profiles:
+            report['profiles'] = {}
+            base = os.path.splitext(output_file)[0]
+            for name, profile in self.profiles.items():
+                profile_file = f"{base}.{name}.prof"
+                profile.dump_stats(profile_file)
+                report['profiles'][name] = {'file': profile_file, 'top_functions': self.profile_summary(profile)}
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved metrics report to {output_file}")
+    
+    def print_stages(self):
+        """Print a one-line summary per stage."""
+        print("\n=== STAGE METRICS ===")
+        for stage in self.stages:
+            indent = '    ' if stage['parent'] else '  '
+            rate = f"  {stage['items_per_second']:,.0f}/s" if 'items_per_second' in stage else ''
+            peak = f"  peak RSS {stage['peak_rss_mb']} MB" if stage['peak_rss_mb'] is not None else ''
+            print(f"{indent}{stage['name']:<28} {stage['wall_seconds']:>9.3f}s wall "
+                  f"{stage['cpu_seconds']:>9.3f}s CPU{peak}{rate}")
+
+
+class RecordIndex:
+    """Cleaned records with inverted indexes, answering the query service's requests.
+    
+    Values are matched as the cleaned CSV writes them (None as '', 1 as
+    '1'), so a query string finds the rows a grep of the CSV would. Each
+    indexed field maps values to ascending record positions; a query
+    intersects the smallest position list with the others, then checks any
+    non-indexed filters record by record.
+    """
+    
+    def __init__(self, records: List[Dict], session_to_student_map: Dict, ai_help_index: Dict):
+        self.records = records
+        self.session_to_student_map = session_to_student_map
+        self.ai_help_index = ai_help_index
+        self.indexes = {field: {} for field in QUERY_INDEX_FIELDS}
+        for position, record in enumerate(records):
+            for field, index in self.indexes.items():
+                key = query_value(record[field])
+                positions = index.get(key)
+                if positions is None:
+                    positions = index[key] = array('i')
+                positions.append(position)
+        self.ai_help_tasks = defaultdict(list)  # session_id -> task IDs with AI help
+        for session_id, task_id in ai_help_index:
+            self.ai_help_tasks[session_id].append(task_id)
+    
+    def select(self, filters: Dict[str, str]) -> List[int]:
+        """Positions of the records matching every field=value filter, in output order."""
+        indexed = [self.indexes[field].get(value, ()) for field, value in filters.items() if field in self.indexes]
+        scanned = [(field, value) for field, value in filters.items() if field not in self.indexes]
+        if indexed:
+            indexed.sort(key=len)
+            positions = indexed[0]
+            for other in indexed[1:]:
+                other = set(other)
+                positions = [position for position in positions if position in other]
+        else:
+            positions = range(len(self.records))
+        if scanned:
+            positions = [position for position in positions
+                         if all(query_value(self.records[position][field]) == value for field, value in scanned)]
+        return list(positions)
+    
+    def summarize(self, positions: List[int], group_by: Tuple[str, ...] = ()) -> List[Dict]:
+        """Counts, AI help rate, time spent and points of the records, per group_by values."""
+        groups = {}
+        for position in positions:
+            record = self.records[position]
+            key = tuple(query_value(record[field]) for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {'records': 0, 'students': set(), 'sessions': set(), 'ai_help_used': 0,
+                                       'time_spent_seconds': QuantileSketch(), 'points': 0.0}
+            group['records'] += 1
+            group['students'].add(record['student_id'])
+            group['sessions'].add(record['session_id'])
+            if record['ai_help_used']:
+                group['ai_help_used'] += 1
+            time_spent = distribution_value(record['time_spent_seconds'])
+            if time_spent is not None:
+                group['time_spent_seconds'].add(time_spent)
+            points = distribution_value(record['points_received'])
+            if points is not None:
+                group['points'] += points
+        
+        summaries = []
+        for key, group in groups.items():
+            sketch = group['time_spent_seconds']
+            summary = dict(zip(group_by, key))
+            summary.update({
+                'records': group['records'],
+                'students': len(group['students']),
+                'sessions': len(group['sessions']),
+                'ai_help_used': group['ai_help_used'],
+                'ai_help_rate': round(group['ai_help_used'] / group['records'], 3),
+                'total_points': group['points'],
+                'time_spent_seconds': {
+                    'count': sketch.count,
+                    'mean': round(sketch.total / sketch.count, 3) if sketch.count else None,
+                    **{f"p{round(q * 100)}": round(sketch.quantile(q), 3) if sketch.count else None
+                       for q in DISTRIBUTION_QUANTILES}
+                }
+            })
+            summaries.append(summary)
+        return summaries
+    
+    def session(self, session_id: str) -> Optional[Dict]:
+        """A session's student, record count and AI help events by task."""
+        positions = self.indexes['session_id'].get(session_id, ())
+        if not positions and session_id not in self.session_to_student_map and session_id not in self.ai_help_tasks:
+            return None
+        ai_help = {}
+        for task_id in self.ai_help_tasks.get(session_id, ()):
+            timestamps, responses = self.ai_help_index[(session_id, task_id)]
+            ai_help[task_id] = [{'time_elapsed_seconds': timestamp, 'response': response}
+                                for timestamp, response in zip(timestamps, responses)]
+        return {
+            'session_id': session_id,
+            'student_id': self.session_to_student_map.get(session_id),
+            'records': len(positions),
+            'ai_help': ai_help
+        }
+
+
+def query_value(value) -> str:
+    """A record value as the cleaned CSV writes it."""
+    return '' if value is None else str(value)
+
+
+class QueryRequestHandler:
+    """JSON API over the server's RecordIndex (GET only).
+    
+    serve_queries() mixes it into http.server's BaseHTTPRequestHandler,
+    imported only when serving.
+    
+    /                      Record, student and session counts
+    /records?F=V&...       Matching records; limit (default 100) and offset page them
+    /summary?F=V&...       Aggregates of the matching records; group_by=F1,F2 splits them
+    /students/ID           A student's sessions and records in output order
+    /sessions/ID           A session's student, record count and AI help events
+    
+    Filters F can be any cleaned record field; values match the CSV text.
+    """
+    server_version = 'GameDataQuery/1'
+    
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/')] if url.path.strip('/') else []
+        try:
+            status, body = self.route(parts, params)
+        except ValueError as e:
+            status, body = 400, {'error': str(e)}
+        body['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self.send_json(status, body)
+    
+    def route(self, parts: List[str], params: Dict[str, str]) -> Tuple[int, Dict]:
+        index = self.server.index
+        if not parts:
+            return 200, {
+                'records': len(index.records),
+                'students': len(index.indexes['student_id']),
+                'sessions': len(index.indexes['session_id']),
+                'mapped_sessions': len(index.session_to_student_map),
+                'ai_help_keys': len(index.ai_help_index),
+                'indexed_fields': list(QUERY_INDEX_FIELDS)
+            }
+        if parts == ['records']:
+            limit = self.int_param(params, 'limit', 100)
+            offset = self.int_param(params, 'offset', 0)
+            if limit > QUERY_MAX_LIMIT:
+                raise ValueError(f"limit must be at most {QUERY_MAX_LIMIT}")
+            positions = index.select(self.filters(params, ('limit', 'offset')))
+            return 200, {'total': len(positions), 'offset': offset,
+                         'records': [dict(index.records[position]) for position in positions[offset:offset + limit]]}
+        if parts == ['summary']:
+            group_by = tuple(field for field in params.get('group_by', '').split(',') if field)
+            unknown = [field for field in group_by if field not in CLEANED_FIELDNAMES]
+            if unknown:
+                raise ValueError(f"Unknown group_by fields: {', '.join(unknown)}")
+            positions = index.select(self.filters(params, ('group_by',)))
+            return 200, {'total': len(positions), 'groups': index.summarize(positions, group_by)}
+        if len(parts) == 2 and parts[0] == 'students':
+            positions = index.select({'student_id': parts[1]})
+            if not positions:
+                return 404, {'error': f"Unknown student {parts[1]}"}
+            records = [dict(index.records[position]) for position in positions]
+            return 200, {'student_id': parts[1],
+                         'sessions': list(dict.fromkeys(record['session_id'] for record in records)),
+                         'records': records}
+        if len(parts) == 2 and parts[0] == 'sessions':
+            session = index.session(parts[1])
+            if session is None:
+                return 404, {'error': f"Unknown session {parts[1]}"}
+            return 200, session
+        return 404, {'error': f"Unknown path {self.path}"}
+    
+    @staticmethod
+    def filters(params: Dict[str, str], reserved: Tuple[str, ...]) -> Dict[str, str]:
+        filters = {field: value for field, value in params.items() if field not in reserved}
+        unknown = [field for field in filters if field not in CLEANED_FIELDNAMES]
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(unknown)}")
+        return filters
+    
+    @staticmethod
+    def int_param(params: Dict[str, str], name: str, default: int) -> int:
+        value = params.get(name)
+        if value is None:
+            return default
+        if not value.isdigit():
+            raise ValueError(f"{name} must be a non-negative integer")
+        return int(value)
+    
+    def send_json(self, status: int, body: Dict):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        # Records hold student IDs and answers: only the page given by --serve-origin
+        # (e.g. an admin dashboard on the Vite dev server) may read them cross-origin
+        if self.server.allowed_origin is not None:
+            self.send_header('Access-Control-Allow-Origin', self.server.allowed_origin)
+            self.send_header('Vary', 'Origin')
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def address_string(self) -> str:
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+    
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
 
 class GameDataCleaner:
-    def __init__(self, json_file: str):
-        """Initialize the data cleaner with the JSON events file."""
+    distribution_values = attrgetter(*DISTRIBUTION_METRICS)  # A cleaned record's DISTRIBUTION_METRICS
+    
+    def __init__(self, json_file: str, ai_help_window: float = AI_HELP_WINDOW_SECONDS):
+        """Initialize the data cleaner with the JSON events file.
+        
+        json_file may also be a directory or glob of .json/.jsonl(.gz) parts,
+        see iter_events().
+        """
         self.json_file = json_file
+        self.read_workers = 1  # Processes decoding input parts in parallel
+        self.firestore = None  # FirestoreSource pulled instead of reading json_file
+        self.event_filter = None  # EventFilter applied while reading, see read_events()
+        self.session_sample = None  # SessionSampler choosing the sessions to read, see read_events()
         self.events = []
         self.cleaned_data = []
         self.session_to_student_map = {}  # Bijective mapping: session_id -> student_id
-        self.ai_help_index = {}  # Fast AI help lookup: (session_id, task_id) -> events
+        self.ai_help_index = {}  # Fast AI help lookup: (session_id, task_id) -> (sorted timestamps, responses)
+        self.ai_help_window = ai_help_window  # Max seconds between a task attempt and its AI help
+        self.session_event_index = {}  # session_id -> sorted positions of time boundary events
+        self.session_dimensions = {}  # session_id -> SessionDimension of the sessions cleaned so far
+        self.task_dimensions = {}  # task_id -> (task_type, level, task_number) of the task IDs parsed so far
+        self.group_episodes = False  # Group records into task episodes (--episodes), see add_episode_record()
+        self.task_episodes = []  # TaskEpisodes in the order they were started, see add_episode_record()
+        self.switch_index = {}  # session_id -> timeElapsedSeconds of its task, tab and jar refill switches
+        self.metrics = PipelineMetrics()  # Stage metrics, enabled by --metrics-out/--profile
+        self.counters = Counter()  # Events read/kept and event cache hits, for the metrics report
+        self.record_sort = None  # ExternalRecordSort receiving records instead of cleaned_data
+        self.drop_duplicates = True  # Skip task and AI help events logged twice, see is_duplicate_event()
+        self.event_fingerprints = set()  # Fingerprints of the task and AI help events kept so far
+        
+        # Incremental mode state, see load_state() and save_incremental()
+        self.incremental = False
+        self.resumed = False  # Whether a previous run's state was restored and its outputs are merged into
+        self.watermark = None  # Highest clientTimestamp processed by previous runs
+        self.max_client_timestamp = None  # Highest clientTimestamp seen in this run
+        self.session_clock = {}  # session_id -> latest timeElapsedSeconds seen
+        self.session_last_seen = {}  # session_id -> latest clientTimestamp seen
+        self.open_events = []  # Boundary events whose records may still change
+        self.open_records = []  # Records written for open_events by the previous run
+        self.summary_stats = defaultdict(new_summary_stats)  # Stats of records that can no longer change
+        self.distribution_stats = defaultdict(new_distribution_stats)  # Sketches of those records
         
         # Task type mappings
         self.task_type_map = {
@@ -54,19 +2163,68 @@ class GameDataCleaner:
             'ADMIN-TEST': 'Admin_Test'
         }
     
-    def load_data(self):
-        """Load the JSON events data and build session-to-student mapping."""
+    def load_data(self, streaming: bool = False, limit: Optional[int] = None, use_cache: bool = False):
+        """Load the JSON events data and build session-to-student mapping.
+        
+        Args:
+            streaming: Parse the file incrementally and keep only the projected
+                task events instead of every raw event (bounded memory)
+            limit: Stop reading after this many events
+            use_cache: Read events from a memory-mapped columnar cache next to
+                the JSON file, (re)building it when the JSON has changed
+        """
         print("Loading events data...")
         try:
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                self.events = json.load(f)
+            if use_cache:
+                self.load_cached_data(limit)
+                return True
+            
+            if streaming:
+                self.stream_data(limit)
+                return True
+            
+            with self.metrics.stage('parse_json') as stage:
+                parts = self.input_parts()
+                if (limit is None and self.event_filter is None and self.session_sample is None
+                        and len(parts) == 1 and parts[0].endswith('.json')):
+                    with open(parts[0], 'r', encoding='utf-8') as f:
+                        self.events = json.load(f)
+                else:
+                    self.events = list(self.read_events(limit))
+                stage['items'] = len(self.events)
+            self.counters['events_read'] = len(self.events)
             print(f"Loaded {len(self.events)} events")
             
+            if self.incremental:
+                self.events = [event for event in self.events if self.is_new_event(event)]
+                self.counters['events_new'] = len(self.events)
+                print(f"{len(self.events)} events are newer than the last run")
+            
+            if self.drop_duplicates:
+                with self.metrics.stage('drop_duplicates') as stage:
+                    stage['items'] = len(self.events)
+                    self.events = [event for event in self.events
+                                   if event.get('type', '') not in DEDUP_EVENT_TYPES
+                                   or not self.is_duplicate_event(event)]
+                self.print_duplicate_events()
+            
             # Build bijective session_id -> student_id mapping
-            self.build_session_student_mapping()
+            with self.metrics.stage('session_mapping') as stage:
+                self.build_session_student_mapping()
+                stage['items'] = len(self.events)
             
             # Build AI help index for faster lookup
-            self.build_ai_help_index()
+            with self.metrics.stage('ai_help_index') as stage:
+                self.build_ai_help_index()
+                stage['items'] = len(self.events)
+            
+            # Only task boundary events are needed from here on; drop the raw dicts
+            self.events = [TaskEvent(event) for event in self.events
+                           if event.get('type', '') in TIME_BOUNDARY_EVENT_TYPES]
+            self.counters['task_events'] = len(self.events)
+            
+            # Re-process the open tail of each session from the previous run
+            self.events[:0] = self.open_events
             
         except FileNotFoundError:
             print(f"Error: File {self.json_file} not found")
@@ -74,25 +2232,266 @@ class GameDataCleaner:
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON: {e}")
             return False
+        except OSError as e:
+            print(f"Error reading events: {e}")
+            return False
         return True
     
+    def load_cached_data(self, limit: Optional[int] = None):
+        """Load events from the columnar cache, building it from the JSON on first use.
+        
+        The session mapping and event type filters run over the interned code
+        columns; only AI help and task boundary rows become event views.
+        """
+        parts = self.input_parts()
+        if len(parts) == 1:
+            cache = EventCache(parts[0] + '.cache')
+        else:
+            cache = EventCache(os.path.join(os.path.commonpath(parts), 'events.cache'))
+        if cache.open(parts):
+            self.counters['event_cache_hits'] += 1
+        else:
+            self.counters['event_cache_misses'] += 1
+            print("Building event cache...")
+            with self.metrics.stage('build_event_cache'):
+                cache.build(parts, self.iter_events())
+            if not cache.open(parts):
+                raise OSError(f"Could not open event cache {cache.cache_file}")
+        
+        if self.event_filter is not None:
+            # Only the postings and timestamp index entries of the selection are read
+            rows = self.event_filter.select_rows(cache)[:limit]
+            print(f"Selected {len(rows)} of {cache.rows} cached events where {self.event_filter.describe()}")
+        else:
+            rows = range(cache.rows if limit is None else min(limit, cache.rows))
+        if self.session_sample is not None:
+            rows = self.session_sample.sample_rows(cache, rows)
+        self.counters['events_read'] = len(rows)
+        print(f"Mapped {len(rows)} cached events from {cache.cache_file}")
+        if self.incremental:
+            rows = [row for row in rows if self.is_new_event(CachedEvent(cache, row))]
+            self.counters['events_new'] = len(rows)
+        
+        # Session -> student pairs straight from the code columns
+        session_codes, session_values = cache.code_columns['sessionId']
+        student_codes, student_values = cache.code_columns['studentId']
+        seen_pairs = {}
+        for row in rows:
+            session_code = session_codes[row]
+            student_code = student_codes[row]
+            if session_code < 0 or student_code < 0 or seen_pairs.get(session_code) == student_code:
+                continue
+            seen_pairs.setdefault(session_code, student_code)
+            self.add_session_student({'sessionId': session_values[session_code],
+                                      'studentId': student_values[student_code]})
+        
+        type_codes, type_values = cache.code_columns['type']
+        ai_help_codes = {code for code, value in enumerate(type_values) if value in AI_HELP_EVENT_TYPES}
+        boundary_codes = {code for code, value in enumerate(type_values) if value in TIME_BOUNDARY_EVENT_TYPES}
+        switch_codes = {code for code, value in enumerate(type_values) if value in SWITCH_EVENT_TYPES}
+        
+        self.events = []
+        for row in rows:
+            type_code = type_codes[row]
+            if type_code in boundary_codes:
+                event = CachedEvent(cache, row)
+                if not self.is_duplicate_event(event):
+                    self.events.append(event)
+            elif type_code in ai_help_codes:
+                event = CachedEvent(cache, row)
+                if not self.is_duplicate_event(event):
+                    self.add_ai_help_event(event)
+            elif type_code in switch_codes:
+                self.add_switch_event(CachedEvent(cache, row))
+        
+        self.counters['task_events'] = len(self.events)
+        self.print_duplicate_events()
+        print(f"Kept {len(self.events)} task events")
+        self.print_session_student_mapping()
+        print(f"Built AI help index with {len(self.ai_help_index)} session-task combinations")
+        
+        # Re-process the open tail of each session from the previous run
+        self.events[:0] = self.open_events
+    
+    def stream_data(self, limit: Optional[int] = None):
+        """Stream events from the JSON file, feeding the mapping and AI help index.
+        
+        Only task boundary events are retained (as compact TaskEvents) for
+        process_events; everything else is dropped once it has been indexed.
+        """
+        print("Streaming events data...")
+        self.events = []
+        
+        count = 0
+        for event in self.read_events(limit):
+            count += 1
+            if self.incremental:
+                if not self.is_new_event(event):
+                    continue
+                self.counters['events_new'] += 1
+            event_type = event.get('type', '')
+            if event_type in DEDUP_EVENT_TYPES and self.is_duplicate_event(event):
+                continue
+            self.add_session_student(event)
+            self.add_ai_help_event(event)
+            self.add_switch_event(event)
+            if event_type in TIME_BOUNDARY_EVENT_TYPES:
+                self.events.append(TaskEvent(event))
+        self.counters['events_read'] = count
+        self.counters['task_events'] = len(self.events)
+        
+        print(f"Streamed {count} events, kept {len(self.events)} task events")
+        self.print_duplicate_events()
+        self.print_session_student_mapping()
+        print(f"Built AI help index with {len(self.ai_help_index)} session-task combinations")
+        
+        # Re-process the open tail of each session from the previous run
+        self.events[:0] = self.open_events
+    
+    def is_duplicate_event(self, event, seen: Optional[set] = None) -> bool:
+        """Check whether a copy of a task or AI help event was already kept.
+        
+        eventTracker re-queues events whose addDoc() failed, so an event can
+        reach Firestore more than once; copies share event_fingerprint().
+        Fingerprints are added to seen (default: all fingerprints of this
+        run), so only the first copy is kept.
+        """
+        if not self.drop_duplicates:
+            return False
+        fingerprint = event_fingerprint(event)
+        if fingerprint is None:
+            return False
+        if seen is None:
+            seen = self.event_fingerprints
+        if fingerprint in seen:
+            self.counters['duplicate_events'] += 1
+            return True
+        seen.add(fingerprint)
+        return False
+    
+    def print_duplicate_events(self):
+        if self.counters['duplicate_events']:
+            print(f"Dropped {self.counters['duplicate_events']} duplicate task and AI help events")
+    
+    def read_events(self, limit: Optional[int] = None):
+        """Events for this run: those passing event_filter, then the sampled sessions' or the first limit."""
+        events = self.iter_events()
+        if self.event_filter is not None:
+            events = self.event_filter.select(events)
+        if self.session_sample is not None:
+            return iter(self.session_sample.sample(events))
+        return islice(events, limit)
+    
+    def input_parts(self) -> List[str]:
+        """Input files: json_file itself, or the parts in its directory or glob (none when pulling)."""
+        if self.firestore is not None:
+            return []
+        return resolve_input_parts(self.json_file)
+    
+    def iter_events(self):
+        """Events of every input part, in part order.
+        
+        With several parts, documents already read from the same or the
+        previous part (same Firestore _path, or _id without one) are skipped,
+        so consecutive pull windows that overlap can be combined while only
+        the keys of two parts are held. With read_workers above 1, parts are decoded
+        in a process pool, projected to INPUT_FIELDS, at most read_workers
+        parts ahead of the consumer. With a FirestoreSource, documents are
+        pulled instead, starting after the incremental watermark.
+        """
+        if self.firestore is not None:
+            yield from self.firestore.iter_events(after=self.watermark)
+            return
+        
+        parts = self.input_parts()
+        if len(parts) == 1:
+            yield from iter_input_part(parts[0])
+            return
+        
+        print(f"Reading {len(parts)} input parts...")
+        previous = set()
+        for events in self.decode_parts(parts):
+            seen = set()
+            for event in events:
+                key = event.get('_path') or event.get('_id')
+                if key is not None:
+                    # Kept as seen in this part either way, for an overlap spanning three parts
+                    if key in seen or key in previous:
+                        seen.add(key)
+                        self.counters['duplicate_documents'] += 1
+                        continue
+                    seen.add(key)
+                yield event
+            previous = seen
+        if self.counters['duplicate_documents']:
+            print(f"Skipped {self.counters['duplicate_documents']} documents repeated in overlapping parts")
+    
+    def decode_parts(self, parts: List[str]):
+        """Yield each part's events in order, decoding ahead in worker processes."""
+        if self.read_workers <= 1:
+            for part in parts:
+                yield iter_input_part(part)
+            return
+        
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=self.read_workers) as executor:
+            pending = deque()
+            for part in parts:
+                pending.append(executor.submit(read_input_part, part))
+                if len(pending) > self.read_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def is_new_event(self, event: Dict) -> bool:
+        """Check an event against the incremental watermark.
+        
+        New events also advance this run's clientTimestamp high-water mark and
+        the latest timeElapsedSeconds and clientTimestamp seen for their session.
+        """
+        client_timestamp = event.get('clientTimestamp') or 0
+        if self.watermark is not None and client_timestamp <= self.watermark:
+            return False
+        
+        if self.max_client_timestamp is None or client_timestamp > self.max_client_timestamp:
+            self.max_client_timestamp = client_timestamp
+        
+        session_id = event.get('sessionId')
+        if not session_id:
+            return True
+        if client_timestamp > self.session_last_seen.get(session_id, 0):
+            self.session_last_seen[session_id] = client_timestamp
+        elapsed = event.get('timeElapsedSeconds')
+        if elapsed is not None:
+            if session_id not in self.session_clock or elapsed > self.session_clock[session_id]:
+                self.session_clock[session_id] = elapsed
+        return True
+    
+    def add_session_student(self, event: Dict):
+        """Add an event's session_id -> student_id pair to the mapping."""
+        session_id = event.get('sessionId')
+        student_id = event.get('studentId')
+        
+        if session_id and student_id:
+            if session_id in self.session_to_student_map:
+                # Verify consistency
+                if self.session_to_student_map[session_id] != student_id:
+                    print(f"Warning: Session {session_id} mapped to multiple student IDs: "
+                          f"{self.session_to_student_map[session_id]} and {student_id}")
+            else:
+                self.session_to_student_map[session_id] = student_id
+    
     def build_session_student_mapping(self):
         """Build bijective mapping from session_id to student_id."""
         print("Building session-to-student mapping...")
         
         for event in self.events:
-            session_id = event.get('sessionId')
-            student_id = event.get('studentId')
-            
-            if session_id and student_id:
-                if session_id in self.session_to_student_map:
-                    # Verify consistency
-                    if self.session_to_student_map[session_id] != student_id:
-                        print(f"Warning: Session {session_id} mapped to multiple student IDs: "
-                              f"{self.session_to_student_map[session_id]} and {student_id}")
-                else:
-                    self.session_to_student_map[session_id] = student_id
+            self.add_session_student(event)
         
+        self.print_session_student_mapping()
+    
+    def print_session_student_mapping(self):
+        """Print the mapping size and a few sample entries."""
         print(f"Created mapping for {len(self.session_to_student_map)} sessions")
         
         # Show sample mapping
@@ -116,8 +2515,12 @@ class GameDataCleaner:
         """
         if not task_id or not isinstance(task_id, str):
             return None, None, None
+        
+        task = self.task_dimensions.get(task_id)
+        if task is not None:
+            return task
             
-        match = re.match(r'g([123])t(\d+)', task_id)
+        match = TASK_ID_PATTERN.match(task_id)
         if not match:
             return None, None, None
             
@@ -134,8 +2537,9 @@ class GameDataCleaner:
             level = 'Medium' 
         else:
             level = 'Hard'
-            
-        return task_type, level, task_num
+        
+        task = self.task_dimensions[task_id] = (task_type, level, task_num)
+        return task
     
     def get_student_condition(self, event: Dict) -> str:
         """Determine student condition from event data."""
@@ -158,318 +2562,1162 @@ class GameDataCleaner:
         else:
             return 'Unknown'
     
-    def parse_time_spent(self, current_event: Dict, events_list: List[Dict], current_idx: int) -> Optional[float]:
-        """Calculate time spent on a task by finding the next task event."""
-        current_timestamp = current_event.get('timeElapsedSeconds')
-        if current_timestamp is None:
-            return None
-            
-        # Look for the next task-related event for the same session
-        session_id = current_event.get('sessionId')
+    def build_session_event_index(self, sorted_events: List[Dict]):
+        """Build a per-session, time-ordered index of time boundary events.
+        
+        Maps each session_id to the positions (in sorted_events) of its
+        task_attempt/task_complete/page_switch events that carry a timestamp,
+        so the next boundary event of a session is a binary search away
+        instead of a forward scan over every other session's events.
+        """
+        self.session_event_index = defaultdict(list)
+        
+        for idx, event in enumerate(sorted_events):
+            if event.get('type', '') not in TIME_BOUNDARY_EVENT_TYPES:
+                continue
+            if event.get('timeElapsedSeconds') is None:
+                continue
+            self.session_event_index[event.get('sessionId')].append(idx)
+        
+        self.session_event_index = dict(self.session_event_index)
+    
+    def parse_time_spent(self, current_event: Dict, events_list: List[Dict], current_idx: int) -> Optional[float]:
+        """Calculate time spent on a task by finding the next task event.
+        
+        Requires build_session_event_index() to have been called on events_list.
+        """
+        current_timestamp = current_event.get('timeElapsedSeconds')
+        if current_timestamp is None:
+            return None
+            
+        # Look for the next task-related event for the same session
+        positions = self.session_event_index.get(current_event.get('sessionId'))
+        if not positions:
+            return None
+        
+        pos = bisect_right(positions, current_idx)
+        if pos == len(positions):
+            return None
+        
+        next_timestamp = events_list[positions[pos]]['timeElapsedSeconds']
+        time_diff = next_timestamp - current_timestamp
+        return max(0, time_diff)  # Ensure non-negative
+    
+    def ai_help_response(self, event: Dict, task_id: str):
+        """AI response text carried by an AI help event."""
+        if event.get('type') == 'ai_task_help':
+            # Get the AI suggestion based on task type
+            task_type_from_id = self.parse_task_id(task_id)[0] if task_id else None
+            
+            if task_type_from_id == 'counting':
+                # For counting tasks, look for suggestion in individual fields
+                suggestion_parts = []
+                for i in range(10):  # Check fields 0-9
+                    field_val = event.get(str(i), '')
+                    if field_val:
+                        suggestion_parts.append(str(field_val))
+                return ''.join(suggestion_parts) if suggestion_parts else event.get('response', '')
+        
+        # For slider/typing tasks and ai_help_response events, use the response field
+        return event.get('response', '')
+    
+    def add_ai_help_event(self, event: Dict):
+        """Add an AI help event to the index; other event types are ignored.
+        
+        Each (session_id, task_id) entry holds parallel lists of timestamps,
+        kept sorted, and the precomputed AI responses.
+        """
+        if event.get('type') not in AI_HELP_EVENT_TYPES:
+            return
+            
+        session_id = event.get('sessionId')
+        task_id = event.get('taskId', '') or event.get('currentTask', '')
+        
+        if session_id and task_id:
+            key = (session_id, task_id)
+            if key not in self.ai_help_index:
+                self.ai_help_index[key] = ([], [])
+            timestamps, responses = self.ai_help_index[key]
+            
+            timestamp = event.get('timeElapsedSeconds') or 0
+            position = bisect_right(timestamps, timestamp)
+            timestamps.insert(position, timestamp)
+            responses.insert(position, self.ai_help_response(event, task_id))
+    
+    def add_switch_event(self, event: Dict):
+        """Add a task, tab or jar refill switch to the switch index; other event types are ignored.
+        
+        The index only counts episode interruptions, so it stays empty unless episodes are grouped.
+        """
+        if not self.group_episodes or event.get('type') not in SWITCH_EVENT_TYPES:
+            return
+        session_id = event.get('sessionId')
+        timestamp = event.get('timeElapsedSeconds')
+        if session_id and timestamp is not None:
+            if session_id not in self.switch_index:
+                self.switch_index[session_id] = []
+            self.switch_index[session_id].append(timestamp)
+    
+    def count_interruptions(self, episode: TaskEpisode) -> int:
+        """Switches of the episode's session strictly between its first and last timed events."""
+        timestamps = self.switch_index.get(episode.session_id)
+        if not timestamps or episode.start_seconds is None:
+            return 0
+        return max(0, bisect_left(timestamps, episode.end_seconds) - bisect_right(timestamps, episode.start_seconds))
+    
+    def build_ai_help_index(self):
+        """Build an index of AI help events for faster lookup, and the switch index."""
+        print("Building AI help index...")
+        
+        for event in self.events:
+            self.add_ai_help_event(event)
+            self.add_switch_event(event)
+        
+        print(f"Built AI help index with {len(self.ai_help_index)} session-task combinations")
+    
+    def get_ai_help_data(self, session_id: str, task_id: str, timestamp: float) -> Tuple[bool, Optional[str]]:
+        """Find the AI help event nearest to a task attempt within the help window.
+        
+        Binary-searches the sorted timestamps of the (session_id, task_id)
+        entry; on a tie the earlier help event wins.
+        """
+        entry = self.ai_help_index.get((session_id, task_id))
+        if not entry:
+            return False, None
+        
+        timestamps, responses = entry
+        position = bisect_left(timestamps, timestamp)
+        
+        nearest = None
+        for candidate in (position - 1, position):
+            if 0 <= candidate < len(timestamps):
+                distance = abs(timestamp - timestamps[candidate])
+                if distance <= self.ai_help_window and (nearest is None or distance < nearest[0]):
+                    nearest = (distance, candidate)
+        
+        if nearest is None:
+            return False, None
+        
+        # Among help events at the same time, take the first one indexed
+        candidate = bisect_left(timestamps, timestamps[nearest[1]])
+        return True, responses[candidate]
+    
+    def process_events(self, require_student_id=True, workers: int = 1):
+        """Process all events and extract structured data.
+        
+        Args:
+            require_student_id: Skip sessions without a student ID mapping
+            workers: Number of processes; above 1, sessions are hash-partitioned
+                into shards that are cleaned in a process pool and merged back
+                in the same order as the serial path
+        """
+        print("Processing events...")
+        
+        if workers > 1:
+            self.process_events_parallel(require_student_id, workers)
+            return
+        
+        # Sort events by timestamp for proper time calculation
+        with self.metrics.stage('sort_events') as stage:
+            sorted_events = sorted(self.events, key=event_sort_key)
+            stage['items'] = len(sorted_events)
+        
+        # Index each session's boundary events once for time spent lookups
+        with self.metrics.stage('session_event_index') as stage:
+            self.build_session_event_index(sorted_events)
+            stage['items'] = len(sorted_events)
+        
+        add_record = self.record_sort.add if self.record_sort is not None else self.cleaned_data.append
+        with self.metrics.stage('clean_events') as stage:
+            for idx, event in enumerate(sorted_events):
+                cleaned_record = self.clean_event(event, sorted_events, idx, require_student_id)
+                if cleaned_record is not None:
+                    add_record(cleaned_record)
+            stage['items'] = len(sorted_events)
+    
+    def clean_event(self, event: Dict, sorted_events: List[Dict], idx: int,
+                    require_student_id: bool = True, time_spent=MISSING) -> Optional[CleanedRecord]:
+        """Extract a cleaned record from one event of the time-sorted event list.
+        
+        Returns None for events that are not task attempts/completions or that
+        lack the session, student or task information a record needs. The
+        fused pipeline passes time_spent (seconds) itself, without an event list.
+        """
+        event_type = event.get('type', '')
+        
+        # Only process task attempts and completions
+        if event_type not in ['task_attempt', 'task_complete']:
+            return None
+            
+        # Extract basic info
+        session_id = event.get('sessionId', '')
+        semester = event.get('currentSemester', '')
+        task_id = event.get('taskId', '') or event.get('currentTask', '')
+        
+        # Skip if no session ID
+        if not session_id:
+            return None
+        
+        # Sessions already cleaned have their student (and condition) in the session dimension
+        session = self.session_dimensions.get(session_id)
+        if session is not None:
+            student_id = session.student_id
+        else:
+            student_id = self.get_student_id_from_session(session_id)  # Get actual student ID
+            
+        # If requiring student ID, skip sessions without mapping
+        if require_student_id and not student_id:
+            return None
+            
+        # Use session_id as fallback for student_id when not requiring student ID
+        if not student_id:
+            student_id = f"session_{session_id}"
+        
+        # Skip if no task ID
+        if not task_id:
+            return None
+            
+        # Parse task information
+        task_type, level, task_number = self.parse_task_id(task_id)
+        if not task_type:
+            return None
+        
+        section = event.get('section')
+        if session is None:
+            session = self.session_dimensions[session_id] = SessionDimension(
+                student_id, section, self.get_student_condition(event))
+            
+        # Get student responses and correct answers
+        student_response = event.get('userAnswer', '')
+        correct_response = event.get('correctAnswer', '')
+        
+        # Calculate time spent
+        if time_spent is MISSING:
+            time_spent_seconds = self.parse_time_spent(event, sorted_events, idx)
+        else:
+            time_spent_seconds = time_spent
+        time_spent_minutes = time_spent_seconds / 60 if time_spent_seconds else None
+        
+        # Get AI help information
+        timestamp = event.get('timeElapsedSeconds', 0)
+        ai_used, ai_response = self.get_ai_help_data(session_id, task_id, timestamp)
+        
+        # Get condition; it only depends on the section when there is one
+        if section and section == session.section:
+            condition = session.condition
+        else:
+            condition = self.get_student_condition(event)
+        
+        # Points earned and student learning
+        points_earned = event.get('pointsEarned', event.get('points', ''))
+        student_learning_goal = event.get('studentLearning', '')
+        
+        # Determine if this is a practice mode task
+        # Practice mode tasks have no semester (empty/null currentSemester)
+        is_practice_mode = not semester or semester == ""
+        if is_practice_mode:
+            session.add_practice_time(event.get('timeElapsedSeconds'))
+        
+        # Create cleaned record
+        cleaned_record = CleanedRecord(
+            student_id=student_id,
+            session_id=session_id,
+            semester=semester,
+            task_number=task_number,
+            task_type=task_type,
+            task_level=level,
+            task_id=task_id,
+            student_response=str(student_response) if student_response is not None else '',
+            correct_response=str(correct_response) if correct_response is not None else '',
+            ai_help_used=ai_used,
+            ai_response=ai_response or '',
+            time_spent_seconds=time_spent_seconds,
+            time_spent_minutes=time_spent_minutes,
+            condition=condition,
+            points_received=points_earned,
+            current_student_learning_goal=student_learning_goal,
+            is_practice_mode=is_practice_mode,
+            event_type=event_type,
+            timestamp=event.get('timestamp', ''),
+            time_elapsed_readable=event.get('readableTime', ''),
+            attempts=event.get('attempts', ''),
+            accuracy=event.get('accuracy', '')
+        )
+        
+        # Incremental runs re-clean open events, so they do not group episodes
+        if self.group_episodes and not self.incremental:
+            self.add_episode_record(session, cleaned_record, event.get('timeElapsedSeconds'))
+        
+        return cleaned_record
+    
+    def add_episode_record(self, session: SessionDimension, record: CleanedRecord, elapsed):
+        """Add a record to its session's task episode, starting a new one on a new task or after a completion.
         
-        for i in range(current_idx + 1, len(events_list)):
-            next_event = events_list[i]
-            
-            # Skip if different session
-            if next_event.get('sessionId') != session_id:
-                continue
-                
-            # Look for next task-related event
-            event_type = next_event.get('type', '')
-            if event_type in ['task_attempt', 'task_complete', 'page_switch']:
-                next_timestamp = next_event.get('timeElapsedSeconds')
-                if next_timestamp is not None:
-                    time_diff = next_timestamp - current_timestamp
-                    return max(0, time_diff)  # Ensure non-negative
-                    
-        return None
+        Records of a session must arrive in processing (time) order, as they do
+        from every processing path.
+        """
+        episode = session.episode
+        if episode is None or episode.completed or episode.task_id != record.task_id:
+            session.episodes += 1
+            episode = session.episode = TaskEpisode(record, session.episodes)
+            self.task_episodes.append(episode)
+        episode.add(record, elapsed)
     
-    def build_ai_help_index(self):
-        """Build an index of AI help events for faster lookup."""
-        print("Building AI help index...")
-        self.ai_help_index = {}
+    def process_events_parallel(self, require_student_id: bool, workers: int):
+        """Clean hash-partitioned session shards in a process pool and merge them."""
+        with self.metrics.stage('partition_sessions') as stage:
+            shards = self.partition_by_session(workers)
+            stage['items'] = len(self.events)
+        print(f"Cleaning {len(shards)} session shards with {workers} workers...")
         
-        for event in self.events:
-            if event.get('type') not in ['ai_task_help', 'ai_help_response']:
-                continue
-                
-            session_id = event.get('sessionId')
-            task_id = event.get('taskId', '') or event.get('currentTask', '')
-            timestamp = event.get('timeElapsedSeconds', 0)
-            
-            if session_id and task_id:
-                key = (session_id, task_id)
-                if key not in self.ai_help_index:
-                    self.ai_help_index[key] = []
-                self.ai_help_index[key].append(event)
+        tasks = [(self.json_file, shard_events, shard_map, shard_ai_index, self.ai_help_window, require_student_id,
+                  self.group_episodes)
+                 for shard_events, shard_map, shard_ai_index in shards]
+        from concurrent.futures import ProcessPoolExecutor
+        with self.metrics.stage('clean_shards') as stage:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                shard_results = list(executor.map(clean_shard, tasks))
+            stage['items'] = len(self.events)
         
-        print(f"Built AI help index with {len(self.ai_help_index)} session-task combinations")
-    
-    def get_ai_help_data(self, session_id: str, task_id: str, timestamp: float) -> Tuple[bool, Optional[str]]:
-        """Find AI help data for a specific task attempt using the index."""
-        ai_used = False
-        ai_response = None
-        
-        # Use the index for faster lookup
-        key = (session_id, task_id)
-        if key in self.ai_help_index:
-            # Look through AI events for this session-task combination
-            for event in self.ai_help_index[key]:
-                event_type = event.get('type', '')
-                event_timestamp = event.get('timeElapsedSeconds', 0)
-                
-                # Look for AI events within 60 seconds of the task timestamp
-                if abs(timestamp - event_timestamp) <= 60:
-                    ai_used = True
-                    
-                    if event_type == 'ai_task_help':
-                        # Get the AI suggestion based on task type
-                        task_type_from_id = self.parse_task_id(task_id)[0] if task_id else None
-                        
-                        if task_type_from_id == 'counting':
-                            # For counting tasks, look for suggestion in individual fields
-                            suggestion_parts = []
-                            for i in range(10):  # Check fields 0-9
-                                field_val = event.get(str(i), '')
-                                if field_val:
-                                    suggestion_parts.append(str(field_val))
-                            ai_response = ''.join(suggestion_parts) if suggestion_parts else event.get('response', '')
-                        else:
-                            # For slider/typing tasks, look for response field
-                            ai_response = event.get('response', '')
-                    
-                    elif event_type == 'ai_help_response':
-                        ai_response = event.get('response', '')
-                    
-                    break  # Found AI help for this task
-                
-        return ai_used, ai_response
+        # Shards hold disjoint sessions; their task dimensions are equal where they overlap
+        shard_records = []
+        for records, session_dimensions, task_dimensions, task_episodes in shard_results:
+            shard_records.append(records)
+            self.session_dimensions.update(session_dimensions)
+            self.task_dimensions.update(task_dimensions)
+            self.task_episodes.extend(task_episodes)
+        
+        # Each shard is already in (timestamp, input position) order
+        add_record = self.record_sort.add if self.record_sort is not None else self.cleaned_data.append
+        with self.metrics.stage('merge_shards') as stage:
+            for _, record in heapq.merge(*shard_records, key=itemgetter(0)):
+                add_record(record)
+            stage['items'] = sum(map(len, shard_records))
     
-    def process_events(self, require_student_id=True):
-        """Process all events and extract structured data."""
-        print("Processing events...")
+    def process_fused(self, require_student_id: bool = True, limit: Optional[int] = None) -> Optional[bool]:
+        """Clean the dump in one sequential read with per-session operators.
         
-        # Sort events by timestamp for proper time calculation
-        sorted_events = sorted(self.events, key=lambda x: x.get('timeElapsedSeconds', 0))
+        Each event updates the student mapping and is dispatched on its type:
+        AI help events go to the AI help index, boundary events fill in the
+        time spent of the session's previous timed boundary event. A record is
+        emitted once its time spent is known, the session clock has moved past
+        its AI help window and the session has a student mapping; the rest are
+        emitted at the end of the dump.
         
-        for idx, event in enumerate(sorted_events):
-            event_type = event.get('type', '')
-            
-            # Only process task attempts and completions
-            if event_type not in ['task_attempt', 'task_complete']:
-                continue
-                
-            # Extract basic info
-            session_id = event.get('sessionId', '')
-            student_id = self.get_student_id_from_session(session_id)  # Get actual student ID
-            semester = event.get('currentSemester', '')
-            task_id = event.get('taskId', '') or event.get('currentTask', '')
-            
-            # Skip if no session ID
-            if not session_id:
-                continue
+        This relies on each session's events arriving in time order, as in
+        dumps exported in clientTimestamp order. If an event arrives out of
+        order, all state is discarded and False is returned so the caller can
+        fall back to load_data() and process_events(). Returns None if the dump
+        cannot be read.
+        """
+        print("Processing events in a single fused pass...")
+        add_record = self.record_sort.add if self.record_sort is not None else self.cleaned_data.append
+        sessions = {}
+        count = 0
+        task_events = 0
+        pending = 0
+        max_pending = 0
+        
+        try:
+            for event in self.read_events(limit):
+                count += 1
+                self.add_session_student(event)
+                session_id = event.get('sessionId')
+                if not session_id:
+                    continue
                 
-            # If requiring student ID, skip sessions without mapping
-            if require_student_id and not student_id:
-                continue
+                state = sessions.get(session_id)
+                if state is None:
+                    state = sessions[session_id] = SessionState()
                 
-            # Use session_id as fallback for student_id when not requiring student ID
-            if not student_id:
-                student_id = f"session_{session_id}"
-            
-            # Skip if no task ID
-            if not task_id:
-                continue
+                event_type = event.get('type', '')
+                timestamp = event.get('timeElapsedSeconds')
+                if timestamp is not None:
+                    if state.clock is not None and timestamp < state.clock:
+                        return self.abandon_fused(session_id)
+                    if timestamp != state.clock:
+                        state.recent.clear()
+                    state.clock = timestamp
+                # Copies share their timestamp, so timed events only need the current clock's fingerprints
+                if event_type in DEDUP_EVENT_TYPES and self.is_duplicate_event(
+                        event, state.recent if timestamp is not None else None):
+                    continue
+                if (timestamp is None and event_type in AI_HELP_EVENT_TYPES and state.early_tasks
+                    and (event.get('taskId', '') or event.get('currentTask', '')) in state.early_tasks):
+                    # Indexed at time 0, within the window of an event already emitted
+                    return self.abandon_fused(session_id)
                 
-            # Parse task information
-            task_type, level, task_number = self.parse_task_id(task_id)
-            if not task_type:
-                continue
+                if event_type in AI_HELP_EVENT_TYPES:
+                    self.add_ai_help_event(event)
+                elif event_type in SWITCH_EVENT_TYPES:
+                    self.add_switch_event(event)
+                elif event_type in TIME_BOUNDARY_EVENT_TYPES:
+                    task_events += 1
+                    entry = [TaskEvent(event), MISSING if timestamp is not None else None]
+                    if timestamp is not None:
+                        if state.waiting is not None:
+                            state.waiting[1] = max(0, timestamp - state.waiting[0]['timeElapsedSeconds'])
+                        state.waiting = entry
+                    state.pending.append(entry)
+                    pending += 1
+                    max_pending = max(max_pending, pending)
                 
-            # Get student responses and correct answers
-            student_response = event.get('userAnswer', '')
-            correct_response = event.get('correctAnswer', '')
-            
-            # Calculate time spent
-            time_spent_seconds = self.parse_time_spent(event, sorted_events, idx)
-            time_spent_minutes = time_spent_seconds / 60 if time_spent_seconds else None
-            
-            # Get AI help information
-            timestamp = event.get('timeElapsedSeconds', 0)
-            ai_used, ai_response = self.get_ai_help_data(session_id, task_id, timestamp)
-            
-            # Get condition
-            condition = self.get_student_condition(event)
-            
-            # Points earned and student learning
-            points_earned = event.get('pointsEarned', event.get('points', ''))
-            student_learning_goal = event.get('studentLearning', '')
-            
-            # Determine if this is a practice mode task
-            # Practice mode tasks have no semester (empty/null currentSemester)
-            is_practice_mode = not semester or semester == ""
-            
-            # Create cleaned record
-            cleaned_record = {
-                'student_id': student_id,
-                'session_id': session_id,
-                'semester': semester,
-                'task_number': task_number,
-                'task_type': task_type,
-                'task_level': level,
-                'task_id': task_id,
-                'student_response': str(student_response) if student_response is not None else '',
-                'correct_response': str(correct_response) if correct_response is not None else '',
-                'ai_help_used': ai_used,
-                'ai_response': ai_response or '',
-                'time_spent_seconds': time_spent_seconds,
-                'time_spent_minutes': time_spent_minutes,
-                'condition': condition,
-                'points_received': points_earned,
-                'current_student_learning_goal': student_learning_goal,
-                'is_practice_mode': is_practice_mode,
-                'event_type': event_type,
-                'timestamp': event.get('timestamp', ''),
-                'time_elapsed_readable': event.get('readableTime', ''),
-                'attempts': event.get('attempts', ''),
-                'accuracy': event.get('accuracy', '')
-            }
+                if state.pending:
+                    pending -= self.emit_fused_records(session_id, state, require_student_id, add_record)
+        except FileNotFoundError:
+            print(f"Error: File {self.json_file} not found")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON: {e}")
+            return None
+        except OSError as e:
+            print(f"Error reading events: {e}")
+            return None
+        
+        for session_id, state in sessions.items():
+            self.emit_fused_records(session_id, state, require_student_id, add_record, final=True)
+        
+        self.counters['events_read'] = count
+        self.counters['task_events'] = task_events
+        self.counters['fused_max_pending_events'] = max_pending
+        print(f"Read {count} events once, {task_events} task events "
+              f"(at most {max_pending} waiting for their successor or AI help window)")
+        self.print_duplicate_events()
+        self.print_session_student_mapping()
+        print(f"Built AI help index with {len(self.ai_help_index)} session-task combinations")
+        return True
+    
+    def emit_fused_records(self, session_id: str, state: SessionState, require_student_id: bool,
+                           add_record, final: bool = False) -> int:
+        """Clean a session's pending events, in order, as far as they are settled.
+        
+        Returns the number of pending events consumed.
+        """
+        consumed = 0
+        mapped = session_id in self.session_to_student_map
+        while state.pending:
+            event, time_spent = state.pending[0]
+            if not final:
+                if time_spent is MISSING or not mapped:
+                    break
+                # A help event arriving later could still be the nearest one
+                if state.clock is None or state.clock <= (event.get('timeElapsedSeconds') or 0) + self.ai_help_window:
+                    break
+            elif time_spent is MISSING:
+                time_spent = None
             
-            self.cleaned_data.append(cleaned_record)
+            state.pending.popleft()
+            consumed += 1
+            if not final and (event.get('timeElapsedSeconds') or 0) <= self.ai_help_window:
+                if state.early_tasks is None:
+                    state.early_tasks = set()
+                state.early_tasks.add(event.get('taskId', '') or event.get('currentTask', ''))
+            record = self.clean_event(event, None, None, require_student_id, time_spent=time_spent)
+            if record is not None:
+                add_record(record)
+        return consumed
+    
+    def abandon_fused(self, session_id: str) -> bool:
+        """Discard the fused pipeline's state after an out-of-order event."""
+        print(f"Events of session {session_id} are not in time order; "
+              f"falling back to the multi-pass pipeline")
+        self.session_to_student_map = {}
+        self.ai_help_index = {}
+        self.session_dimensions = {}
+        self.task_episodes = []
+        self.switch_index = {}
+        self.cleaned_data = []
+        self.event_fingerprints = set()
+        if self.record_sort is not None:
+            self.record_sort = ExternalRecordSort(self.record_sort.run_size, self.record_sort.temp_dir)
+        self.counters.clear()
+        return False
+    
+    def partition_by_session(self, shards: int) -> List[Tuple[List, Dict, Dict]]:
+        """Split task events, student mapping and AI help index by sessionId hash.
+        
+        Events are tagged with their input position so shard output can be
+        merged back into the serial processing order.
+        """
+        partitions = [([], {}, {}) for _ in range(shards)]
+        
+        for position, event in enumerate(self.events):
+            session_id = event.get('sessionId')
+            if not session_id or event.get('type', '') not in TIME_BOUNDARY_EVENT_TYPES:
+                continue
+            if not isinstance(event, TaskEvent):
+                event = TaskEvent(event)
+            partitions[session_shard(session_id, shards)][0].append((position, event))
+        
+        for session_id, student_id in self.session_to_student_map.items():
+            partitions[session_shard(session_id, shards)][1][session_id] = student_id
+        
+        for key, entry in self.ai_help_index.items():
+            partitions[session_shard(key[0], shards)][2][key] = entry
+        
+        return [partition for partition in partitions if partition[0]]
     
-    def save_cleaned_data(self, output_file: str = 'cleaned_game_data.csv'):
-        """Save the cleaned data to CSV."""
+    def save_cleaned_data(self, output_file: str = 'cleaned_game_data.csv', columnar_file: Optional[str] = None):
+        """Save the cleaned data to CSV, and as a columnar table with one row group per semester if given."""
         if not self.cleaned_data:
             print("No cleaned data to save")
             return None
             
         # Sort data by student_id, semester, then timestamp
-        sorted_data = sorted(self.cleaned_data, key=lambda x: (
-            x['student_id'], 
-            int(x['semester']) if str(x['semester']).isdigit() else 0, 
-            x['timestamp']
-        ))
+        sorted_data = sorted(self.cleaned_data, key=record_sort_key)
         
         # Write to CSV
-        if sorted_data:
-            fieldnames = sorted_data[0].keys()
-            with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(sorted_data)
+        self.write_cleaned_records(sorted_data, output_file)
+        if columnar_file:
+            rows = write_columnar_table(columnar_file, sorted_data, CLEANED_FIELDNAMES, group_field='semester',
+                                        dictionary_fields=TABLE_DICTIONARY_FIELDS)
+            print(f"Saved {rows} records as typed columns to {columnar_file}")
+        return sorted_data
+    
+    def save_sorted_records(self, output_file: str, student_stats: Dict,
+                            distribution_stats: Optional[Dict] = None) -> List[Dict]:
+        """Merge the external sort's runs into the cleaned CSV.
+        
+        The per-student summary stats and, if given, the distribution sketches
+        are accumulated into student_stats and distribution_stats during the
+        merge, so no record is kept in memory afterwards.
+        
+        Returns:
+            The first few records in output order, as a sample
+        """
+        if not self.record_sort.count:
+            print("No cleaned data to save")
+            return None
+        
+        print(f"Merging {self.record_sort.spilled_runs} spilled runs of up to "
+              f"{self.record_sort.run_size} records...")
+        self.counters['spilled_runs'] = self.record_sort.spilled_runs
+        sample = []
+        
+        def add_record(record):
+            self.add_summary_record(student_stats, record)
+            if distribution_stats is not None:
+                self.add_distribution_record(distribution_stats, record)
+            if len(sample) < 5:
+                sample.append(record)
+        
+        self.write_cleaned_records(self.record_sort, output_file, add_record)
+        return sample
+    
+    def write_cleaned_records(self, records, output_file: str, on_record=None):
+        """Write records in output order to CSV, printing their distribution.
+        
+        The distribution counters are computed while writing, in the same pass.
+        """
+        total = 0
+        ai_help_count = 0
+        unique_students = set()
+        task_types = Counter()
+        conditions = Counter()
         
-        print(f"Saved {len(sorted_data)} records to {output_file}")
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(CLEANED_FIELDNAMES)
+            for record in records:
+                writer.writerow(record.values())
+                total += 1
+                unique_students.add(record.student_id)
+                task_types[record.task_type] += 1
+                conditions[record.condition] += 1
+                if record.ai_help_used:
+                    ai_help_count += 1
+                if on_record is not None:
+                    on_record(record)
+        
+        self.counters['cleaned_records'] = total
+        self.counters['ai_help_matched_records'] = ai_help_count
+        print(f"Saved {total} records to {output_file}")
         
         # Print summary statistics
         print("\n=== DATA SUMMARY ===")
-        print(f"Total records: {len(sorted_data)}")
+        print(f"Total records: {total}")
         
         # Count unique students and sessions
-        unique_students = set(record['student_id'] for record in sorted_data)
         print(f"Unique students: {len(unique_students)}")
         
         # Task type distribution
-        task_types = Counter(record['task_type'] for record in sorted_data)
         print("\nTask Type Distribution:")
         for task_type, count in task_types.most_common():
             print(f"  {task_type}: {count}")
         
         # Condition distribution
-        conditions = Counter(record['condition'] for record in sorted_data)
         print("\nCondition Distribution:")
         for condition, count in conditions.most_common():
             print(f"  {condition}: {count}")
         
         # AI Help Usage
-        ai_help_count = sum(1 for record in sorted_data if record['ai_help_used'])
-        no_ai_help_count = len(sorted_data) - ai_help_count
-        ai_help_rate = ai_help_count / len(sorted_data) if sorted_data else 0
+        no_ai_help_count = total - ai_help_count
+        ai_help_rate = ai_help_count / total if total else 0
         
         print("\nAI Help Usage:")
         print(f"Tasks with AI help: {ai_help_count}")
         print(f"Tasks without AI help: {no_ai_help_count}")
         print(f"AI help usage rate: {ai_help_rate:.2%}")
-        
-        return sorted_data
     
-    def create_summary_statistics(self, data: List[Dict], output_file: str = 'game_data_summary.csv'):
-        """Create summary statistics by student and condition."""
+    def create_summary_statistics(self, data: List[Dict], output_file: str = 'game_data_summary.csv',
+                                  group_by: Tuple[str, ...] = (), columnar_file: Optional[str] = None):
+        """Create summary statistics by student and condition.
+        
+        Args:
+            data: Cleaned records in output order
+            output_file: Summary CSV path
+            group_by: Extra record fields to group by, e.g. ('semester', 'task_level')
+            columnar_file: Also write the summary as a typed columnar table
+        """
         if not data:
             return None
         
-        # Group data by student_id and condition
-        student_stats = defaultdict(lambda: {
-            'student_id': '',
-            'condition': '',
-            'max_semester_reached': 0,
-            'total_tasks_attempted': 0,
-            'total_points_earned': 0,
-            'total_time_minutes': 0,
-            'ai_help_count': 0,
-            'task_types': set()
-        })
+        # Group data by student_id, condition and the group_by fields
+        student_stats = defaultdict(new_summary_stats)
         
         for record in data:
-            key = (record['student_id'], record['condition'])
-            stats = student_stats[key]
-            
-            stats['student_id'] = record['student_id']
-            stats['condition'] = record['condition']
-            stats['max_semester_reached'] = max(stats['max_semester_reached'], 
-                                               int(record['semester']) if str(record['semester']).isdigit() else 0)
-            stats['total_tasks_attempted'] += 1
-            
-            # Handle points earned
-            try:
-                points = float(record['points_received']) if record['points_received'] else 0
-                stats['total_points_earned'] += points
-            except (ValueError, TypeError):
-                pass
-            
-            # Handle time spent
-            try:
-                time_minutes = float(record['time_spent_minutes']) if record['time_spent_minutes'] else 0
-                stats['total_time_minutes'] += time_minutes
-            except (ValueError, TypeError):
-                pass
+            self.add_summary_record(student_stats, record, group_by)
+        
+        return self.write_summary_statistics(student_stats.values(), output_file, group_by, columnar_file)
+    
+    def add_summary_record(self, student_stats: Dict, record: CleanedRecord, group_by: Tuple[str, ...] = ()):
+        """Accumulate one cleaned record into the per-(student, condition, *group_by) stats.
+        
+        Group values are matched as the cleaned CSV writes them, like the query service does.
+        """
+        student_id = record.student_id
+        condition = record.condition
+        key = (student_id, condition)
+        if group_by:
+            key += tuple(query_value(getattr(record, field)) for field in group_by)
+        stats = student_stats[key]
+        
+        stats['student_id'] = student_id
+        stats['condition'] = condition
+        for field in group_by:
+            stats[field] = getattr(record, field)
+        semester = record.semester
+        stats['max_semester_reached'] = max(stats['max_semester_reached'], 
+                                           int(semester) if str(semester).isdigit() else 0)
+        stats['total_tasks_attempted'] += 1
+        
+        # Handle points earned
+        points = record.points_received
+        try:
+            points = float(points) if points else 0
+            stats['total_points_earned'] += points
+        except (ValueError, TypeError):
+            pass
+        
+        # Handle time spent
+        time_minutes = record.time_spent_minutes
+        try:
+            time_minutes = float(time_minutes) if time_minutes else 0
+            stats['total_time_minutes'] += time_minutes
+        except (ValueError, TypeError):
+            pass
+        
+        # Count AI help
+        if record.ai_help_used:
+            stats['ai_help_count'] += 1
             
-            # Count AI help
-            if record['ai_help_used']:
-                stats['ai_help_count'] += 1
-                
-            # Track task types
-            if record['task_type']:
-                stats['task_types'].add(record['task_type'])
+        # Track task types
+        if record.task_type:
+            stats['task_types'].add(record.task_type)
+    
+    def write_summary_statistics(self, student_stats, output_file: str, group_by: Tuple[str, ...] = (),
+                                 columnar_file: Optional[str] = None) -> List[Dict]:
+        """Calculate derived metrics from accumulated stats and write the summary CSV (and table)."""
+        fieldnames = SUMMARY_FIELDNAMES[:2] + list(group_by) + SUMMARY_FIELDNAMES[2:]
         
         # Convert to final format and calculate derived metrics
         summary_records = []
-        for (student_id, condition), stats in student_stats.items():
-            stats['task_types_attempted'] = len(stats['task_types'])
-            stats['ai_help_rate'] = round(stats['ai_help_count'] / stats['total_tasks_attempted'], 3) if stats['total_tasks_attempted'] > 0 else 0
-            stats['avg_time_per_task'] = round(stats['total_time_minutes'] / stats['total_tasks_attempted'], 2) if stats['total_tasks_attempted'] > 0 else 0
-            
-            # Remove the set before saving to CSV
-            del stats['task_types']
-            summary_records.append(stats)
+        for stats in student_stats:
+            summary = {field: stats[field] for field in fieldnames if field in stats}
+            summary['task_types_attempted'] = len(stats['task_types'])
+            summary['ai_help_rate'] = round(stats['ai_help_count'] / stats['total_tasks_attempted'], 3) if stats['total_tasks_attempted'] > 0 else 0
+            summary['avg_time_per_task'] = round(stats['total_time_minutes'] / stats['total_tasks_attempted'], 2) if stats['total_tasks_attempted'] > 0 else 0
+            summary_records.append(summary)
         
         # Sort by student_id
         summary_records.sort(key=lambda x: x['student_id'])
         
         # Write summary to CSV
         if summary_records:
-            fieldnames = [
-                'student_id', 'condition', 'max_semester_reached',
-                'total_tasks_attempted', 'total_points_earned', 'total_time_minutes',
-                'ai_help_count', 'task_types_attempted', 'ai_help_rate', 'avg_time_per_task'
-            ]
-            
             with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
                 writer.writerows(summary_records)
+            if columnar_file:
+                write_columnar_table(columnar_file, summary_records, fieldnames, dictionary_fields=('condition',))
         
         print(f"\nSaved summary statistics to {output_file}")
         return summary_records
+    
+    def create_distribution_statistics(self, data: List[Dict],
+                                       output_file: str = 'game_data_distributions.csv') -> Optional[List[Dict]]:
+        """Sketch time spent, points and attempts by condition, task type, level and semester."""
+        if not data:
+            return None
+        
+        distribution_stats = defaultdict(new_distribution_stats)
+        for record in data:
+            self.add_distribution_record(distribution_stats, record)
+        return self.write_distribution_statistics(distribution_stats, output_file)
+    
+    def add_distribution_record(self, distribution_stats: Dict, record: CleanedRecord):
+        """Add one cleaned record's metrics to the sketches of its group."""
+        semester = int(record.semester) if str(record.semester).isdigit() else 0
+        sketches = distribution_stats[(record.condition, record.task_type, record.task_level, semester)]
+        for metric, value in zip(DISTRIBUTION_METRICS, self.distribution_values(record)):
+            value = distribution_value(value)
+            if value is not None:
+                sketches[metric].add(value)
+    
+    def write_distribution_statistics(self, distribution_stats: Dict, output_file: str) -> List[Dict]:
+        """Write count, mean, min, quantiles and max of every group's sketches."""
+        rows = []
+        for key in sorted(distribution_stats, key=lambda key: (str(key[0]), str(key[1]), str(key[2]), key[3])):
+            sketches = distribution_stats[key]
+            for metric in DISTRIBUTION_METRICS:
+                sketch = sketches[metric]
+                if not sketch.count:
+                    continue
+                row = dict(zip(DISTRIBUTION_KEY_FIELDS, key))
+                row.update({
+                    'metric': metric,
+                    'count': sketch.count,
+                    'mean': round(sketch.total / sketch.count, 3),
+                    'min': round(sketch.min, 3),
+                    'max': round(sketch.max, 3)
+                })
+                for q in DISTRIBUTION_QUANTILES:
+                    row[f"p{round(q * 100)}"] = round(sketch.quantile(q), 3)
+                rows.append(row)
+        
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=DISTRIBUTION_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+        
+        print(f"Saved distribution statistics for {len(distribution_stats)} groups to {output_file}")
+        return rows
+    
+    def save_dimensions(self, session_file: str = 'game_data_sessions.csv',
+                        task_file: str = 'game_data_tasks.csv') -> Tuple[List[Dict], List[Dict]]:
+        """Write the session and task dimension tables of the cleaned records.
+        
+        When resuming an incremental run the existing tables are merged in:
+        sessions and tasks cleaned in this run replace their rows, with
+        practice windows widened to cover the previous runs.
+        """
+        sessions = {session_id: session.row(session_id) for session_id, session in self.session_dimensions.items()}
+        tasks = {task_id: dict(zip(TASK_DIMENSION_FIELDNAMES, (task_id,) + task))
+                 for task_id, task in self.task_dimensions.items()}
+        if self.resumed:
+            for rows, dimension_file, key in ((sessions, session_file, 'session_id'), (tasks, task_file, 'task_id')):
+                if not os.path.exists(dimension_file):
+                    continue
+                with open(dimension_file, 'r', newline='', encoding='utf-8') as csvfile:
+                    for old in csv.DictReader(csvfile):
+                        row = rows.setdefault(old[key], old)
+                        if row is not old and key == 'session_id':
+                            self.merge_practice_window(row, old)
+        
+        session_rows = sorted(sessions.values(), key=lambda row: (str(row['student_id']), row['session_id']))
+        task_rows = sorted(tasks.values(), key=lambda row: (row['task_id'][:2], int(row['task_number']), row['task_id']))
+        for rows, dimension_file, fieldnames in ((session_rows, session_file, SESSION_DIMENSION_FIELDNAMES),
+                                                 (task_rows, task_file, TASK_DIMENSION_FIELDNAMES)):
+            with open(dimension_file, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+        
+        print(f"Saved {len(session_rows)} sessions to {session_file} and {len(task_rows)} tasks to {task_file}")
+        return session_rows, task_rows
+    
+    @staticmethod
+    def merge_practice_window(row: Dict, old: Dict):
+        """Widen a session row's practice window to cover a row written by a previous run."""
+        for field, pick in (('practice_start_seconds', min), ('practice_end_seconds', max)):
+            if old[field] == '':
+                continue
+            if row[field] is None or pick(row[field], float(old[field])) != row[field]:
+                row[field] = old[field]
+    
+    def save_task_episodes(self, output_file: str = 'game_data_episodes.csv') -> int:
+        """Write one row per task episode, by student, session and episode number.
+        
+        Returns:
+            The number of episodes written
+        """
+        for timestamps in self.switch_index.values():
+            timestamps.sort()
+        
+        episodes = sorted(self.task_episodes,
+                          key=lambda episode: (str(episode.student_id), episode.session_id, episode.number))
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(EPISODE_FIELDNAMES)
+            writer.writerows(episode.row(self.count_interruptions(episode)) for episode in episodes)
+        
+        completed = sum(1 for episode in episodes if episode.completed)
+        print(f"Saved {len(episodes)} task episodes ({completed} completed) to {output_file}")
+        return len(episodes)
+    
+    def load_state(self, state_file: str, require_student_id: bool = True):
+        """Enable incremental mode, restoring the state saved by a previous run.
+        
+        Only events with a clientTimestamp above the saved watermark are read
+        afterwards. Events that reach Firestore late with an older
+        clientTimestamp (offline flushes) are not picked up until a full run.
+        Without a usable state every event is processed and the outputs of
+        previous runs are overwritten rather than merged into.
+        """
+        self.incremental = True
+        
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            print(f"No incremental state in {state_file}, processing all events and rewriting the outputs")
+            return
+        
+        if (state.get('version') != STATE_VERSION or state.get('require_student_id') != require_student_id
+                or state.get('ai_help_window') != self.ai_help_window):
+            print(f"Incremental state in {state_file} does not match these options, "
+                  f"processing all events and rewriting the outputs")
+            return
+        
+        self.watermark = state['watermark']
+        self.session_to_student_map = state['session_to_student_map']
+        self.ai_help_index = {(session_id, task_id): (timestamps, responses)
+                              for session_id, task_id, timestamps, responses in state['ai_help_index']}
+        self.session_clock = state['session_clock']
+        self.session_last_seen = state['session_last_seen']
+        self.open_events = [TaskEvent(event) for event in state['open_events']]
+        self.open_records = state['open_records']
+        for stats in state['summary_stats']:
+            stats['task_types'] = set(stats['task_types'])
+            self.summary_stats[(stats['student_id'], stats['condition'])] = stats
+        for *key, sketches in state['distribution_stats']:
+            self.distribution_stats[tuple(key)] = {metric: QuantileSketch.from_state(sketch)
+                                                   for metric, sketch in sketches.items()}
+        self.resumed = True
+        
+        print(f"Resuming after clientTimestamp {self.watermark} with "
+              f"{len(self.open_events)} open events from {len(self.session_clock)} sessions")
+    
+    def split_open_records(self, require_student_id: bool = True) -> Tuple[List[Dict], List[Dict]]:
+        """Find the events whose cleaned records newer events may still change.
+        
+        A record stays open while its session has no student mapping, while it
+        is the session's last timed boundary event (its time spent needs the
+        next one), or while it is within the AI help window of the latest event
+        seen for the session. A session is closed once none of its events
+        arrived for SESSION_TIMEOUT_MS: its records are final, or dropped for
+        good when it has no mapping and a student ID is required.
+        
+        Returns:
+            Tuple of (open_events, open_records)
+        """
+        session_events = defaultdict(list)
+        for event in self.events:
+            if event.get('sessionId') and event.get('type', '') in TIME_BOUNDARY_EVENT_TYPES:
+                session_events[event['sessionId']].append(event)
+        
+        cutoff = self.session_cutoff()
+        open_events = []
+        open_records = []
+        for session_id, events in session_events.items():
+            last_seen = self.session_last_seen.get(session_id)
+            if cutoff is not None and last_seen is not None and last_seen < cutoff:
+                continue
+            mapped = session_id in self.session_to_student_map
+            
+            events.sort(key=event_sort_key)
+            self.build_session_event_index(events)
+            
+            positions = self.session_event_index.get(session_id)
+            last_idx = positions[-1] if positions else None
+            clock = self.session_clock.get(session_id)
+            
+            for idx, event in enumerate(events):
+                if mapped:
+                    elapsed = event.get('timeElapsedSeconds')
+                    if elapsed is None:
+                        continue
+                    if idx != last_idx and (clock is None or elapsed < clock - self.ai_help_window):
+                        continue
+                
+                open_events.append(project_event(event))
+                record = self.clean_event(event, events, idx, require_student_id)
+                if record is not None:
+                    open_records.append(record)
+        
+        return open_events, open_records
+    
+    def session_cutoff(self) -> Optional[int]:
+        """clientTimestamp before which a session's last event means it is finished."""
+        latest = max((timestamp for timestamp in (self.watermark, self.max_client_timestamp) if timestamp is not None),
+                     default=None)
+        return None if latest is None else latest - SESSION_TIMEOUT_MS
+    
+    def prune_finished_sessions(self, open_events: List[Dict]):
+        """Forget the mapping, clock and AI help of sessions closed by split_open_records.
+        
+        Keeps the state proportional to the sessions still running rather
+        than to every session ever seen.
+        """
+        cutoff = self.session_cutoff()
+        if cutoff is None:
+            return
+        active = {session_id for session_id, last_seen in self.session_last_seen.items() if last_seen >= cutoff}
+        active.update(event['sessionId'] for event in open_events)
+        self.session_to_student_map = {session_id: student_id for session_id, student_id
+                                       in self.session_to_student_map.items() if session_id in active}
+        self.ai_help_index = {key: value for key, value in self.ai_help_index.items() if key[0] in active}
+        self.session_clock = {session_id: clock for session_id, clock in self.session_clock.items()
+                              if session_id in active}
+        self.session_last_seen = {session_id: last_seen for session_id, last_seen in self.session_last_seen.items()
+                                  if session_id in active}
+    
+    def save_incremental(self, output_file: str, summary_file: str, distribution_file: Optional[str],
+                         state_file: str, require_student_id: bool = True) -> Optional[List[Dict]]:
+        """Merge this run's records into the cleaned CSV and summaries, then save state.
+        
+        Rows written for the previous run's open records are replaced by their
+        re-derived versions. Records that can no longer change are folded into
+        the persistent summary stats and distribution sketches; open ones are
+        only added to this run's summary and distribution output. The sketches
+        are kept even without a distribution_file, so a later run can write
+        distributions covering every run.
+        """
+        open_events, open_records = self.split_open_records(require_student_id)
+        self.prune_finished_sessions(open_events)
+        
+        # Fold closed records into the persistent summary stats
+        pending = Counter(csv_row(record) for record in open_records)
+        for record in self.cleaned_data:
+            row = csv_row(record)
+            if pending[row]:
+                pending[row] -= 1
+            else:
+                self.add_summary_record(self.summary_stats, record)
+                self.add_distribution_record(self.distribution_stats, record)
+        
+        sorted_data = self.merge_cleaned_csv(output_file)
+        
+        # Summary covers every row in the CSV: closed stats plus open records
+        student_stats = defaultdict(new_summary_stats)
+        for key, stats in self.summary_stats.items():
+            student_stats[key] = dict(stats, task_types=set(stats['task_types']))
+        for record in open_records:
+            self.add_summary_record(student_stats, record)
+        if student_stats:
+            self.write_summary_statistics(student_stats.values(), summary_file)
+        
+        # Sketches merge exactly, so closed sketches plus open records give the full distributions
+        if distribution_file:
+            distribution_stats = defaultdict(new_distribution_stats)
+            for key, sketches in self.distribution_stats.items():
+                for metric, sketch in sketches.items():
+                    distribution_stats[key][metric].merge(sketch)
+            for record in open_records:
+                self.add_distribution_record(distribution_stats, record)
+            if distribution_stats:
+                self.write_distribution_statistics(distribution_stats, distribution_file)
+        
+        watermark = self.watermark
+        if self.max_client_timestamp is not None and (watermark is None or self.max_client_timestamp > watermark):
+            watermark = self.max_client_timestamp
+        
+        state = {
+            'version': STATE_VERSION,
+            'require_student_id': require_student_id,
+            'ai_help_window': self.ai_help_window,
+            'watermark': watermark,
+            'session_to_student_map': self.session_to_student_map,
+            'ai_help_index': [[session_id, task_id, timestamps, responses]
+                              for (session_id, task_id), (timestamps, responses) in self.ai_help_index.items()],
+            'session_clock': self.session_clock,
+            'session_last_seen': self.session_last_seen,
+            'open_events': open_events,
+            'open_records': [dict(record) for record in open_records],
+            'summary_stats': [dict(stats, task_types=sorted(stats['task_types']))
+                              for stats in self.summary_stats.values()],
+            'distribution_stats': [[*key, {metric: sketch.to_state() for metric, sketch in sketches.items()}]
+                                   for key, sketches in self.distribution_stats.items()]
+        }
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_file, state_file)
+        
+        print(f"Saved incremental state to {state_file} (watermark {watermark}, "
+              f"{len(open_events)} open events)")
+        return sorted_data
+    
+    def metrics_details(self) -> Dict:
+        """Counters and index sizes for the metrics report."""
+        return {
+            'input': self.input_details(),
+            'counters': dict({'cleaned_records': len(self.cleaned_data),
+                              'ai_help_matched_records': sum(1 for record in self.cleaned_data
+                                                             if record['ai_help_used'])}, **self.counters),
+            'indexes': {
+                'session_to_student_map': len(self.session_to_student_map),
+                'ai_help_keys': len(self.ai_help_index),
+                'ai_help_events': sum(len(timestamps) for timestamps, _ in self.ai_help_index.values()),
+                'session_event_index_sessions': len(self.session_event_index),
+                'session_event_index_positions': sum(len(positions)
+                                                     for positions in self.session_event_index.values()),
+                'incremental_open_events': len(self.open_events),
+            },
+        }
+    
+    def input_details(self) -> Dict:
+        """Input path, its parts and their total size, or the Firestore pull's pages."""
+        if self.firestore is not None:
+            return {'file': self.firestore.describe(), 'pages': self.firestore.pages,
+                    'documents': self.firestore.documents, 'retried_requests': self.firestore.retries}
+        try:
+            parts = [part for part in self.input_parts() if os.path.exists(part)]
+        except FileNotFoundError:
+            parts = []
+        return {'file': self.json_file, 'parts': len(parts),
+                'bytes': sum(os.path.getsize(part) for part in parts)}
+    
+    def merge_cleaned_csv(self, output_file: str) -> List[Dict]:
+        """Merge this run's records into an existing sorted cleaned CSV.
+        
+        Streams the existing rows, dropping those written for the previous
+        run's open records, and merges the new records in sorted order. An
+        existing CSV is only merged into when resuming from saved state;
+        otherwise this run's records replace it.
+        
+        Returns:
+            This run's records in output order
+        """
+        sorted_data = sorted(self.cleaned_data, key=record_sort_key)
+        stale = Counter(csv_row(record) for record in self.open_records)
+        
+        def kept_rows(reader, header):
+            for row in reader:
+                values = tuple(row)
+                if stale[values]:
+                    stale[values] -= 1
+                    continue
+                yield dict(zip(header, row))
+        
+        fieldnames = list(sorted_data[0].keys()) if sorted_data else None
+        temp_file = output_file + '.tmp'
+        written = 0
+        existing = None
+        if self.resumed and os.path.exists(output_file):
+            existing = open(output_file, 'r', newline='', encoding='utf-8')
+        try:
+            rows = iter(())
+            if existing is not None:
+                reader = csv.reader(existing)
+                header = next(reader, None)
+                if header:
+                    fieldnames = fieldnames or header
+                    rows = kept_rows(reader, header)
+            
+            if fieldnames is None:
+                print("No cleaned data to save")
+                return sorted_data
+            
+            with open(temp_file, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                writer.writeheader()
+                for record in heapq.merge(rows, sorted_data, key=record_sort_key):
+                    writer.writerow(record)
+                    written += 1
+        finally:
+            if existing is not None:
+                existing.close()
+        os.replace(temp_file, output_file)
+        
+        print(f"Merged {len(sorted_data)} new or updated records into {output_file} ({written} total)")
+        return sorted_data
+
+def clean_shard(task: Tuple) -> Tuple[List[Tuple[Tuple, Dict]], Dict, Dict, List]:
+    """Process pool worker: clean one session shard.
+    
+    Returns (sort key, record) pairs in processing order, where the sort key
+    is (timestamp, input position) so shards merge back deterministically,
+    with the shard's session and task dimensions and task episodes.
+    """
+    json_file, tagged_events, session_map, ai_help_index, ai_help_window, require_student_id, group_episodes = task
+    
+    cleaner = GameDataCleaner(json_file, ai_help_window)
+    cleaner.group_episodes = group_episodes
+    cleaner.session_to_student_map = session_map
+    cleaner.ai_help_index = ai_help_index
+    
+    tagged_events.sort(key=lambda tagged: event_sort_key(tagged[1]))
+    sorted_events = [event for _, event in tagged_events]
+    cleaner.build_session_event_index(sorted_events)
+    
+    results = []
+    for idx, (position, event) in enumerate(tagged_events):
+        record = cleaner.clean_event(event, sorted_events, idx, require_student_id)
+        if record is not None:
+            results.append(((event_sort_key(event), position), record))
+    return results, cleaner.session_dimensions, cleaner.task_dimensions, cleaner.task_episodes
+
+def socket_path_free(path: str) -> bool:
+    """Whether a Unix socket can be created at path: nothing is there, or a stale socket."""
+    return not os.path.exists(path) or stat.S_ISSOCK(os.stat(path).st_mode)
+
+
+def serve_queries(index: RecordIndex, address: str, allowed_origin: Optional[str] = None):
+    """Answer JSON queries over the index until interrupted.
+    
+    address is PORT or HOST:PORT for HTTP on TCP (HOST defaults to
+    127.0.0.1), or unix:PATH for HTTP on a Unix socket. Browsers only let
+    pages from allowed_origin, if given, read the answers.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(QueryRequestHandler, BaseHTTPRequestHandler):
+        pass
+    
+    if address.startswith('unix:'):
+        from socketserver import ThreadingMixIn, UnixStreamServer
+        
+        class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+            """HTTP over a Unix socket, for clients on the same machine only."""
+            daemon_threads = True
+        
+        path = address[len('unix:'):]
+        if not socket_path_free(path):
+            print(f"Not serving: {path} exists and is not a socket")
+            return
+        if os.path.exists(path):
+            os.remove(path)  # Left behind by a service that did not stop cleanly
+        server = ThreadingUnixHTTPServer(path, Handler)
+        location = f"unix socket {path}"
+    else:
+        host, _, port = address.rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+        location = f"http://{host or '127.0.0.1'}:{server.server_address[1]}/"
+        path = None
+    server.index = index
+    server.allowed_origin = allowed_origin
+    
+    print(f"\nServing queries over {len(index.records)} records on {location} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping query service")
+    finally:
+        server.server_close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
 
 def main():
     """Main function to run the data cleaning process."""
@@ -477,12 +3725,182 @@ def main():
     
     # Check command line arguments
     sample_size = None
+    sample_sessions = None
+    seed = 0
     include_all_sessions = False
+    streaming = False
+    incremental = False
+    use_cache = False
+    summary_by = ()
+    ai_help_window = AI_HELP_WINDOW_SECONDS
+    workers = 1
+    input_path = 'data/dump_events.json'
+    read_workers = 1
+    metrics_file = None
+    profile_stages = ()
+    trace_memory = False
+    spill_records = None
+    fused = False
+    keep_duplicates = False
+    serve_address = None
+    serve_origin = None
+    since = until = section = student = None
+    columnar = False
+    distributions = dimensions = episodes = False
+    firestore = None
+    firestore_page_size = FIRESTORE_PAGE_SIZE
+    firestore_requests = FIRESTORE_REQUESTS
+    collection_group = False
     
-    for arg in sys.argv[1:]:
+    args = iter(sys.argv[1:])
+    for arg in args:
         if arg == "--all-sessions":
             include_all_sessions = True
             print("Including all sessions (even without student ID mapping)...")
+        elif arg == "--stream":
+            streaming = True
+            print("Streaming events with bounded memory...")
+        elif arg == "--keep-duplicates":
+            keep_duplicates = True
+            print("Keeping task and AI help events logged more than once...")
+        elif arg == "--cache":
+            use_cache = True
+            print("Using the columnar event cache...")
+        elif arg == "--columnar":
+            columnar = True
+            print("Also writing the cleaned data and summary as typed columnar tables...")
+        elif arg == "--distributions":
+            distributions = True
+        elif arg == "--dimensions":
+            dimensions = True
+        elif arg == "--episodes":
+            episodes = True
+        elif arg == "--fused":
+            fused = True
+            print("Cleaning in a single fused pass when events are in time order...")
+        elif arg == "--ai-window":
+            value = next(args, '')
+            try:
+                ai_help_window = float(value)
+            except ValueError:
+                ai_help_window = -1
+            if ai_help_window < 0:
+                print("--ai-window requires a non-negative number of seconds")
+                return
+            print(f"Matching AI help within {ai_help_window:g} seconds of each task event...")
+        elif arg == "--summary-by":
+            summary_by = tuple(field for field in next(args, '').split(',') if field)
+            if not summary_by:
+                print("--summary-by requires a comma-separated list of record fields")
+                return
+            unknown = [field for field in summary_by if field not in CLEANED_FIELDNAMES]
+            if unknown:
+                print(f"Unknown --summary-by fields: {', '.join(unknown)}")
+                print(f"Record fields: {', '.join(CLEANED_FIELDNAMES)}")
+                return
+        elif arg == "--incremental":
+            incremental = True
+            print("Processing only events newer than the last incremental run...")
+        elif arg == "--workers":
+            value = next(args, '')
+            if not value.isdigit() or int(value) < 1:
+                print("--workers requires a positive number of processes")
+                return
+            workers = int(value)
+            print(f"Cleaning with {workers} worker processes...")
+        elif arg == "--input":
+            input_path = next(args, '')
+            if not input_path:
+                print("--input requires a dump file, directory or glob of parts")
+                return
+        elif arg == "--firestore":
+            firestore = next(args, '')
+            if not firestore or firestore.count('/') > 1:
+                print("--firestore requires PROJECT or PROJECT/COLLECTION")
+                return
+        elif arg == "--collection-group":
+            collection_group = True
+        elif arg in ("--firestore-page-size", "--firestore-requests"):
+            value = next(args, '')
+            if not value.isdigit() or int(value) < 1:
+                print(f"{arg} requires a positive number")
+                return
+            if arg == "--firestore-page-size":
+                firestore_page_size = int(value)
+            else:
+                firestore_requests = int(value)
+        elif arg == "--read-workers":
+            value = next(args, '')
+            if not value.isdigit() or int(value) < 1:
+                print("--read-workers requires a positive number of processes")
+                return
+            read_workers = int(value)
+            print(f"Decoding input parts with {read_workers} worker processes...")
+        elif arg == "--metrics-out":
+            metrics_file = next(args, '')
+            if not metrics_file:
+                print("--metrics-out requires a report file name")
+                return
+        elif arg == "--profile":
+            profile_stages = tuple(stage for stage in next(args, '').split(',') if stage)
+            if not profile_stages:
+                print("--profile requires a comma-separated list of stages (or 'all')")
+                return
+        elif arg == "--trace-memory":
+            trace_memory = True
+        elif arg == "--spill-records":
+            value = next(args, '')
+            if not value.isdigit() or int(value) < 1:
+                print("--spill-records requires a positive number of records per sorted run")
+                return
+            spill_records = int(value)
+            print(f"Sorting cleaned records in spilled runs of {spill_records}...")
+        elif arg == "--serve":
+            serve_address = next(args, '')
+            if not (serve_address.startswith('unix:') and len(serve_address) > len('unix:')
+                    or serve_address.rpartition(':')[2].isdigit()):
+                print("--serve requires PORT, HOST:PORT or unix:PATH")
+                return
+            if serve_address.startswith('unix:') and not socket_path_free(serve_address[len('unix:'):]):
+                print(f"--serve: {serve_address[len('unix:'):]} exists and is not a socket")
+                return
+        elif arg == "--serve-origin":
+            serve_origin = next(args, '').rstrip('/')
+            if not serve_origin.startswith(('http://', 'https://')):
+                print("--serve-origin requires an origin such as http://localhost:5173")
+                return
+        elif arg in ("--since", "--until"):
+            value = next(args, '')
+            try:
+                epoch_ms = parse_epoch_ms(value)
+            except ValueError:
+                print(f"{arg} requires epoch milliseconds or an ISO date/time, e.g. 2025-08-27 or 2025-08-27T14:00")
+                return
+            if arg == "--since":
+                since = epoch_ms
+            else:
+                until = epoch_ms
+        elif arg in ("--section", "--student"):
+            value = next(args, '')
+            if not value:
+                print(f"{arg} requires a value")
+                return
+            if arg == "--section":
+                section = value
+            else:
+                student = value
+        elif arg == "--sample-sessions":
+            value = next(args, '')
+            if not value.isdigit() or int(value) < 1:
+                print("--sample-sessions requires a positive number of sessions")
+                return
+            sample_sessions = int(value)
+        elif arg == "--seed":
+            value = next(args, '')
+            if not value.isdigit():
+                print("--seed requires a non-negative integer")
+                return
+            seed = int(value)
         elif arg.isdigit():
             sample_size = int(arg)
             print(f"Processing first {sample_size} events only...")
@@ -490,10 +3908,55 @@ def main():
             print("Usage: python clean-data.py [options] [sample_size]")
             print("Options:")
             print("  --all-sessions  Include all sessions even without student ID mapping")
+            print("  --input PATH    Dump file, or directory/glob of .json, .jsonl and .gz parts (default: data/dump_events.json)")
+            print("  --read-workers N  Decode input parts in N parallel processes")
+            print("  --firestore PROJECT[/COLLECTION]  Pull events (default collection: events) from Firestore instead")
+            print("                  of a dump; uses FIRESTORE_EMULATOR_HOST or FIRESTORE_ACCESS_TOKEN")
+            print("  --collection-group  Pull every collection named COLLECTION, like dump.js's COLLECTION_GROUP")
+            print(f"  --firestore-page-size N, --firestore-requests N  Documents per page (default: {FIRESTORE_PAGE_SIZE}),")
+            print(f"                  page requests in flight (default: {FIRESTORE_REQUESTS})")
+            print("  --stream        Parse events incrementally, keeping only the fields used")
+            print("  --workers N     Clean sessions in N parallel processes")
+            print("  --incremental   Process only events newer than the last run and update the CSVs in place")
+            print("  --since T, --until T  Only events with T <= clientTimestamp < T (epoch ms or ISO date/time, UTC)")
+            print("  --section S         Only sessions in section S (e.g. '01A-Checkpoint')")
+            print("  --student ID        Only sessions of student ID")
+            print("  --sample-sessions N  Keep every event of N sessions sampled across conditions (instead of sample_size)")
+            print("  --seed S            Random seed of --sample-sessions (default: 0)")
+            print("  --keep-duplicates  Keep copies of task and AI help events written twice by client retries")
+            print("  --cache         Read events from a memory-mapped cache, rebuilt when the dump changes")
+            print("  --fused         Clean in one sequential read if each session's events are in time order")
+            print("  --columnar      Also write the cleaned data (a row group per semester) and summary as typed,")
+            print("                  compressed column files (.cols) that load a column in milliseconds")
+            print("  --distributions  Also write time spent, points and attempts percentiles by condition and task")
+            print("  --dimensions    Also write session and task dimension tables (by session_id and task_id)")
+            print("  --episodes      Also write task episodes: attempts, outcome, dwell time and interruptions")
+            print(f"  --ai-window S   Match AI help within S seconds of a task event (default: {AI_HELP_WINDOW_SECONDS})")
+            print("  --summary-by F1,F2  Also write a summary grouped by extra record fields")
+            print("  --serve ADDRESS     After cleaning, answer JSON queries on PORT, HOST:PORT or unix:PATH")
+            print("  --serve-origin O    Let pages from origin O (e.g. http://localhost:5173) read the answers")
+            print("  --metrics-out FILE  Write per-stage time, memory, counters and index sizes as JSON")
+            print("  --profile S1,S2     Run these stages (or 'all') under cProfile; implies a metrics report")
+            print("  --trace-memory      Add tracemalloc peaks per stage to the metrics report (slow)")
+            print("  --spill-records N   Sort cleaned records on disk in runs of N (bounded memory output)")
             print("  -h, --help      Show this help message")
             print("Examples:")
             print("  python clean-data.py                # Process only sessions with student IDs")
             print("  python clean-data.py --all-sessions # Process ALL sessions")
+            print("  python clean-data.py --stream      # Process large dumps with bounded memory")
+            print("  python clean-data.py --workers 8   # Clean sessions in 8 processes")
+            print("  python clean-data.py --incremental # Daily refresh after re-exporting the dump")
+            print("  python clean-data.py --cache       # Skip JSON parsing when the dump is unchanged")
+            print("  python clean-data.py --input 'data/parts/*.jsonl.gz' --read-workers 4  # Partitioned export")
+            print("  python clean-data.py --fused       # One pass over a dump exported in clientTimestamp order")
+            print("  python clean-data.py --firestore qualtrics-game-backend --incremental  # Refresh pulling only new events")
+            print("  python clean-data.py --summary-by semester,task_level  # Per-semester, per-level summary")
+            print("  python clean-data.py --distributions --dimensions --episodes  # Every analysis table")
+            print("  python clean-data.py --serve 8765   # Then e.g. curl 'localhost:8765/summary?group_by=condition'")
+            print("  python clean-data.py --profile process_events  # Find what the slow stage spends time on")
+            print("  python clean-data.py --stream --spill-records 1000000  # Dumps whose records exceed RAM")
+            print("  python clean-data.py --cache --section 02A-Checkpoint --since 2025-08-28 --until 2025-08-29  # One lab day")
+            print("  python clean-data.py --sample-sessions 50 --seed 1  # Quick run on 50 whole sessions")
             print("  python clean-data.py 1000          # Process first 1000 events (student ID only)")
             print("  python clean-data.py --all-sessions 1000  # Process first 1000 events (all sessions)")
             return
@@ -502,33 +3965,169 @@ def main():
             print("Use -h or --help for usage information")
             return
     
-    # Initialize cleaner
-    cleaner = GameDataCleaner('data/dump_events.json')
-    
-    # Load and process data
-    if not cleaner.load_data():
+    if incremental and (sample_size or sample_sessions):
+        print("--incremental cannot be combined with a sample size")
+        return
+    filtered = since is not None or until is not None or section is not None or student is not None
+    if incremental and filtered:
+        print("--incremental cannot be combined with --since, --until, --section or --student")
+        return
+    if sample_size and sample_sessions:
+        print("--sample-sessions cannot be combined with a sample size")
+        return
+    if firestore and (use_cache or input_path != 'data/dump_events.json'):
+        print("--firestore cannot be combined with --cache or --input")
+        return
+    if fused and (incremental or use_cache or workers > 1):
+        print("--fused cannot be combined with --incremental, --cache or --workers")
+        return
+    if columnar and (incremental or spill_records):
+        print("--columnar cannot be combined with --incremental or --spill-records")
+        return
+    if episodes and incremental:
+        print("--episodes cannot be combined with --incremental")
+        return
+    if summary_by and incremental:
+        print("--summary-by cannot be combined with --incremental")
+        return
+    if spill_records and (incremental or summary_by):
+        print("--spill-records cannot be combined with --incremental or --summary-by")
+        return
+    if serve_address and (incremental or spill_records):
+        print("--serve cannot be combined with --incremental or --spill-records")
+        return
+    if serve_origin and not serve_address:
+        print("--serve-origin requires --serve")
         return
     
-    # Optionally limit to sample size
-    if sample_size:
-        cleaner.events = cleaner.events[:sample_size]
-        print(f"Limited to first {len(cleaner.events)} events")
-        
-    # Process events based on command line options
-    cleaner.process_events(require_student_id=not include_all_sessions)
-    
-    # Save cleaned data
     output_suffix = ""
     if include_all_sessions:
         output_suffix += "_all_sessions"
     if sample_size:
         output_suffix += f"_sample{sample_size}"
+    if since is not None:
+        output_suffix += f"_since{since}"
+    if until is not None:
+        output_suffix += f"_until{until}"
+    if section is not None:
+        output_suffix += "_section-" + re.sub(r'[^A-Za-z0-9]+', '-', section).strip('-')
+    if student is not None:
+        output_suffix += "_student-" + re.sub(r'[^A-Za-z0-9]+', '-', student).strip('-')
+    if sample_sessions:
+        output_suffix += f"_sessions{sample_sessions}_seed{seed}"
+    cleaned_file = f'data/cleaned_game_data{output_suffix}.csv'
+    summary_file = f'data/game_data_summary{output_suffix}.csv'
+    cleaned_table_file = f'data/cleaned_game_data{output_suffix}.cols' if columnar else None
+    summary_table_file = f'data/game_data_summary{output_suffix}.cols' if columnar else None
+    distribution_file = f'data/game_data_distributions{output_suffix}.csv' if distributions else None
+    session_file = f'data/game_data_sessions{output_suffix}.csv'
+    task_file = f'data/game_data_tasks{output_suffix}.csv'
+    episode_file = f'data/game_data_episodes{output_suffix}.csv'
+    state_file = f'data/clean_state{output_suffix}.json'
+    if (profile_stages or trace_memory) and not metrics_file:
+        metrics_file = f'data/clean_metrics{output_suffix}.json'
     
-    cleaned_data = cleaner.save_cleaned_data(f'data/cleaned_game_data{output_suffix}.csv')
+    # Initialize cleaner
+    cleaner = GameDataCleaner(input_path, ai_help_window=ai_help_window)
+    cleaner.read_workers = read_workers
+    if firestore:
+        # Time bounds are pushed down into the queries; EventFilter still applies them too
+        project, _, collection = firestore.partition('/')
+        cleaner.firestore = FirestoreSource(project, collection or 'events', since, until, firestore_page_size,
+                                            firestore_requests, collection_group)
+        print(f"Pulling events from {cleaner.firestore.describe()} with up to {firestore_requests} page requests in flight...")
+    cleaner.drop_duplicates = not keep_duplicates
+    cleaner.group_episodes = episodes
+    if filtered:
+        cleaner.event_filter = EventFilter(since, until, section, student)
+        print(f"Reading only events where {cleaner.event_filter.describe()}...")
+    if sample_sessions:
+        print(f"Sampling {sample_sessions} whole sessions, stratified by condition, with seed {seed}...")
+        cleaner.session_sample = SessionSampler(sample_sessions, seed, stratum=cleaner.get_student_condition)
+    cleaner.metrics = metrics = PipelineMetrics(bool(metrics_file), profile_stages, trace_memory)
+    if spill_records:
+        cleaner.record_sort = ExternalRecordSort(spill_records, temp_dir=os.path.dirname(cleaned_file))
+    
+    if incremental:
+        if os.path.exists(cleaned_file):
+            cleaner.load_state(state_file, require_student_id=not include_all_sessions)
+        else:
+            print(f"{cleaned_file} not found, starting a new incremental history")
+            cleaner.incremental = True
+    
+    # Clean in one pass over time-ordered dumps; otherwise load, index and process
+    fused_done = False
+    if fused:
+        with metrics.stage('process_fused') as stage:
+            fused_done = cleaner.process_fused(require_student_id=not include_all_sessions, limit=sample_size)
+            stage['items'] = cleaner.counters['events_read']
+        if fused_done is None:
+            return
+    
+    if not fused_done:
+        # Load and process data, reading only the first sample_size events if given
+        with metrics.stage('load_data') as stage:
+            loaded = cleaner.load_data(streaming=streaming, limit=sample_size, use_cache=use_cache)
+            stage['items'] = cleaner.counters['events_read']
+        if not loaded:
+            return
+        
+        # Process events based on command line options
+        with metrics.stage('process_events') as stage:
+            cleaner.process_events(require_student_id=not include_all_sessions, workers=workers)
+            stage['items'] = len(cleaner.events)
+    
+    # Save cleaned data
+    if incremental:
+        with metrics.stage('save_incremental') as stage:
+            cleaned_data = cleaner.save_incremental(cleaned_file, summary_file, distribution_file, state_file,
+                                                    require_student_id=not include_all_sessions)
+            stage['items'] = len(cleaned_data or ())
+    elif spill_records:
+        # Summary stats and distributions are accumulated while the sorted runs are merged
+        student_stats = defaultdict(new_summary_stats)
+        distribution_stats = defaultdict(new_distribution_stats) if distributions else None
+        with metrics.stage('save_cleaned_data') as stage:
+            cleaned_data = cleaner.save_sorted_records(cleaned_file, student_stats, distribution_stats)
+            stage['items'] = cleaner.counters['cleaned_records']
+    else:
+        with metrics.stage('save_cleaned_data') as stage:
+            cleaned_data = cleaner.save_cleaned_data(cleaned_file, cleaned_table_file)
+            stage['items'] = len(cleaned_data or ())
     
     if cleaned_data is not None:
         # Create summary statistics
-        cleaner.create_summary_statistics(cleaned_data, f'data/game_data_summary{output_suffix}.csv')
+        if spill_records:
+            with metrics.stage('create_summary_statistics'):
+                cleaner.write_summary_statistics(student_stats.values(), summary_file)
+            if distributions:
+                with metrics.stage('create_distribution_statistics'):
+                    cleaner.write_distribution_statistics(distribution_stats, distribution_file)
+        elif not incremental:
+            with metrics.stage('create_summary_statistics') as stage:
+                cleaner.create_summary_statistics(cleaned_data, summary_file, columnar_file=summary_table_file)
+                stage['items'] = len(cleaned_data)
+            if distributions:
+                with metrics.stage('create_distribution_statistics') as stage:
+                    cleaner.create_distribution_statistics(cleaned_data, distribution_file)
+                    stage['items'] = len(cleaned_data)
+        
+        if dimensions:
+            with metrics.stage('save_dimensions') as stage:
+                cleaner.save_dimensions(session_file, task_file)
+                stage['items'] = len(cleaner.session_dimensions) + len(cleaner.task_dimensions)
+        
+        if episodes:
+            with metrics.stage('save_task_episodes') as stage:
+                cleaner.save_task_episodes(episode_file)
+                stage['items'] = len(cleaner.task_episodes)
+        
+        grouped_summary_file = None
+        if summary_by and cleaned_data:
+            grouped_summary_file = f"data/game_data_summary_by_{'_'.join(summary_by)}{output_suffix}.csv"
+            with metrics.stage('grouped_summary') as stage:
+                cleaner.create_summary_statistics(cleaned_data, grouped_summary_file, group_by=summary_by)
+                stage['items'] = len(cleaned_data)
         
         print("\n=== SAMPLE DATA ===")
         for i, record in enumerate(cleaned_data[:5]):  # Show fewer records
@@ -541,11 +4140,37 @@ def main():
         
         print("\n=== DATA CLEANING COMPLETE ===")
         print("Output files created:")
-        print(f"1. data/cleaned_game_data{output_suffix}.csv - {'Sample' if sample_size else 'Full'} cleaned dataset")
-        print(f"2. data/game_data_summary{output_suffix}.csv - Summary statistics by student")
+        print(f"1. {cleaned_file} - {'Sample' if sample_size or sample_sessions else 'Filtered' if filtered else 'Full'} cleaned dataset")
+        print(f"2. {summary_file} - Summary statistics by student")
+        if incremental:
+            print(f"3. {state_file} - State for the next incremental run")
+        if distributions:
+            print(f"- {distribution_file} - Time spent, points and attempts percentiles by condition, task and semester")
+        if dimensions:
+            print(f"- {session_file} - Student, condition, section and practice window by session_id")
+            print(f"- {task_file} - Task type, level and number by task_id")
+        if episodes:
+            print(f"- {episode_file} - Attempts, outcome, dwell time and interruptions by task episode")
+        if columnar:
+            print(f"- {cleaned_table_file}, {summary_table_file} - Typed columnar tables of 1. and 2.")
+        if grouped_summary_file:
+            print(f"- {grouped_summary_file} - Summary statistics by student, {', '.join(summary_by)}")
         
-        if sample_size:
+        if sample_size or sample_sessions:
             print(f"\nTo process the full dataset, run: python clean-data.py")
+    
+    query_index = None
+    if serve_address and cleaned_data:
+        with metrics.stage('build_query_index') as stage:
+            query_index = RecordIndex(cleaned_data, cleaner.session_to_student_map, cleaner.ai_help_index)
+            stage['items'] = len(cleaned_data)
+    
+    if metrics.enabled:
+        metrics.print_stages()
+        metrics.save_report(metrics_file, cleaner.metrics_details())
+    
+    if query_index is not None:
+        serve_queries(query_index, serve_address, serve_origin)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Shared fixtures for the clean-data.py tests: small synthetic dumps from
+benchmarks/generate_dump.py and a runner that calls clean-data.py in a
+scratch directory laid out like the repo (data/dump_events.json in, CSVs out
+to data/).
+"""
+
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLEANER_PATH = os.path.join(REPO_DIR, 'clean-data.py')
+
+sys.path.insert(0, REPO_DIR)
+from benchmarks.generate_dump import generate_events, write_dump  # noqa: E402
+
+# Size of the generated test dumps; small enough to clean in well under a second
+TEST_SESSIONS = 40
+TEST_EVENTS_PER_SESSION = 60
+
+# Options turning on every optional output table
+ALL_OUTPUTS = ('--distributions', '--dimensions', '--episodes')
+
+
+class CleanerRun:
+    """A scratch directory with a data/dump_events.json to run clean-data.py in."""
+
+    def __init__(self, directory: str, dump_file: str):
+        self.directory = directory
+        self.data_dir = os.path.join(directory, 'data')
+        os.makedirs(self.data_dir, exist_ok=True)
+        shutil.copyfile(dump_file, os.path.join(self.data_dir, 'dump_events.json'))
+
+    def run(self, *args, env=None) -> str:
+        """Run clean-data.py with these arguments and return its output."""
+        result = subprocess.run([sys.executable, CLEANER_PATH, *args], cwd=self.directory,
+                                capture_output=True, text=True, env=env, timeout=120)
+        assert result.returncode == 0, result.stdout + result.stderr
+        return result.stdout
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def read(self, name: str) -> str:
+        with open(self.path(name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def outputs(self, suffix: str = '') -> dict:
+        """CSV contents by output name, without the suffix the options add."""
+        ending = suffix + '.csv'
+        return {os.path.basename(path)[:-len(ending)]: self.read(os.path.basename(path))
+                for path in glob.glob(os.path.join(self.data_dir, '*' + ending))}
+
+
+def write_events(events, output_file: str):
+    """Write events as a JSON array, like dump.js."""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(list(events), f, indent=2)
+
+
+@pytest.fixture(scope='session')
+def clean_data():
+    """clean-data.py imported as a module (its name is not a valid identifier)."""
+    spec = importlib.util.spec_from_file_location('clean_data', CLEANER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def dump_file(tmp_path_factory):
+    """A dump in Firestore (shuffled) order."""
+    output_file = str(tmp_path_factory.mktemp('dumps') / 'dump_events.json')
+    write_dump(output_file, TEST_SESSIONS, TEST_EVENTS_PER_SESSION, seed=7)
+    return output_file
+
+
+@pytest.fixture(scope='session')
+def ordered_dump_file(tmp_path_factory):
+    """The same events exported in clientTimestamp order."""
+    output_file = str(tmp_path_factory.mktemp('dumps') / 'dump_events.json')
+    events = sorted(generate_events(TEST_SESSIONS, TEST_EVENTS_PER_SESSION, seed=7),
+                    key=lambda event: event['clientTimestamp'])
+    write_events(events, output_file)
+    return output_file
+
+
+@pytest.fixture
+def make_run(tmp_path):
+    """Create CleanerRuns in fresh directories under tmp_path."""
+    count = 0
+
+    def make(dump: str) -> CleanerRun:
+        nonlocal count
+        count += 1
+        return CleanerRun(str(tmp_path / f'run{count}'), dump)
+    return make
+
+
+@pytest.fixture(scope='session')
+def default_outputs(tmp_path_factory, dump_file):
+    """CSVs of a default run over dump_file with every output, the reference other modes must match."""
+    run = CleanerRun(str(tmp_path_factory.mktemp('default')), dump_file)
+    run.run(*ALL_OUTPUTS)
+    return run.outputs()
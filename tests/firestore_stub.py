@@ -0,0 +1,184 @@
+"""
+Firestore runQuery Stub
+=======================
+
+A local stand-in for the Firestore REST API's runQuery endpoint, serving
+the events of a dump the way --firestore queries them: clientTimestamp
+range filters, ordering by (clientTimestamp, __name__) in either direction,
+limits and startAt cursors. Documents are encoded as Firestore values, with
+the event timestamp as a timestampValue. Requests can be made to fail with
+HTTP 503 to exercise the client's retries.
+
+Usage:
+    python tests/firestore_stub.py data/dump_events.json --port 8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python clean-data.py --firestore test-project
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# Comparison of a document's clientTimestamp with a filter value, by operator
+FILTER_OPERATORS = {
+    'GREATER_THAN': lambda value, bound: value > bound,
+    'GREATER_THAN_OR_EQUAL': lambda value, bound: value >= bound,
+    'LESS_THAN': lambda value, bound: value < bound,
+    'LESS_THAN_OR_EQUAL': lambda value, bound: value <= bound,
+}
+
+
+def encode_value(value, field: str = None) -> Dict:
+    """Encode a dump value as a Firestore REST API value."""
+    if value is None:
+        return {'nullValue': None}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'integerValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, str):
+        if field == 'timestamp' and value.endswith('Z'):
+            # dump.js exports Timestamps with milliseconds; the API returns microseconds
+            return {'timestampValue': value[:-1] + '000Z'}
+        return {'stringValue': value}
+    if isinstance(value, list):
+        return {'arrayValue': {'values': [encode_value(item) for item in value]}}
+    return {'mapValue': {'fields': {key: encode_value(item, key) for key, item in value.items()}}}
+
+
+def decode_number(value: Dict):
+    return int(value['integerValue']) if 'integerValue' in value else float(value['doubleValue'])
+
+
+class FirestoreStub:
+    """Serves a project's documents on localhost (an ephemeral port by default).
+
+    Used as a context manager, it serves from a background thread.
+
+    fail_once(predicate) makes each distinct query matching the predicate
+    fail with HTTP 503 the first time it is requested.
+    """
+
+    def __init__(self, events: List[Dict], project: str = 'test-project', port: int = 0):
+        self.documents_prefix = f"projects/{project}/databases/(default)/documents/"
+        self.documents = []  # (clientTimestamp, name, document), ordered like the queries
+        for event in events:
+            timestamp = event.get('clientTimestamp')
+            if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+                continue  # Firestore leaves these out of queries ordered by clientTimestamp
+            name = self.documents_prefix + event['_path']
+            fields = {field: encode_value(value, field) for field, value in event.items()
+                      if field not in ('_path', '_id')}
+            self.documents.append((timestamp, name, {'name': name, 'fields': fields}))
+        self.documents.sort(key=lambda document: document[:2])
+        self.queries = []  # Every structured query received, failed ones included
+        self.failed = 0
+        self.fail_predicate = None
+        self.failed_queries = set()
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                status, response = stub.handle(self.path, body.get('structuredQuery', {}))
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.thread = None
+
+    @property
+    def host(self) -> str:
+        """Value for FIRESTORE_EMULATOR_HOST."""
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def fail_once(self, predicate):
+        self.fail_predicate = predicate
+
+    def handle(self, path: str, query: Dict):
+        """Answer one runQuery request as (HTTP status, JSON body)."""
+        if path != f"/v1/{self.documents_prefix.rstrip('/')}:runQuery":
+            return 404, {'error': {'code': 404, 'message': f"Unknown path {path}"}}
+        key = json.dumps(query, sort_keys=True)
+        with self.lock:
+            self.queries.append(query)
+            if self.fail_predicate is not None and self.fail_predicate(query) and key not in self.failed_queries:
+                self.failed_queries.add(key)
+                self.failed += 1
+                return 503, {'error': {'code': 503, 'message': 'The service is currently unavailable.'}}
+
+        documents = [entry for entry in self.documents if self.matches(entry, query)]
+        orders = query.get('orderBy', [])
+        descending = bool(orders) and orders[0]['direction'] == 'DESCENDING'
+        if descending:
+            documents.reverse()
+        if 'startAt' in query:
+            values = query['startAt']['values']
+            cursor = (decode_number(values[0]), values[1]['referenceValue'])
+            after = (lambda entry: entry[:2] < cursor) if descending else (lambda entry: entry[:2] > cursor)
+            if query['startAt'].get('before'):
+                documents = [entry for entry in documents if after(entry) or entry[:2] == cursor]
+            else:
+                documents = [entry for entry in documents if after(entry)]
+        documents = documents[:query.get('limit', len(documents))]
+        # An empty result is a single entry without a document, as from the real API
+        return 200, [{'document': document, 'readTime': '2025-01-01T00:00:00Z'}
+                     for _, _, document in documents] or [{'readTime': '2025-01-01T00:00:00Z'}]
+
+    def matches(self, entry, query: Dict) -> bool:
+        timestamp, name, _ = entry
+        for source in query.get('from', []):
+            parts = name[len(self.documents_prefix):].split('/')
+            if parts[-2] != source['collectionId'] or (len(parts) > 2 and not source.get('allDescendants')):
+                return False
+        where = query.get('where')
+        filters = [] if where is None else [where] if 'fieldFilter' in where else where['compositeFilter']['filters']
+        for field_filter in filters:
+            field_filter = field_filter['fieldFilter']
+            if field_filter['field']['fieldPath'] != 'clientTimestamp':
+                raise ValueError(f"Unsupported filter on {field_filter['field']['fieldPath']}")
+            if not FILTER_OPERATORS[field_filter['op']](timestamp, decode_number(field_filter['value'])):
+                return False
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a dump through a local Firestore runQuery stub")
+    parser.add_argument('dump', help="dump_events.json to serve")
+    parser.add_argument('--project', default='test-project', help="project ID (default test-project)")
+    parser.add_argument('--port', type=int, default=8080, help="port (default 8080)")
+    args = parser.parse_args()
+
+    with open(args.dump, 'r', encoding='utf-8') as f:
+        stub = FirestoreStub(json.load(f), args.project, args.port)
+    print(f"Serving {len(stub.documents)} documents; set FIRESTORE_EMULATOR_HOST={stub.host}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
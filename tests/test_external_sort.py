@@ -0,0 +1,49 @@
+"""ExternalRecordSort (--spill-records) gives sorted() order with leveled run merges."""
+
+import random
+
+
+def make_records(clean_data, count: int, seed: int = 0):
+    rng = random.Random(seed)
+    records = []
+    for number in range(count):
+        values = dict.fromkeys(clean_data.CLEANED_FIELDNAMES)
+        values.update(student_id=f"30{rng.randrange(5):08d}", semester=rng.choice(('', 1, 2)),
+                      timestamp=f"2025-08-27T00:00:{rng.randrange(10):02d}.000Z", task_number=number)
+        records.append(clean_data.CleanedRecord(**values))
+    return records
+
+
+def test_matches_sorted(clean_data, monkeypatch, tmp_path):
+    monkeypatch.setattr(clean_data, 'SORT_MERGE_FAN_IN', 3)
+    records = make_records(clean_data, 500)
+    record_sort = clean_data.ExternalRecordSort(7, temp_dir=str(tmp_path))
+    for record in records:
+        record_sort.add(record)
+
+    # 71 runs of 7 merge into levels of 1, 2 and 3 runs below, never more than fan-in - 1 per level
+    assert record_sort.spilled_runs == 71
+    assert all(len(runs) < 3 for runs in record_sort.levels)
+    expected = [record.values() for record in sorted(records, key=clean_data.record_sort_key)]
+    assert [record.values() for record in record_sort] == expected
+
+
+def test_each_merge_rewrites_only_one_level(clean_data, monkeypatch, tmp_path):
+    monkeypatch.setattr(clean_data, 'SORT_MERGE_FAN_IN', 4)
+    written = []
+    write_run = clean_data.ExternalRecordSort.write_run
+
+    def counting_write_run(self, records):
+        records = list(records)
+        written.append(len(records))
+        return write_run(self, records)
+    monkeypatch.setattr(clean_data.ExternalRecordSort, 'write_run', counting_write_run)
+
+    records = make_records(clean_data, 640)
+    record_sort = clean_data.ExternalRecordSort(10, temp_dir=str(tmp_path))
+    for record in records:
+        record_sort.add(record)
+    # 64 spilled runs; then 16 merges of 40 records, 4 of 160 and one of all 640
+    assert sum(written) == 640 * 4
+    expected = [record.values() for record in sorted(records, key=clean_data.record_sort_key)]
+    assert [record.values() for record in record_sort] == expected
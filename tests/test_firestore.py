@@ -0,0 +1,77 @@
+"""Firestore pulls (--firestore) against the local runQuery stub."""
+
+import json
+import os
+
+import pytest
+
+from conftest import ALL_OUTPUTS
+from firestore_stub import FirestoreStub
+
+
+@pytest.fixture(scope='module')
+def dump_events(dump_file):
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def no_retry_delay(clean_data, monkeypatch):
+    """Retry failed page requests immediately."""
+    monkeypatch.setattr(clean_data, 'FIRESTORE_RETRY_DELAY_SECONDS', 0)
+
+
+def pulled_events(clean_data, stub, monkeypatch, after=None, **options):
+    monkeypatch.setenv('FIRESTORE_EMULATOR_HOST', stub.host)
+    source = clean_data.FirestoreSource('test-project', **options)
+    return source, list(source.iter_events(after))
+
+
+def expected_events(events, after=None):
+    """Events in the pull's (clientTimestamp, document path) order, after the watermark if given."""
+    events = sorted(events, key=lambda event: (event['clientTimestamp'], event['_path']))
+    return [event for event in events if after is None or event['clientTimestamp'] > after]
+
+
+def test_cleaning_a_pull_matches_the_dump(make_run, dump_file, dump_events, default_outputs):
+    run = make_run(dump_file)
+    with FirestoreStub(dump_events) as stub:
+        output = run.run('--firestore', 'test-project', '--firestore-page-size', '50', *ALL_OUTPUTS,
+                         env=dict(os.environ, FIRESTORE_EMULATOR_HOST=stub.host))
+    assert f"Pulled {len(dump_events)} documents" in output
+    assert run.outputs() == default_outputs
+
+
+def test_pages_follow_cursors(clean_data, dump_events, monkeypatch):
+    with FirestoreStub(dump_events) as stub:
+        source, events = pulled_events(clean_data, stub, monkeypatch, page_size=25, requests=3)
+    assert events == expected_events(dump_events)
+    assert source.pages > len(dump_events) // 25
+    assert any('startAt' in query for query in stub.queries)
+
+
+def test_failed_pages_are_retried_from_their_cursor(clean_data, dump_events, monkeypatch, no_retry_delay):
+    with FirestoreStub(dump_events) as stub:
+        # Every page after the first of each slice gets a 503 once
+        stub.fail_once(lambda query: 'startAt' in query)
+        source, events = pulled_events(clean_data, stub, monkeypatch, page_size=40, requests=2)
+    assert stub.failed > 0
+    assert source.retries == stub.failed
+    assert events == expected_events(dump_events)
+
+
+def test_cursor_breaks_clientTimestamp_ties_by_document(clean_data, dump_events, monkeypatch, no_retry_delay):
+    # More documents share each clientTimestamp than fit on a page
+    events = [dict(event, clientTimestamp=1756252800000 + number // 10) for number, event in enumerate(dump_events[:95])]
+    with FirestoreStub(events) as stub:
+        stub.fail_once(lambda query: 'startAt' in query)
+        _, pulled = pulled_events(clean_data, stub, monkeypatch, page_size=4, requests=2)
+    assert pulled == expected_events(events)
+
+
+def test_pull_resumes_after_watermark(clean_data, dump_events, monkeypatch):
+    timestamps = sorted(event['clientTimestamp'] for event in dump_events)
+    watermark = timestamps[len(timestamps) // 3]
+    with FirestoreStub(dump_events) as stub:
+        _, events = pulled_events(clean_data, stub, monkeypatch, after=watermark, page_size=50)
+    assert events == expected_events(dump_events, after=watermark)
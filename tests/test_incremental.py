@@ -0,0 +1,94 @@
+"""Incremental runs (--incremental) must leave the same outputs as a full run."""
+
+import json
+import shutil
+
+import pytest
+
+from conftest import ALL_OUTPUTS, write_events
+
+# Outputs an incremental run updates, and the options writing the optional ones
+INCREMENTAL_OUTPUTS = ('cleaned_game_data', 'game_data_summary', 'game_data_distributions',
+                       'game_data_sessions', 'game_data_tasks')
+INCREMENTAL_ARGS = ('--incremental', '--distributions', '--dimensions')
+
+
+def split_dump(dump_file: str, first_file: str):
+    """Write the older half of a dump, by clientTimestamp, to first_file."""
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    timestamps = sorted(event['clientTimestamp'] for event in events)
+    cutoff = timestamps[len(timestamps) // 2]
+    write_events((event for event in events if event['clientTimestamp'] < cutoff), first_file)
+
+
+def assert_same_outputs(run, reference, names=INCREMENTAL_OUTPUTS):
+    outputs = run.outputs()
+    for name in names:
+        assert outputs[name] == reference[name], name
+
+
+def test_refresh_matches_full_run(make_run, dump_file, default_outputs, tmp_path):
+    first_file = str(tmp_path / 'first.json')
+    split_dump(dump_file, first_file)
+    run = make_run(first_file)
+    run.run(*INCREMENTAL_ARGS)
+    shutil.copyfile(dump_file, run.path('dump_events.json'))
+    assert 'Resuming after clientTimestamp' in run.run(*INCREMENTAL_ARGS)
+    assert_same_outputs(run, default_outputs)
+
+
+def test_refresh_all_sessions_matches_full_run(make_run, dump_file, tmp_path):
+    reference = make_run(dump_file)
+    reference.run('--all-sessions')
+    first_file = str(tmp_path / 'first.json')
+    split_dump(dump_file, first_file)
+    run = make_run(first_file)
+    run.run('--all-sessions', '--incremental')
+    shutil.copyfile(dump_file, run.path('dump_events.json'))
+    run.run('--all-sessions', '--incremental')
+    assert run.outputs('_all_sessions')['cleaned_game_data'] == reference.outputs('_all_sessions')['cleaned_game_data']
+
+
+def test_outputs_without_state_are_rewritten(make_run, dump_file, default_outputs):
+    run = make_run(dump_file)
+    run.run(*ALL_OUTPUTS)
+    assert 'processing all events and rewriting the outputs' in run.run(*INCREMENTAL_ARGS)
+    assert_same_outputs(run, default_outputs)
+
+
+@pytest.mark.parametrize('field, value', [('version', 0), ('ai_help_window', 1.0)])
+def test_outputs_with_mismatched_state_are_rewritten(make_run, dump_file, default_outputs, field, value):
+    run = make_run(dump_file)
+    run.run(*INCREMENTAL_ARGS)
+    with open(run.path('clean_state.json'), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    state[field] = value
+    with open(run.path('clean_state.json'), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    assert 'does not match these options' in run.run(*INCREMENTAL_ARGS)
+    assert_same_outputs(run, default_outputs)
+
+
+def test_finished_sessions_are_closed_and_pruned(make_run, dump_file, tmp_path, clean_data):
+    first_file = str(tmp_path / 'first.json')
+    split_dump(dump_file, first_file)
+    with open(first_file, 'r', encoding='utf-8') as f:
+        first_events = json.load(f)
+    run = make_run(first_file)
+    run.run(*INCREMENTAL_ARGS)
+    shutil.copyfile(dump_file, run.path('dump_events.json'))
+    run.run(*INCREMENTAL_ARGS)
+    with open(run.path('clean_state.json'), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+
+    cutoff = state['watermark'] - clean_data.SESSION_TIMEOUT_MS
+    open_sessions = {event['sessionId'] for event in state['open_events']}
+    finished = {event['sessionId'] for event in first_events} - set(state['session_last_seen'])
+    assert finished, "the test dump should have sessions that finished before the second run"
+    assert all(last_seen >= cutoff for last_seen in state['session_last_seen'].values())
+    assert not finished & open_sessions
+    assert not finished & set(state['session_to_student_map'])
+    assert not finished & set(state['session_clock'])
+    assert not finished & {session_id for session_id, *_ in state['ai_help_index']}
+    assert open_sessions <= set(state['session_last_seen'])
@@ -0,0 +1,55 @@
+"""Partitioned and compressed input (--input DIR|GLOB, --read-workers)."""
+
+import gzip
+import json
+
+import pytest
+
+from conftest import ALL_OUTPUTS, write_events
+
+
+def write_parts(events, directory, overlap: int = 0):
+    """Split events into three time windows, each repeating the last `overlap` events of the one before."""
+    events = sorted(events, key=lambda event: event['clientTimestamp'])
+    size = len(events) // 3
+    bounds = [0, size, 2 * size, len(events)]
+    directory.mkdir()
+    for number, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        part = events[max(0, start - overlap):end]
+        if number == 0:
+            write_events(part, str(directory / 'part0.json'))
+        elif number == 1:
+            with gzip.open(directory / 'part1.jsonl.gz', 'wt', encoding='utf-8') as f:
+                f.writelines(json.dumps(event) + '\n' for event in part)
+        else:
+            with open(directory / 'part2.jsonl', 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(event) + '\n' for event in part)
+
+
+@pytest.fixture
+def parts_dir(dump_file, tmp_path):
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    directory = tmp_path / 'parts'
+    write_parts(events, directory, overlap=50)
+    # Files a glob or directory of parts may also pick up
+    (directory / 'notes.csv').write_text('not,events\n', encoding='utf-8')
+    (directory / 'part0.json.cache').write_bytes(b'GDCACHE1')
+    return directory
+
+
+@pytest.mark.parametrize('pattern', ['', '*', 'part*'])
+@pytest.mark.parametrize('read_workers', ['1', '2'])
+def test_overlapping_parts_match_dump(make_run, dump_file, default_outputs, parts_dir, pattern, read_workers):
+    run = make_run(dump_file)
+    output = run.run('--input', str(parts_dir / pattern) if pattern else str(parts_dir),
+                     '--read-workers', read_workers, *ALL_OUTPUTS)
+    assert 'Reading 3 input parts' in output
+    assert 'Skipped 100 documents repeated in overlapping parts' in output
+    assert run.outputs() == default_outputs
+
+
+def test_glob_without_input_parts(make_run, dump_file, parts_dir):
+    run = make_run(dump_file)
+    output = run.run('--input', str(parts_dir / '*.csv'))
+    assert 'not found' in output
@@ -0,0 +1,134 @@
+"""Every way of running the cleaner must write the same CSVs as a default run."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import ALL_OUTPUTS, write_events
+
+# Options that change how events are read, cleaned or sorted but not the outputs
+MODES = [
+    pytest.param(('--stream',), id='stream'),
+    pytest.param(('--workers', '2'), id='workers'),
+    pytest.param(('--stream', '--workers', '2'), id='stream-workers'),
+    pytest.param(('--spill-records', '50'), id='spill'),
+    pytest.param(('--stream', '--spill-records', '50'), id='stream-spill'),
+    pytest.param(('--columnar',), id='columnar'),
+    pytest.param(('--metrics-out', 'metrics.json'), id='metrics'),
+]
+
+# Event filters, each checked in the modes that push it down to the reader
+FILTERS = [
+    pytest.param(('--section', '02A-Checkpoint'), id='section'),
+    pytest.param(('--since', '2025-08-30', '--until', '2025-09-05'), id='time-range'),
+    pytest.param(('--since', '1756600000000', '--section', '01A-No Checkpoint'), id='since-section'),
+]
+FILTER_MODES = [
+    pytest.param(('--stream',), id='stream'),
+    pytest.param(('--cache',), id='cache'),
+    pytest.param(('--workers', '2'), id='workers'),
+]
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_mode_matches_default(make_run, dump_file, default_outputs, mode):
+    run = make_run(dump_file)
+    run.run(*mode, *ALL_OUTPUTS)
+    assert run.outputs() == default_outputs
+
+
+def test_cache_matches_default(make_run, dump_file, default_outputs):
+    run = make_run(dump_file)
+    run.run('--cache', *ALL_OUTPUTS)
+    assert run.outputs() == default_outputs
+    # The second run reads the cache built by the first
+    run.run('--cache', *ALL_OUTPUTS)
+    assert run.outputs() == default_outputs
+
+
+def test_fused_matches_default_on_ordered_dump(make_run, ordered_dump_file):
+    reference = make_run(ordered_dump_file)
+    reference.run(*ALL_OUTPUTS)
+    run = make_run(ordered_dump_file)
+    run.run('--fused', *ALL_OUTPUTS)
+    assert run.outputs() == reference.outputs()
+
+
+def test_fused_falls_back_on_unordered_dump(make_run, dump_file, default_outputs):
+    run = make_run(dump_file)
+    run.run('--fused', *ALL_OUTPUTS)
+    assert run.outputs() == default_outputs
+
+
+@pytest.mark.parametrize('mode', [(), ('--stream',), ('--workers', '2')], ids=['default', 'stream', 'workers'])
+def test_all_sessions_modes_match(make_run, dump_file, default_outputs, mode):
+    reference = make_run(dump_file)
+    reference.run('--all-sessions', *ALL_OUTPUTS)
+    run = make_run(dump_file)
+    run.run('--all-sessions', *mode, *ALL_OUTPUTS)
+    outputs = run.outputs('_all_sessions')
+    assert outputs == reference.outputs('_all_sessions')
+    # Sessions without a student ID add rows
+    assert len(outputs['cleaned_game_data']) > len(default_outputs['cleaned_game_data'])
+
+
+@pytest.mark.parametrize('mode', FILTER_MODES)
+@pytest.mark.parametrize('event_filter', FILTERS)
+def test_filtered_modes_match(make_run, dump_file, event_filter, mode):
+    reference = make_run(dump_file)
+    reference.run(*event_filter, *ALL_OUTPUTS)
+    outputs = reference.outputs()
+    cleaned = [text for name, text in outputs.items() if name.startswith('cleaned_game_data_')]
+    assert len(cleaned) == 1 and cleaned[0].count('\n') > 1, "the filter should keep some records"
+    run = make_run(dump_file)
+    run.run(*event_filter, *mode, *ALL_OUTPUTS)
+    assert run.outputs() == outputs
+
+
+def test_student_filter_keeps_only_that_student(make_run, dump_file):
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        student = next(event['studentId'] for event in json.load(f)
+                       if (event.get('studentId') or '').startswith('30'))
+    reference = make_run(dump_file)
+    reference.run('--student', student)
+    suffix = f"_student-{student}"
+    cleaned = reference.outputs(suffix)['cleaned_game_data']
+    rows = list(csv.DictReader(io.StringIO(cleaned)))
+    assert rows and {row['student_id'] for row in rows} == {student}
+    run = make_run(dump_file)
+    run.run('--student', student, '--cache')
+    assert run.outputs(suffix)['cleaned_game_data'] == cleaned
+
+
+def test_columnar_table_matches_csv(make_run, dump_file, default_outputs, clean_data):
+    run = make_run(dump_file)
+    run.run('--columnar')
+    rows = list(csv.DictReader(io.StringIO(default_outputs['cleaned_game_data'])))
+    with clean_data.ColumnarTable(run.path('cleaned_game_data.cols')) as table:
+        assert table.rows == len(rows)
+        for name in ('session_id', 'task_id', 'semester'):
+            column = ['' if value is None else str(value) for value in table.column(name)]
+            assert sorted(column) == sorted(row[name] for row in rows), name
+
+
+def test_duplicate_events_are_dropped(make_run, dump_file, default_outputs, clean_data, tmp_path):
+    with open(dump_file, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    # Client retries write the same event again under a new document ID
+    copies = [dict(event, _id=event['_id'] + 'retry', _path=event['_path'] + 'retry')
+              for event in events[::7] if event['type'] in clean_data.DEDUP_EVENT_TYPES]
+    assert copies
+    duplicated_file = str(tmp_path / 'duplicated.json')
+    write_events(events + copies, duplicated_file)
+
+    for mode in [(), ('--stream',), ('--workers', '2')]:
+        run = make_run(duplicated_file)
+        output = run.run(*mode, *ALL_OUTPUTS)
+        assert f"Dropped {len(copies)} duplicate task and AI help events" in output, mode
+        assert run.outputs() == default_outputs, mode
+
+    run = make_run(duplicated_file)
+    run.run('--keep-duplicates')
+    assert run.read('cleaned_game_data.csv') != default_outputs['cleaned_game_data']
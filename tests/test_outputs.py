@@ -0,0 +1,26 @@
+"""Which output files a run writes."""
+
+import os
+
+OPTIONAL_OUTPUTS = {
+    '--distributions': ['game_data_distributions'],
+    '--dimensions': ['game_data_sessions', 'game_data_tasks'],
+    '--episodes': ['game_data_episodes'],
+}
+
+
+def test_default_run_writes_cleaned_data_and_summary(make_run, dump_file):
+    run = make_run(dump_file)
+    run.run()
+    assert sorted(run.outputs()) == ['cleaned_game_data', 'game_data_summary']
+
+
+def test_optional_outputs(make_run, dump_file, default_outputs):
+    for option, names in OPTIONAL_OUTPUTS.items():
+        run = make_run(dump_file)
+        output = run.run(option)
+        outputs = run.outputs()
+        assert sorted(outputs) == sorted(['cleaned_game_data', 'game_data_summary'] + names)
+        for name in names:
+            assert outputs[name] == default_outputs[name]
+            assert f"data{os.sep}{name}.csv" in output or f"data/{name}.csv" in output
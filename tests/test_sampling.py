@@ -0,0 +1,45 @@
+"""Session sampling (--sample-sessions) picks the same sessions in every mode."""
+
+import pytest
+
+from conftest import ALL_OUTPUTS, CleanerRun
+
+SAMPLE_ARGS = ('--sample-sessions', '10', '--seed', '3') + ALL_OUTPUTS
+SAMPLE_SUFFIX = '_sessions10_seed3'
+
+
+@pytest.fixture(scope='module')
+def sample_outputs(tmp_path_factory, dump_file):
+    run = CleanerRun(str(tmp_path_factory.mktemp('sample')), dump_file)
+    run.run(*SAMPLE_ARGS)
+    return run.outputs(SAMPLE_SUFFIX)
+
+
+@pytest.mark.parametrize('mode', [(), ('--stream',), ('--cache',), ('--workers', '2')])
+def test_sample_matches_default_mode(make_run, dump_file, sample_outputs, mode):
+    run = make_run(dump_file)
+    run.run(*mode, *SAMPLE_ARGS)
+    assert run.outputs(SAMPLE_SUFFIX) == sample_outputs
+
+
+def test_fused_sample_of_unordered_dump_falls_back(make_run, dump_file, sample_outputs):
+    run = make_run(dump_file)
+    output = run.run('--fused', *SAMPLE_ARGS)
+    assert 'falling back to the multi-pass pipeline' in output
+    assert run.outputs(SAMPLE_SUFFIX) == sample_outputs
+
+
+def test_fused_sample_of_ordered_dump(make_run, ordered_dump_file):
+    reference = make_run(ordered_dump_file)
+    reference.run(*SAMPLE_ARGS)
+    run = make_run(ordered_dump_file)
+    output = run.run('--fused', *SAMPLE_ARGS)
+    assert 'falling back' not in output
+    assert run.outputs(SAMPLE_SUFFIX) == reference.outputs(SAMPLE_SUFFIX)
+
+
+def test_sample_keeps_whole_sessions(make_run, dump_file):
+    run = make_run(dump_file)
+    run.run(*SAMPLE_ARGS)
+    sessions = run.read(f'game_data_sessions{SAMPLE_SUFFIX}.csv').splitlines()[1:]
+    assert 0 < len(sessions) <= 10
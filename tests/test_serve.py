@@ -0,0 +1,50 @@
+"""The local query service (--serve): who may read it and where it binds."""
+
+import json
+import os
+import re
+import subprocess
+import sys
+from urllib.request import urlopen
+
+import pytest
+
+from conftest import CLEANER_PATH
+
+
+def serve(run, *args):
+    """Start clean-data.py --serve on an ephemeral port; returns (process, base URL)."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    process = subprocess.Popen([sys.executable, CLEANER_PATH, '--serve', '0', *args], cwd=run.directory,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    for line in process.stdout:
+        match = re.search(r'on (http://\S+/)', line)
+        if match:
+            return process, match.group(1)
+    process.wait()
+    pytest.fail("the query service did not start")
+
+
+@pytest.mark.parametrize('args, origin', [
+    pytest.param((), None, id='default'),
+    pytest.param(('--serve-origin', 'http://localhost:5173'), 'http://localhost:5173', id='serve-origin'),
+])
+def test_cross_origin_reads_only_on_request(make_run, dump_file, args, origin):
+    run = make_run(dump_file)
+    process, url = serve(run, *args)
+    try:
+        with urlopen(url, timeout=10) as response:
+            assert response.headers.get('Access-Control-Allow-Origin') == origin
+            assert json.loads(response.read())['records'] > 0
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def test_unix_socket_path_must_not_be_a_file(make_run, dump_file):
+    run = make_run(dump_file)
+    data_file = run.path('dump_events.json')
+    output = run.run('--serve', 'unix:' + data_file)
+    assert 'exists and is not a socket' in output
+    assert os.path.getsize(data_file) > 0
+    assert run.outputs() == {}
@@ -0,0 +1,42 @@
+"""Per-student summaries, plain and grouped by extra fields (--summary-by)."""
+
+import csv
+import io
+from collections import Counter
+
+
+def read_csv(text: str):
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def test_grouped_summary_adds_up_to_summary(make_run, dump_file):
+    run = make_run(dump_file)
+    run.run('--summary-by', 'semester,task_level')
+    summary = read_csv(run.read('game_data_summary.csv'))
+    grouped = read_csv(run.read('game_data_summary_by_semester_task_level.csv'))
+
+    assert list(grouped[0])[:4] == ['student_id', 'condition', 'semester', 'task_level']
+    assert len({(row['student_id'], row['semester'], row['task_level']) for row in grouped}) == len(grouped)
+    tasks = Counter()
+    ai_help = Counter()
+    for row in grouped:
+        tasks[row['student_id'], row['condition']] += int(row['total_tasks_attempted'])
+        ai_help[row['student_id'], row['condition']] += int(row['ai_help_count'])
+    for row in summary:
+        key = (row['student_id'], row['condition'])
+        assert tasks[key] == int(row['total_tasks_attempted'])
+        assert ai_help[key] == int(row['ai_help_count'])
+
+
+def test_unknown_summary_by_field(make_run, dump_file):
+    run = make_run(dump_file)
+    assert 'Unknown --summary-by fields: no_such_field' in run.run('--summary-by', 'semester,no_such_field')
+    # Checked before cleaning, so nothing is written
+    assert run.outputs() == {}
+
+
+def test_summary_by_rejects_incremental(make_run, dump_file):
+    run = make_run(dump_file)
+    output = run.run('--incremental', '--summary-by', 'semester')
+    assert '--summary-by cannot be combined with --incremental' in output
+    assert run.outputs() == {}